@@ -0,0 +1,260 @@
+"""
+レスのローカルアーカイブ（SQLite + FTS5 全文検索）
+
+取得したレスを (板, スレッドID, レス番号) をキーに state/archive.sqlite3 に保存します。
+差分取得はここに保存済みのレスを読み、前回以降の新着だけをネットワークから取得します。
+スレッドをまたいで（partNNNN の全スレッド）キーワード検索できます。
+
+ - WAL モード: 書き込み中でも他のプロセス（検索など）から読める
+ - 書き込みは1スレッド分を1トランザクションでまとめて行う（内容が変わらないレスは書き換えない）
+ - 本文の全文検索は FTS5 の trigram トークナイザ（日本語でも部分一致で引ける。3文字以上）。
+   2文字以下のキーワードや、FTS5 / trigram が使えない SQLite では LIKE で検索する
+
+使い方:
+  python archive.py search キーワード [--board netgame/16797] [--limit 20]
+  python archive.py stats
+"""
+import argparse
+import itertools
+import os
+import sqlite3
+import sys
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional
+
+from shitaraba_parser import Post
+
+
+ARCHIVE_PATH = os.getenv('ARCHIVE_PATH', os.path.join('state', 'archive.sqlite3'))
+FTS_MIN_QUERY_CHARS = 3  # trigram で引けるキーワードの最小文字数
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    board TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    title TEXT,
+    last_number INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT,
+    PRIMARY KEY (board, thread_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS posts (
+    id INTEGER PRIMARY KEY,
+    board TEXT NOT NULL,
+    thread_id TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    name TEXT NOT NULL DEFAULT '',
+    timestamp TEXT NOT NULL DEFAULT '',
+    poster_id TEXT NOT NULL DEFAULT '',
+    body TEXT NOT NULL,
+    UNIQUE (board, thread_id, number)
+);
+"""
+# 本文は posts に1回だけ持ち、FTS は索引だけ（external content）。
+# 追加したレスは upsert_posts がトランザクションの最後にまとめて索引に入れる
+# （1行ずつトリガで入れるより約2倍速い）。書き換え・削除はトリガで同期する
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(
+    body, content='posts', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS posts_ad AFTER DELETE ON posts BEGIN
+    INSERT INTO posts_fts(posts_fts, rowid, body) VALUES ('delete', old.id, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS posts_au AFTER UPDATE OF body ON posts BEGIN
+    INSERT INTO posts_fts(posts_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    INSERT INTO posts_fts(rowid, body) VALUES (new.id, new.body);
+END;
+"""
+_UPSERT = """
+INSERT INTO posts (board, thread_id, number, name, timestamp, poster_id, body)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (board, thread_id, number) DO UPDATE SET
+    name = excluded.name, timestamp = excluded.timestamp,
+    poster_id = excluded.poster_id, body = excluded.body
+WHERE posts.body IS NOT excluded.body OR posts.name IS NOT excluded.name
+   OR posts.timestamp IS NOT excluded.timestamp OR posts.poster_id IS NOT excluded.poster_id
+"""
+
+
+@dataclass
+class SearchHit:
+    """検索結果の1件"""
+    board: str
+    thread_id: str
+    title: str
+    number: int
+    body: str
+
+
+class PostArchive:
+    """
+    レスのアーカイブ（スレッドセーフ。1つの接続をロックで共有する）
+
+    - load_posts(board, thread_id) / iter_posts(board, thread_id): 保存済みのレスをレス番号順に返す
+    - last_number(board, thread_id): 取得済みの最終レス番号（本文が空のレスも含む）
+    - upsert_posts(board, thread_id, posts, last_number, title): レスをまとめて保存する
+    - search(query, board, thread_id, limit): 本文のキーワード検索（新しいスレッド・レス順）
+    """
+
+    def __init__(self, path: str = ARCHIVE_PATH):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(_SCHEMA)
+        try:
+            self._conn.executescript(_FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            # FTS5 / trigram のない SQLite（3.34 未満など）は LIKE で検索する
+            print(f"警告: 全文検索の索引を作れません（LIKE で検索します）: {e}")
+            self.fts = False
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def load_posts(self, board: str, thread_id: str) -> List[Post]:
+        return list(self.iter_posts(board, thread_id))
+
+    def iter_posts(self, board: str, thread_id: str) -> Iterator[Post]:
+        """保存済みのレスをレス番号順に1件ずつ返す（読み終えるまでアーカイブのロックを持つ）"""
+        with self._lock:
+            cursor = self._conn.execute(
+                'SELECT number, body, name, timestamp, poster_id FROM posts '
+                'WHERE board = ? AND thread_id = ? ORDER BY number', (board, thread_id))
+            for n, body, name, ts, pid in cursor:
+                yield Post(number=n, body=body, name=name, timestamp=ts, poster_id=pid)
+
+    def last_number(self, board: str, thread_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute('SELECT last_number FROM threads WHERE board = ? AND thread_id = ?',
+                                     (board, thread_id)).fetchone()
+        return row[0] if row else 0
+
+    def upsert_posts(self, board: str, thread_id: str, posts: Iterable[Post],
+                     last_number: Optional[int] = None, title: Optional[str] = None) -> int:
+        """
+        レスを1トランザクションでまとめて保存する（同じレス番号は内容が変わった場合だけ書き換える）
+
+        last_number を指定した場合はスレッドの取得済み最終レス番号も更新する（小さくはしない）。
+        戻り値: 保存したレスの件数
+        """
+        # 全件のリストを作らずに流し込む（件数は zip が進めた counter から分かる）
+        counter = itertools.count()
+        rows = ((board, thread_id, p.number, p.name or '', p.timestamp or '', p.poster_id or '', p.body)
+                for p, _ in zip(posts, counter))
+        now = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # 追加されるレスの id はこれより大きい（INTEGER PRIMARY KEY は最大値 + 1 で振られる）
+                max_id, = self._conn.execute('SELECT COALESCE(MAX(id), 0) FROM posts').fetchone()
+                self._conn.executemany(_UPSERT, rows)
+                if self.fts:
+                    self._conn.execute('INSERT INTO posts_fts(rowid, body) SELECT id, body FROM posts WHERE id > ?',
+                                       (max_id,))
+                self._conn.execute(
+                    'INSERT INTO threads (board, thread_id, title, last_number, updated_at) VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (board, thread_id) DO UPDATE SET '
+                    'title = COALESCE(excluded.title, threads.title), '
+                    'last_number = MAX(threads.last_number, excluded.last_number), '
+                    'updated_at = excluded.updated_at',
+                    (board, thread_id, title, last_number or 0, now))
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return next(counter)
+
+    def search(self, query: str, board: Optional[str] = None, thread_id: Optional[str] = None,
+               limit: int = 50) -> List[SearchHit]:
+        """本文に query を含むレス（新しいスレッド・レス番号の大きい順）"""
+        query = query.strip()
+        if not query:
+            return []
+        where, params = [], []
+        if self.fts and len(query) >= FTS_MIN_QUERY_CHARS:
+            where.append('p.id IN (SELECT rowid FROM posts_fts WHERE posts_fts MATCH ?)')
+            # 記号を含んでも構文として解釈されないよう、フレーズとして渡す
+            params.append('"' + query.replace('"', '""') + '"')
+        else:
+            where.append("p.body LIKE ? ESCAPE '\\'")
+            params.append('%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if board:
+            where.append('p.board = ?')
+            params.append(board)
+        if thread_id:
+            where.append('p.thread_id = ?')
+            params.append(thread_id)
+        sql = ('SELECT p.board, p.thread_id, COALESCE(t.title, \'\'), p.number, p.body FROM posts p '
+               'LEFT JOIN threads t ON t.board = p.board AND t.thread_id = p.thread_id '
+               f"WHERE {' AND '.join(where)} ORDER BY p.thread_id DESC, p.number DESC LIMIT ?")
+        with self._lock:
+            rows = self._conn.execute(sql, (*params, limit)).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            threads, = self._conn.execute('SELECT COUNT(*) FROM threads').fetchone()
+            posts, = self._conn.execute('SELECT COUNT(*) FROM posts').fetchone()
+        size = sum(os.path.getsize(self.path + suffix) for suffix in ('', '-wal')
+                   if os.path.exists(self.path + suffix))
+        return {'threads': threads, 'posts': posts, 'bytes': size}
+
+
+_archive: Optional[PostArchive] = None
+_archive_lock = threading.Lock()
+
+
+def get_archive() -> PostArchive:
+    """プロセスで共有するアーカイブ（ARCHIVE_PATH）"""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = PostArchive(ARCHIVE_PATH)
+        return _archive
+
+
+def close_archive() -> None:
+    """共有アーカイブを閉じる（次の get_archive() で開き直す）"""
+    global _archive
+    with _archive_lock:
+        if _archive is not None:
+            _archive.close()
+            _archive = None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p = sub.add_parser('search', help='本文のキーワード検索')
+    p.add_argument('query')
+    p.add_argument('--board', help='板（例: netgame/16797）')
+    p.add_argument('--thread', help='スレッドID')
+    p.add_argument('--limit', type=int, default=20)
+    sub.add_parser('stats', help='保存済みのスレッド数・レス数')
+    args = parser.parse_args()
+
+    if not os.path.exists(ARCHIVE_PATH):
+        print(f"✗ アーカイブがありません: {ARCHIVE_PATH}")
+        return 1
+    archive = get_archive()
+    if args.command == 'stats':
+        stats = archive.stats()
+        print(f"{stats['threads']} スレッド / {stats['posts']} レス / {stats['bytes'] / (1024 * 1024):.1f} MB")
+        return 0
+
+    hits = archive.search(args.query, args.board, args.thread, args.limit)
+    for hit in hits:
+        print(f"[{hit.title or hit.thread_id}] >>{hit.number}: {hit.body}")
+    print(f"\n{len(hits)} 件")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
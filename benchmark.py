@@ -0,0 +1,832 @@
+#!/usr/bin/env python3
+"""
+処理時間・メモリ使用量のマイクロベンチマーク
+
+使い方:
+  python benchmark.py parse [--html 保存したスレッドHTML] [--repeat 3]
+  python benchmark.py chunk [--size-mb 1] [--chunk-size 500]
+  python benchmark.py tts [--backends stub,local,gtts] [--posts 200]
+  python benchmark.py subject [--threads 1000]
+  python benchmark.py clean [--html 保存したスレッドHTML] [--repeat 5]
+  python benchmark.py replay [--baseline benchmark_baseline.json] [--save-baseline] [--machine-metrics]
+  python benchmark.py filter [--posts 5000]
+  python benchmark.py archive [--posts 1000000] [--threads 1000]
+  python benchmark.py mp3post [--mp3 test_output.mp3] [--segments 2000]
+  python benchmark.py memory [--posts 1000,10000,100000]
+  python benchmark.py importtime [--scripts main.py,watcher.py] [--repeat 5]
+
+--html を省略した場合は outputs/*.txt のレス本文から
+したらば形式のスレッドHTML（EUC-JP）を合成して使用します。
+
+replay はしたらば・gTTS・Discord の代わりにローカルのリプレイサーバー（replay_server.py）を使い、
+パイプラインの段ごとの実行時間・CPU 時間・ピークメモリ・通信量・リクエスト数を測ります。
+--baseline の記録より通信量・リクエスト数が悪化していたら終了コード 1 を返します（CI の回帰チェック用）。
+実時間・CPU 時間・ピークメモリは --machine-metrics を付けた場合だけ比べます。
+"""
+import argparse
+import contextlib
+import glob
+import html
+import io
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import time
+import tempfile
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+
+BASELINE_FILE = 'benchmark_baseline.json'
+# 回帰とみなす悪化の割合（0.5 = 基準値の 1.5 倍を超えたら失敗）。
+# 通信量とリクエスト数はマシン・Python のバージョンによらないので常に比べる
+REGRESSION_TOLERANCE = {
+    'bytes_up': 0.05,
+    'bytes_down': 0.05,
+    'requests': 0.0,
+}
+# 実時間・CPU 時間・ピークメモリはマシンと Python のバージョンで変わるので、
+# 基準値と同じ環境で測る場合だけ比べる（--machine-metrics / --time-tolerance）
+MACHINE_TOLERANCE = {
+    'wall_ms': 1.0,
+    'cpu_ms': 1.0,
+    'peak_mb': 0.25,
+}
+MIN_TIME_DELTA_MS = 20  # これ未満の時間の差は誤差として無視する
+
+
+def _load_bodies() -> List[str]:
+    """outputs/*.txt からレス本文（空行区切り）を読み込む"""
+    bodies: List[str] = []
+    for path in sorted(glob.glob('outputs/*.txt')):
+        with open(path, encoding='utf-8') as fp:
+            bodies.extend(p.strip() for p in fp.read().split('\n\n') if p.strip())
+    return bodies or ['テスト本文です']
+
+
+def _synthesize_thread_text(size_bytes: int) -> str:
+    """outputs/*.txt のレス本文を繰り返して、'\n\n' 区切りで size_bytes 程度のスレッド本文を作る"""
+    bodies = _load_bodies()
+    parts: List[str] = []
+    total = 0
+    while total < size_bytes:
+        body = bodies[len(parts) % len(bodies)]
+        parts.append(body)
+        total += len(body.encode('utf-8')) + 2
+    return '\n\n'.join(parts)
+
+
+def _synthesize_thread_html(min_posts: int = 5000) -> bytes:
+    """outputs/*.txt のレス本文から <dl><dt><dd> 形式のスレッドHTMLを合成する"""
+    bodies = _load_bodies()
+    parts = ['<html><head><meta charset="EUC-JP"></head><body><dl class="thread">']
+    for i in range(min_posts):
+        body = html.escape(bodies[i % len(bodies)]).replace(' ', '<br>')
+        parts.append(
+            f'<dt id="comment_{i + 1}"><a href="/bbs/read.cgi/netgame/16797/1/{i + 1}">{i + 1}</a> ：'
+            f'<font color="#008800"><b>名無しさん</b></font>：2026/02/13(金) 04:23:40 ID:abcd{i % 97:03d}</dt>\n'
+            f'<dd> {body} <br><br></dd>\n'
+        )
+    parts.append('</dl></body></html>')
+    return ''.join(parts).encode('euc_jp', errors='replace')
+
+
+def _iter_chunks(data: bytes, size: int = 64 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _measure(label: str, func: Callable[[], object], repeat: int):
+    """関数を repeat 回実行し、最速の実行時間とピークメモリを表示する"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<12} {best * 1000:9.1f} ms  peak {peak / (1024 * 1024):7.2f} MB")
+    return result
+
+
+def bench_parse(args) -> int:
+    from shitaraba_parser import iter_posts, lxml_available
+
+    if args.html:
+        with open(args.html, 'rb') as fp:
+            data = fp.read()
+    else:
+        data = _synthesize_thread_html()
+    print(f"入力: {len(data) / 1024:.0f} KB")
+
+    def run(backend):
+        return lambda: [re.sub(r'\s+', ' ', p.body).strip()
+                        for p in iter_posts(_iter_chunks(data), backend=backend)]
+
+    backends = ['stream', 'bs4'] + (['lxml'] if lxml_available() else [])
+    results = {}
+    for backend in backends:
+        try:
+            results[backend] = _measure(backend, run(backend), args.repeat)
+        except ImportError as e:
+            print(f"  {backend:<12} スキップ ({e})")
+
+    reference = results.get('bs4')
+    for backend, posts in results.items():
+        if reference is not None and posts != reference:
+            print(f"✗ {backend} の結果が bs4 と一致しません ({len(posts)} / {len(reference)} 件)")
+            return 1
+    print(f"✓ {len(results['stream'])} 件のレスを解析")
+    return 0
+
+
+def _legacy_split_text_into_chunks(text: str, chunk_size: int) -> List[str]:
+    """比較用: 文字列の += で連結し、句点でしか区切らない従来の実装"""
+    if len(text) <= chunk_size:
+        return [text]
+    chunks = []
+    current_chunk = ""
+    for sentence in text.split("。"):
+        if not sentence.strip():
+            continue
+        sentence_with_period = sentence + "。"
+        if len(current_chunk) + len(sentence_with_period) > chunk_size and current_chunk:
+            chunks.append(current_chunk)
+            current_chunk = sentence_with_period
+        else:
+            current_chunk += sentence_with_period
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+
+def _check_chunk_properties(text: str, chunks: List[str], chunk_size: int) -> Optional[str]:
+    """チャンク分割の性質を確認する（問題があれば内容を返す）"""
+    if any(len(c) > chunk_size for c in chunks):
+        return f"chunk_size({chunk_size}) を超えるチャンクがあります"
+    if any(not c or c.isspace() for c in chunks):
+        return "空白だけのチャンクがあります"
+    if re.sub(r'\s', '', ''.join(chunks)) != re.sub(r'\s', '', text):
+        return "連結しても元のテキストに戻りません"
+    return None
+
+
+def bench_chunk(args) -> int:
+    from mp3_converter import _split_text_into_chunks
+
+    # 性質の確認: ランダムなテキストで何度も試す
+    rng = random.Random(0)
+    alphabet = 'あいうえおカキクケコ漢字wW 、。！？!?\n'
+    for trial in range(500):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 400)))
+        if rng.random() < 0.3:
+            text = '\n\n'.join([text, 'え？', text[:50]])
+        chunk_size = rng.randint(1, 80)
+        error = _check_chunk_properties(text, _split_text_into_chunks(text, chunk_size), chunk_size)
+        if error:
+            print(f"✗ 性質チェック失敗 (試行 {trial}, chunk_size={chunk_size}): {error}")
+            print(f"  入力: {text!r}")
+            return 1
+    print("✓ 性質チェック 500 件 OK")
+
+    text = _synthesize_thread_text(int(args.size_mb * 1024 * 1024))
+    print(f"入力: {len(text.encode('utf-8')) / 1024:.0f} KB ({len(text)} 文字, 句点 {text.count('。')} 個)")
+    chunks = _measure('linear', lambda: _split_text_into_chunks(text, args.chunk_size), args.repeat)
+    legacy = _measure('legacy', lambda: _legacy_split_text_into_chunks(text, args.chunk_size), args.repeat)
+    print(f"  チャンク数: linear {len(chunks)} (最大 {max(map(len, chunks))} 文字) / "
+          f"legacy {len(legacy)} (最大 {max(map(len, legacy))} 文字)")
+    error = _check_chunk_properties(text, chunks, args.chunk_size)
+    if error:
+        print(f"✗ {error}")
+        return 1
+
+    # 区切りのない長い1文（強制的に切る処理が線形時間か）
+    text = 'あ' * (2 * 1024 * 1024)
+    print(f"入力: 区切りなし {len(text)} 文字")
+    chunks = _measure('linear', lambda: _split_text_into_chunks(text, args.chunk_size), args.repeat)
+    error = _check_chunk_properties(text, chunks, args.chunk_size)
+    if error:
+        print(f"✗ {error}")
+        return 1
+    return 0
+
+
+def bench_tts(args) -> int:
+    import mp3_converter
+    from mp3_frames import duration_seconds
+
+    bodies = _load_bodies()
+    posts = [bodies[i % len(bodies)] for i in range(args.posts)]
+    print(f"入力: {len(posts)} レス ({sum(map(len, posts))} 文字)")
+
+    failed = False
+    for name in args.backends.split(','):
+        backend = mp3_converter.get_tts_backend(name)
+        if not backend.available():
+            print(f"  {name:<8} スキップ")
+            continue
+        with tempfile.TemporaryDirectory() as tmp:
+            # キャッシュを空にして毎回合成させる
+            mp3_converter.TTS_CACHE_DIR = os.path.join(tmp, 'cache')
+            mp3_converter._audio_cache = None
+            parts: List[str] = []
+            started = time.perf_counter()
+            success, size = mp3_converter.posts_to_mp3(
+                posts, os.path.join(tmp, 'bench.mp3'), workers=args.workers,
+                on_part=lambda path, index: parts.append(path), backend=backend)
+            elapsed = time.perf_counter() - started
+            if not success:
+                print(f"✗ {name} の変換に失敗しました")
+                failed = True
+                continue
+            duration = 0.0
+            for path in parts:
+                with open(path, 'rb') as fp:
+                    duration += duration_seconds(fp.read())
+        print(f"  {name:<8} {elapsed:8.2f} 秒  {size / 1024:8.0f} KB  音声 {duration:7.1f} 秒  "
+              f"({len(posts) / elapsed:.1f} レス/秒)")
+    return 1 if failed else 0
+
+
+def bench_subject(args) -> int:
+    from shitaraba_extractor import BOARD, _SUBJECT_TITLE_RE, parse_subject_txt
+    from shitaraba_parser import iter_links
+
+    titles = [(1700000000 + i, f"VALORANT part{1000 + i}({(i * 37) % 1000 + 1})") for i in range(args.threads)]
+    text = ''.join(f"{tid}.cgi,{title}\n" for tid, title in titles)
+    page = ('<html><body><div>' + ''.join(
+        f'<a href="/bbs/read.cgi/{BOARD}/{tid}/l50">{i + 1}: </a><a href="/bbs/read.cgi/{BOARD}/{tid}/l50">{title}</a><br>'
+        for i, (tid, title) in enumerate(titles)) + '</div></body></html>').encode('euc_jp')
+    print(f"入力: {args.threads} スレッド (subject.txt {len(text.encode('euc_jp')) / 1024:.0f} KB / "
+          f"subject.cgi {len(page) / 1024:.0f} KB)")
+
+    def parse_html():
+        return [m for _, label in iter_links(_iter_chunks(page))
+                if (m := _SUBJECT_TITLE_RE.match((label or '').strip()))]
+
+    from_txt = _measure('subject.txt', lambda: parse_subject_txt(text, BOARD), args.repeat)
+    from_html = _measure('subject.cgi', parse_html, args.repeat)
+    if len(from_txt) != len(from_html):
+        print(f"✗ スレッド数が一致しません ({len(from_txt)} / {len(from_html)})")
+        return 1
+    return 0
+
+
+def _legacy_clean_text(text: str) -> str:
+    """従来の clean_text（規則ごとに re.sub を3回）"""
+    if text is None:
+        return ''
+    text = re.sub(r'>>\d+(-\d+)?', '', text)
+    text = re.sub(r'https?://[^\s]+', '', text)
+    text = re.sub(r'\s+', ' ', text)
+    return text.strip()
+
+
+def bench_clean(args) -> int:
+    from shitaraba_extractor import clean_texts
+    from shitaraba_parser import iter_posts
+
+    # 性質の確認: アンカー・URL・空白の断片をランダムにつないだテキストで従来実装と比べる
+    rng = random.Random(0)
+    pieces = ['>>', '>>1', '>>23', '-', '-4', '>', '1', 'h', 'ttp', 'http', 's', '://', ':', '/',
+              'http://x', 'https://y.jp/', 'a', 'あ', '漢', ' ', '  ', '\u3000', '\xa0', '\t', '\n']
+    for trial in range(20000):
+        text = ''.join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+        old, new = _legacy_clean_text(text), next(clean_texts([text]))
+        if old != new:
+            print(f"✗ 従来の clean_text と一致しません (試行 {trial}): {text!r} → {old!r} / {new!r}")
+            return 1
+    print("✓ ランダムな入力 20000 件で従来の clean_text と一致")
+
+    if args.html:
+        with open(args.html, 'rb') as fp:
+            data = fp.read()
+    else:
+        data = _synthesize_thread_html()
+    # 本文にアンカー・URL・笑い・繰り返しを混ぜて、全ての規則を通るようにする
+    extras = ['>>{n} ', '>>{n}-{m}\n', ' https://example.com/{n} ', 'ｗｗｗ', 'kwsk ', 'ーーーーー', '\u3000\t']
+    bodies = [extras[p.number % len(extras)].format(n=p.number, m=p.number + 3) + p.body
+              for p in iter_posts(_iter_chunks(data))]
+    print(f"入力: {len(bodies)} レス ({sum(len(b) for b in bodies)} 文字)")
+
+    results = {}
+    for label, func in (('legacy', lambda: [_legacy_clean_text(b) for b in bodies]),
+                        ('clean_texts', lambda: list(clean_texts(bodies))),
+                        ('tts=True', lambda: list(clean_texts(bodies, tts=True)))):
+        best = float('inf')
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            results[label] = func()
+            best = min(best, time.perf_counter() - started)
+        print(f"  {label:<12} {best * 1000:9.1f} ms  {len(bodies) / best:9.0f} レス/秒")
+
+    legacy, base = results['legacy'], results['clean_texts']
+    mismatched = [i for i, (old, new) in enumerate(zip(legacy, base)) if old != new]
+    if mismatched:
+        i = mismatched[0]
+        print(f"✗ {len(mismatched)} 件が従来の clean_text と一致しません（例: {legacy[i]!r} / {base[i]!r}）")
+        return 1
+    print("✓ 従来の clean_text と同じ結果")
+    return 0
+
+
+def _run_stage(func: Callable[[], object], repeat: int, server, reset: Callable[[], None], verbose: bool):
+    """
+    段を repeat 回実行して最速の実行時間・CPU 時間と通信量を測り、最後に tracemalloc つきで1回実行する
+    （CPU 時間はプロセス全体のもので、同じプロセスで動くリプレイサーバーの分も含む）
+
+    戻り値: (最後の結果, 指標の dict)
+    """
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    wall = cpu = float('inf')
+    result = None
+    with output:
+        for _ in range(repeat):
+            reset()
+            server.reset_counters()
+            started, started_cpu = time.perf_counter(), time.process_time()
+            result = func()
+            wall = min(wall, time.perf_counter() - started)
+            cpu = min(cpu, time.process_time() - started_cpu)
+        bytes_up, bytes_down, requests = server.bytes_received, server.bytes_sent, server.requests
+        reset()
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, {
+        'wall_ms': round(wall * 1000, 1),
+        'cpu_ms': round(cpu * 1000, 1),
+        'peak_mb': round(peak / (1024 * 1024), 2),
+        'bytes_up': bytes_up,
+        'bytes_down': bytes_down,
+        'requests': requests,
+    }
+
+
+def _check_regressions(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                       time_tolerance: Optional[float], machine_metrics: bool = False) -> List[str]:
+    """
+    基準値より悪化した指標の説明のリスト
+
+    machine_metrics=False の場合は通信量・リクエスト数だけを比べる
+    """
+    tolerances = dict(REGRESSION_TOLERANCE, **(MACHINE_TOLERANCE if machine_metrics else {}))
+    regressions = []
+    for stage, metrics in results.items():
+        for name, value in metrics.items():
+            base = baseline.get(stage, {}).get(name)
+            if base is None or name not in tolerances:
+                continue
+            tolerance = tolerances[name]
+            if name.endswith('_ms'):
+                if time_tolerance is not None:
+                    tolerance = time_tolerance
+                if value - base < MIN_TIME_DELTA_MS:
+                    continue
+            if value > base * (1 + tolerance):
+                regressions.append(f"{stage}.{name}: {value} (基準 {base}, 許容 +{tolerance:.0%})")
+    return regressions
+
+
+def bench_replay(args) -> int:
+    import archive
+    import mp3_converter
+    import shitaraba_extractor
+    from discord_sender import send_discord_file
+    from discord_uploader import PartStreamUploader
+    from replay_server import ReplayBackend, ReplayServer, build_fixtures, replay_environment
+
+    fixtures = build_fixtures(args.posts)
+    print(f"入力: {fixtures.title} {len(fixtures.bodies)} レス "
+          f"(rawmode {sum(map(len, fixtures.rawmode_lines)) / 1024:.0f} KB, "
+          f"録音済み音声 {len(fixtures.audio_frames)} フレーム)")
+    backend = ReplayBackend(fixtures.audio_frames)
+
+    def reset():
+        # 状態・キャッシュを消して、毎回最初の実行と同じ条件にする
+        archive.close_archive()
+        shutil.rmtree(shitaraba_extractor.STATE_DIR, ignore_errors=True)
+        shutil.rmtree(mp3_converter.TTS_CACHE_DIR, ignore_errors=True)
+        shitaraba_extractor._subject_cache.clear()
+        mp3_converter._audio_cache = None
+
+    results: Dict[str, Dict[str, float]] = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, ReplayServer(fixtures) as server, replay_environment(server):
+        os.chdir(workdir)
+        try:
+            def run(stage, func):
+                result, results[stage] = _run_stage(func, args.repeat, server, reset, args.verbose)
+                return result
+
+            thread_url = fixtures.thread_url
+            threads = run('fetch_thread_list', lambda: shitaraba_extractor.fetch_thread_list(fixtures.board))
+            bodies = run('extract_post_bodies', lambda: shitaraba_extractor.extract_post_bodies(
+                thread_url, expected_posts=len(fixtures.bodies)))
+            text = '\n\n'.join(bodies)
+            chunks = run('_split_text_into_chunks',
+                         lambda: mp3_converter._split_text_into_chunks(text, mp3_converter.SEGMENT_SIZE))
+
+            parts: List[str] = []
+
+            def synthesize():
+                parts.clear()
+                return mp3_converter.text_to_mp3(text, os.path.join('outputs', 'replay.mp3'), backend=backend,
+                                                 on_part=lambda path, index: parts.append(path))
+
+            os.makedirs('outputs', exist_ok=True)
+            converted, size = run('text_to_mp3', synthesize)
+            sent = run('send_discord_file', lambda: sum(
+                send_discord_file(path, 'replay-token', '1', f"Part {i}/{len(parts)}")
+                for i, path in enumerate(parts, 1)))
+
+            def stream_upload():
+                # main.py の再開時と同じく、変換済みの全パートをまとめて渡す（入るだけ1メッセージにまとめる）
+                uploader = PartStreamUploader('replay-token', '1', 'replay')
+                for i, path in enumerate(parts, 1):
+                    uploader.submit(path, i)
+                return uploader.finish()[0]
+
+            streamed = run('PartStreamUploader', stream_upload)
+        finally:
+            archive.close_archive()
+            os.chdir(cwd)
+
+    failed = False
+    checks = [
+        (threads is not None and any(t['url'] == thread_url for t in threads), 'スレッド一覧に対象スレッドがない'),
+        (len(bodies) == len(fixtures.bodies), f"レス数が一致しない ({len(bodies)} / {len(fixtures.bodies)})"),
+        (bool(chunks), 'チャンクがない'),
+        (converted and bool(parts), 'MP3 変換に失敗'),
+        (sent == len(parts), f"送信に失敗 ({sent}/{len(parts)})"),
+        (streamed == len(parts), f"PartStreamUploader の送信に失敗 ({streamed}/{len(parts)})"),
+    ]
+    for ok, message in checks:
+        if not ok:
+            print(f"✗ {message}")
+            failed = True
+    print(f"  {len(chunks)} チャンク, {len(parts)} パート ({(size or 0) / (1024 * 1024):.1f} MB)")
+
+    print(f"  {'段':<24} {'実時間':>10} {'CPU':>10} {'ピーク':>9} {'送信':>11} {'受信':>11} {'リクエスト':>6}")
+    for stage, m in results.items():
+        print(f"  {stage:<24} {m['wall_ms']:8.1f}ms {m['cpu_ms']:8.1f}ms {m['peak_mb']:7.2f}MB "
+              f"{m['bytes_up'] / 1024:9.1f}KB {m['bytes_down'] / 1024:9.1f}KB {m['requests']:6d}")
+
+    report = {'python': sys.version.split()[0], 'posts': len(fixtures.bodies), 'stages': results}
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, ensure_ascii=False, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, ensure_ascii=False, indent=2)
+            fp.write('\n')
+        print(f"✓ 基準値を {args.baseline} に保存しました")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as fp:
+            baseline = json.load(fp)
+        machine_metrics = args.machine_metrics or args.time_tolerance is not None
+        if baseline.get('posts') != report['posts']:
+            print(f"⚠️ 基準値とレス数が違うため比較しません ({baseline.get('posts')} / {report['posts']})")
+        else:
+            if machine_metrics and baseline.get('python') != report['python']:
+                print(f"⚠️ 基準値と Python のバージョンが違います ({baseline.get('python')} / {report['python']})。"
+                      f"実時間・CPU 時間・ピークメモリの比較は参考値です")
+            regressions = _check_regressions(results, baseline.get('stages', {}), args.time_tolerance,
+                                             machine_metrics)
+            for regression in regressions:
+                print(f"✗ 回帰: {regression}")
+            if regressions:
+                failed = True
+            else:
+                print(f"✓ 基準値 ({args.baseline}) からの悪化なし")
+    return 1 if failed else 0
+
+
+def bench_filter(args) -> int:
+    from post_filter import PostFilter
+    from shitaraba_extractor import clean_texts
+
+    bodies = _load_bodies()
+    if args.posts:
+        bodies = [bodies[i % len(bodies)] for i in range(args.posts)]
+    texts = list(clean_texts(bodies, tts=True))
+    print(f"入力: {len(texts)} レス ({sum(map(len, texts))} 文字)")
+    post_filter = PostFilter()
+    started = time.perf_counter()
+    kept = list(post_filter.filter(texts))
+    elapsed = time.perf_counter() - started
+    print(f"  {elapsed * 1000:.1f} ms ({len(texts) / elapsed:.0f} レス/秒), 残り {len(kept)} レス")
+    print(f"  {post_filter.report.summary()}")
+    return 0
+
+
+def bench_archive(args) -> int:
+    from archive import PostArchive
+    from shitaraba_parser import Post
+
+    bodies = _load_bodies()
+    per_thread = max(1, args.posts // args.threads)
+    rng = random.Random(0)
+    words = sorted({w for body in bodies for w in re.findall(r'\w{3,}', body)}) or ['テスト本文']
+    queries = rng.sample(words, min(args.queries, len(words)))
+    print(f"入力: {args.threads} スレッド x {per_thread} レス (本文 {len(bodies)} 種類), 検索語 {len(queries)} 個")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        posts_archive = PostArchive(os.path.join(workdir, 'archive.sqlite3'))
+        started = time.perf_counter()
+        for t in range(args.threads):
+            posts = [Post(number=n, body=bodies[(t * per_thread + n) % len(bodies)])
+                     for n in range(1, per_thread + 1)]
+            posts_archive.upsert_posts('netgame/16797', str(1700000000 + t), posts, last_number=per_thread)
+        elapsed = time.perf_counter() - started
+        stats = posts_archive.stats()
+        print(f"  保存: {elapsed:.2f} 秒 ({stats['posts'] / elapsed:.0f} レス/秒), "
+              f"{stats['bytes'] / (1024 * 1024):.1f} MB (FTS5: {'あり' if posts_archive.fts else 'なし'})")
+
+        started = time.perf_counter()
+        posts_archive.upsert_posts('netgame/16797', '1700000000',
+                                   posts_archive.load_posts('netgame/16797', '1700000000'), last_number=per_thread)
+        print(f"  変更のないスレッドの再保存: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+        for label, fts in (('FTS5 trigram', posts_archive.fts), ('LIKE', False)):
+            if label != 'LIKE' and not fts:
+                continue
+            saved, posts_archive.fts = posts_archive.fts, fts
+            started = time.perf_counter()
+            hits = sum(len(posts_archive.search(q, limit=args.limit)) for q in queries)
+            elapsed = time.perf_counter() - started
+            posts_archive.fts = saved
+            print(f"  検索 ({label}): {elapsed / len(queries) * 1000:.2f} ms/回 (ヒット {hits} 件)")
+        posts_archive.close()
+    return 0
+
+
+def bench_mp3post(args) -> int:
+    import mp3_converter
+    from mp3_frames import duration_seconds
+
+    with open(args.mp3, 'rb') as fp:
+        segment = fp.read()
+    print(f"入力: {args.mp3} x {args.segments} セグメント "
+          f"({len(segment) * args.segments / (1024 * 1024):.1f} MB, {duration_seconds(segment) * args.segments / 60:.1f} 分)")
+    with tempfile.TemporaryDirectory() as workdir:
+        for label, trim in (('そのまま', False), ('無音の整理', True)):
+            writer = mp3_converter._PartWriter(os.path.join(workdir, f"{trim}.mp3"),
+                                               args.part_mb * 1024 * 1024, trim=trim)
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(args.segments):
+                    writer.write(segment)
+                writer.close()
+            elapsed = time.perf_counter() - started
+            size = sum(size for _, size in writer.parts)
+            seconds = 0.0
+            for path, _ in writer.parts:
+                with open(path, 'rb') as fp:
+                    seconds += duration_seconds(fp.read())
+            print(f"  {label}: {len(writer.parts)} パート, {size / (1024 * 1024):.2f} MB, "
+                  f"{seconds / 60:.1f} 分 ({elapsed * 1000:.0f} ms)")
+    return 0
+
+
+def _memory_bodies(posts: int) -> List[str]:
+    """
+    posts 件の互いに異なるレス本文（保存済みのレスに疑似ランダムな漢字列を付ける）
+
+    同じ文字列の共有でメモリが少なく見えたり、フィルタで重複として除かれて
+    重複判定の索引が小さく見えたりしないようにする。
+    """
+    bodies = _load_bodies()
+    rng = random.Random(0)
+    return [bodies[i % len(bodies)] + ' ' + ''.join(chr(0x4E00 + rng.randrange(20000)) for _ in range(24))
+            for i in range(posts)]
+
+
+def _memory_child(mode: str, posts: int) -> dict:
+    """
+    1プロセスで main.process_thread と同じ流れ（rawmode の取得・解析 → アーカイブ → レスを保持
+    → ハッシュ → 読み上げ用の正規化 → PostFilter → 音声変換）をリプレイサーバーに対して実行し、
+    最大 RSS を返す（mode: 'list' はレスをリストに、'buffer' は PostBuffer のまま持つ）
+    """
+    import resource
+    import archive
+    from mp3_converter import posts_to_mp3
+    from post_filter import PostFilter
+    from replay_server import ReplayServer, build_fixtures, replay_environment
+    from run_manifest import text_sha256
+    from shitaraba_extractor import clean_texts, extract_posts
+    from tts_backends import StubBackend
+
+    # リプレイサーバーが返す応答（rawmode の行）はサーバー側のメモリなので、測る前に作っておく
+    # （解放したメモリが再利用されて増加分が小さく見えないよう、最後まで持っておく）
+    fixtures = build_fixtures(bodies=_memory_bodies(posts))
+    with ReplayServer(fixtures) as server, replay_environment(server):
+        rss_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fetched = extract_posts(fixtures.thread_url, expected_posts=posts)
+        held = list(fetched) if mode == 'list' else fetched
+        text_sha256(p.body for p in held)
+        os.makedirs('outputs', exist_ok=True)
+        post_filter = PostFilter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            # 1セグメント1フレームのスタブ音声（音声ファイルの大きさに左右されないように）
+            ok, _ = posts_to_mp3(post_filter.filter(clean_texts((p.body for p in held), tts=True)),
+                                 os.path.join('outputs', 'memory.mp3'), backend=StubBackend(frames_per_char=0))
+        archive.close_archive()
+    rss_end = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'ok': ok and len(held) == posts, 'seconds': round(time.perf_counter() - started, 2),
+            'rss_start_mb': round(rss_start / 1024, 1), 'rss_peak_mb': round(rss_end / 1024, 1),
+            'kept': post_filter.report.kept}
+
+
+def bench_memory(args) -> int:
+    if args.child:
+        print(json.dumps(_memory_child(args.child, args.posts_child)))
+        return 0
+
+    import subprocess
+    counts = [int(n) for n in args.posts.split(',')]
+    print(f"{'レス数':>10}  {'保持':<8}{'最大 RSS':>10}{'増加分':>10}{'時間':>9}{'読み上げ':>10}")
+    for count in counts:
+        for mode in ('list', 'buffer'):
+            # 最大 RSS はプロセス単位なので、条件ごとに別プロセスで測る
+            with tempfile.TemporaryDirectory() as workdir:
+                cmd = [sys.executable, os.path.abspath(__file__), 'memory',
+                       '--child', mode, '--posts-child', str(count)]
+                env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+                proc = subprocess.run(cmd, cwd=workdir, capture_output=True, text=True, env=env)
+            if proc.returncode != 0:
+                print(f"✗ {mode} {count}: {proc.stderr.strip()[-500:]}")
+                return 1
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{count:>10}  {mode:<8}{result['rss_peak_mb']:>8.1f}MB"
+                  f"{result['rss_peak_mb'] - result['rss_start_mb']:>8.1f}MB{result['seconds']:>8.2f}s"
+                  f"{result['kept']:>10}")
+            if not result['ok']:
+                print(f"✗ {mode} {count}: 取得または変換に失敗しました")
+                return 1
+    return 0
+
+
+# importtime の子プロセス: スクリプトを __main__ として実行し、最初の HTTP リクエスト
+# （transport.get_session の呼び出し）の時点で経過時間を出力して終了する（通信はしない）
+_FIRST_REQUEST_CHILD = """
+import os, runpy, sys, time
+started, started_at = time.perf_counter(), time.time()
+sys.path.insert(0, os.environ['BENCH_REPO'])
+import transport
+def first_request(url):
+    print(f'\\n__FIRST_REQUEST__ {(time.perf_counter() - started) * 1000:.1f} {started_at} {len(sys.modules)}',
+          flush=True)
+    os._exit(0)
+transport.get_session = first_request
+sys.argv = sys.argv[1:]
+runpy.run_path(sys.argv[0], run_name='__main__')
+"""
+# 最初のリクエストまで進めるための引数（main.py / watcher.py は DISCORD_* の確認を通す）
+_IMPORTTIME_ARGS = {'watcher.py': ['--once'], 'archive.py': ['stats']}
+
+
+def _parse_importtime(stderr: str, module: str):
+    """-X importtime の出力から (module の累積 µs, 直接 import したモジュールの [(累積 µs, 名前)])"""
+    total, children = 0, []
+    for line in stderr.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth == 0 and name.strip() == module:
+            total = int(parts[1])
+        elif depth == 1:
+            children.append((int(parts[1]), name.strip()))
+        elif depth == 0:
+            children = []  # 別の最上位モジュールの子だった
+    return total, sorted(children, reverse=True)
+
+
+def bench_importtime(args) -> int:
+    import subprocess
+
+    repo = os.path.dirname(os.path.abspath(__file__))
+    scripts = args.scripts.split(',')
+    env = dict(os.environ, BENCH_REPO=repo, PYTHONPATH=repo,
+               DISCORD_BOT_TOKEN=os.getenv('DISCORD_BOT_TOKEN', 'dummy'),
+               DISCORD_CHANNEL_ID=os.getenv('DISCORD_CHANNEL_ID', '0'))
+    # 時間は計測環境のばらつきが大きいので、最初のリクエストまでに読み込んだモジュール数も表示する
+    print(f"{'スクリプト':<24}{'import':>10}{'最初のリクエスト':>14}{'(起動から)':>12}{'モジュール':>8}  重い import")
+    for script in scripts:
+        module = os.path.splitext(script)[0]
+        imports, requests_ms, spawn_ms, heaviest, modules = [], [], [], [], 0
+        # import の時間とリクエストまでの時間は別プロセスで測る（-X importtime の出力自体が遅いため）
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as workdir:
+                proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                      cwd=workdir, env=env, capture_output=True, text=True)
+                total, children = _parse_importtime(proc.stderr, module)
+                imports.append(total / 1000)
+                heaviest = children[:3]
+
+                spawned = time.time()
+                proc = subprocess.run([sys.executable, '-c', _FIRST_REQUEST_CHILD,
+                                       os.path.join(repo, script), *_IMPORTTIME_ARGS.get(script, [])],
+                                      cwd=workdir, env=env, capture_output=True, text=True, timeout=120)
+            marker = [line for line in proc.stdout.splitlines() if line.startswith('__FIRST_REQUEST__')]
+            if marker:
+                _, in_process, started_at, modules = marker[-1].split()
+                requests_ms.append(float(in_process))
+                spawn_ms.append((float(started_at) - spawned) * 1000 + float(in_process))
+        first = (f"{min(requests_ms):>11.1f}ms{min(spawn_ms):>10.1f}ms{modules:>8}"
+                 if requests_ms else f"{'リクエストなし':>14}{'':>20}")
+        heavy = ', '.join(f"{name} {us / 1000:.0f}ms" for us, name in heaviest)
+        print(f"{script:<24}{min(imports):>8.1f}ms{first}  {heavy}")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('parse', help='スレッドHTMLの解析（パーサバックエンド比較）')
+    p.add_argument('--html', help='保存したスレッドHTML（EUC-JP）')
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=bench_parse)
+
+    p = sub.add_parser('chunk', help='テキストのチャンク分割（性質チェック + 従来実装との比較）')
+    p.add_argument('--size-mb', type=float, default=1.0, help='合成するスレッド本文のサイズ（MB）')
+    p.add_argument('--chunk-size', type=int, default=500)
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(func=bench_chunk)
+
+    p = sub.add_parser('tts', help='TTS バックエンドの合成速度の比較（キャッシュなし）')
+    p.add_argument('--backends', default='stub,local', help='カンマ区切り（gtts / local / stub）')
+    p.add_argument('--posts', type=int, default=200, help='合成するレス数')
+    p.add_argument('--workers', type=int, default=4)
+    p.set_defaults(func=bench_tts)
+
+    p = sub.add_parser('subject', help='スレッド一覧の解析（subject.txt の行スキャン vs subject.cgi の HTML）')
+    p.add_argument('--threads', type=int, default=1000)
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_subject)
+
+    p = sub.add_parser('clean', help='レス本文のクリーニング（clean_texts vs 従来実装）')
+    p.add_argument('--html', help='保存したスレッドHTML（EUC-JP）')
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_clean)
+
+    p = sub.add_parser('replay', help='リプレイサーバーでパイプライン全体を測定（回帰チェック）')
+    p.add_argument('--posts', type=int, help='レス数（省略時は outputs/*.txt の全レス）')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--baseline', default=BASELINE_FILE, help='比較する基準値（JSON）')
+    p.add_argument('--save-baseline', action='store_true', help='今回の結果を基準値として保存する')
+    p.add_argument('--machine-metrics', action='store_true',
+                   help='実時間・CPU 時間・ピークメモリも比べる（基準値と同じマシンで測る場合）')
+    p.add_argument('--time-tolerance', type=float,
+                   help='実時間・CPU 時間の許容する悪化の割合（例: 0.5。指定すると --machine-metrics も有効）')
+    p.add_argument('--json', help='結果を JSON で書き出すファイル')
+    p.add_argument('--verbose', action='store_true', help='各段の出力を表示する')
+    p.set_defaults(func=bench_replay)
+
+    p = sub.add_parser('filter', help='変換前のレスの間引き（削減できる文字数・TTS リクエスト数）')
+    p.add_argument('--posts', type=int, help='レス数（省略時は outputs/*.txt の全レス。足りなければ繰り返す）')
+    p.set_defaults(func=bench_filter)
+
+    p = sub.add_parser('archive', help='レスアーカイブの一括保存と全文検索（FTS5 vs LIKE）')
+    p.add_argument('--posts', type=int, default=200000, help='保存するレス数の合計')
+    p.add_argument('--threads', type=int, default=200, help='スレッド数')
+    p.add_argument('--queries', type=int, default=20, help='検索語の数')
+    p.add_argument('--limit', type=int, default=50)
+    p.set_defaults(func=bench_archive)
+
+    p = sub.add_parser('mp3post', help='パートファイルの後処理（無音・Xing タグの除去）で減るサイズ・再生時間')
+    p.add_argument('--mp3', default='test_output.mp3', help='1セグメント分の MP3（gTTS の出力）')
+    p.add_argument('--segments', type=int, default=2000)
+    p.add_argument('--part-mb', type=int, default=8, help='パートの上限（MB）')
+    p.set_defaults(func=bench_mp3post)
+
+    p = sub.add_parser('memory', help='レス数を増やしたときの最大 RSS（リストで保持 vs PostBuffer）')
+    p.add_argument('--posts', default='1000,10000,100000', help='レス数（カンマ区切り）')
+    p.add_argument('--child', choices=('list', 'buffer'), help=argparse.SUPPRESS)
+    p.add_argument('--posts-child', type=int, default=0, help=argparse.SUPPRESS)
+    p.set_defaults(func=bench_memory)
+
+    p = sub.add_parser('importtime', help='起動時間（import と最初の HTTP リクエストまでの時間）')
+    p.add_argument('--scripts', default='main.py,watcher.py,shitaraba_extractor.py,mp3_converter.py,archive.py',
+                   help='__main__ として起動するスクリプト（カンマ区切り）')
+    p.add_argument('--repeat', type=int, default=5, help='スクリプトごとの実行回数（最小値を表示）')
+    p.set_defaults(func=bench_importtime)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
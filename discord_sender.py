@@ -3,16 +3,15 @@ Discord へメッセージを送信するユーティリティ
 
 関数:
  - send_discord_message(message: str, token: str, channel_id: str) -> bool
+ - send_discord_file(file_path, token, channel_id, message=None) -> bool
+
+送信とレート制限の処理は discord_uploader.DiscordUploader が行います。
+パートファイルを順番に送る場合は discord_uploader.PartStreamUploader を使ってください。
 
 注意: トークンやチャンネルIDは環境変数に保持し、コード中にハードコーディングしないこと。
 """
-import json
-import time
-import requests
-from typing import Optional
-
-
-API_BASE = "https://discord.com/api/v10"
+import asyncio
+from discord_uploader import DiscordUploader
 
 
 def send_discord_message(message: str, token: str, channel_id: str) -> bool:
@@ -27,38 +26,11 @@ def send_discord_message(message: str, token: str, channel_id: str) -> bool:
     戻り値: 成功時 True, 失敗時 False
 
     エラーハンドリング:
-    - 429 (rate limit) の場合はリトライを行う
+    - 429 (rate limit) の場合は retry_after だけ待ってリトライを行う
     - その他の HTTP エラーは標準出力に出力して False を返す
     """
-    url = f"{API_BASE}/channels/{channel_id}/messages"
-    headers = {
-        'Authorization': f'Bot {token}',
-        'Content-Type': 'application/json'
-    }
-    payload = {'content': message}
-
     try:
-        resp = requests.post(url, headers=headers, data=json.dumps(payload), timeout=10)
-        if resp.status_code == 200 or resp.status_code == 201:
-            return True
-        if resp.status_code == 429:
-            # レスポンスに retry_after が入っている
-            try:
-                info = resp.json()
-                wait = float(info.get('retry_after', 1.0))
-            except Exception:
-                wait = 1.0
-            time.sleep(wait)
-            # 単純に1回だけリトライ
-            resp2 = requests.post(url, headers=headers, data=json.dumps(payload), timeout=10)
-            if resp2.status_code in (200, 201):
-                return True
-            print(f"Discord送信失敗: status={resp2.status_code}, body={resp2.text}")
-            return False
-
-        print(f"Discord送信失敗: status={resp.status_code}, body={resp.text}")
-        return False
-
+        return asyncio.run(DiscordUploader(token, channel_id).send(message)) is not None
     except Exception as e:
         print(f"エラー: send_discord_message(): {e}")
         return False
@@ -77,43 +49,11 @@ def send_discord_file(file_path: str, token: str, channel_id: str, message: str
     戻り値: 成功時 True, 失敗時 False
 
     実装:
-    - multipart/form-data の `files` フィールドにファイルを入れて POST
-    - rate limit (429) の場合はレスポンスの `retry_after` を参照して1回リトライ
+    - multipart/form-data でファイルをディスクから少しずつ読んで POST
+    - rate limit (429) の場合はレート制限バケットに従って待ち、リトライ
     """
-    url = f"{API_BASE}/channels/{channel_id}/messages"
-    headers = {
-        'Authorization': f'Bot {token}'
-    }
-
     try:
-        with open(file_path, 'rb') as fp:
-            files = {'file': (file_path.split('/')[-1], fp)}
-            data = {}
-            if message:
-                data['content'] = message
-            resp = requests.post(url, headers=headers, files=files, data=data, timeout=30)
-
-        if resp.status_code in (200, 201):
-            return True
-        if resp.status_code == 429:
-            try:
-                info = resp.json()
-                wait = float(info.get('retry_after', 1.0))
-            except Exception:
-                wait = 1.0
-            import time
-            time.sleep(wait)
-            with open(file_path, 'rb') as fp:
-                files = {'file': (file_path.split('/')[-1], fp)}
-                resp2 = requests.post(url, headers=headers, files=files, data=data, timeout=30)
-            if resp2.status_code in (200, 201):
-                return True
-            print(f"Discordファイル送信失敗: status={resp2.status_code}, body={resp2.text}")
-            return False
-
-        print(f"Discordファイル送信失敗: status={resp.status_code}, body={resp.text}")
-        return False
-
+        return asyncio.run(DiscordUploader(token, channel_id).send(message, [file_path])) is not None
     except Exception as e:
         print(f"エラー: send_discord_file(): {e}")
         return False
@@ -0,0 +1,458 @@
+"""
+Discord への非同期アップローダ
+
+レート制限はルート（メソッド + チャンネル）ごとのバケットで管理します。レスポンスの
+X-RateLimit-Remaining / X-RateLimit-Reset-After を読んで、互いに順番を気にしないリクエスト
+（キャプションの編集など）は残り回数がある分だけ同時に送り、0 になったらリセットまで待ちます。
+429 を受けたら retry_after だけ待って同じリクエストを送り直します（X-RateLimit-Global なら全ルートを止める）。
+
+パートファイルはチャンネル内の順番を保つため1メッセージずつ順に送りますが、送信待ちのパートが
+複数あれば（再開時や再エンコード待ちの後など）合計 25MB・10 ファイルまで1つのメッセージにまとめます。
+添付ファイルはディスク（またはメモリ上のバイト列）から少しずつ読んで multipart で送るので、
+ファイル全体をメモリに載せません。
+
+HTTP は transport モジュールの keep-alive セッションを asyncio.to_thread 経由で使います。
+
+関数:
+ - DiscordUploader: send(), edit() を持つ非同期クライアント
+ - PartStreamUploader: 音声変換と並行して、出来たパートから順にアップロードする
+"""
+import asyncio
+import io
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import metrics
+import transport
+
+
+API_BASE = "https://discord.com/api/v10"
+
+MAX_ATTACHMENTS = 10                      # 1メッセージに添付できるファイル数
+MAX_MESSAGE_BYTES = 25 * 1024 * 1024      # 1メッセージの添付ファイル合計の上限
+PACK_WAIT = 0.05                          # 続けて渡されるパートを1メッセージにまとめるための待ち時間（秒）
+DEFAULT_BUCKET_LIMIT = 5                  # バケットが分かるまでに同時に送ってよいリクエスト数
+MAX_RETRIES = 5                           # 429 やネットワークエラーのリトライ回数
+REQUEST_TIMEOUT = 10                      # テキストだけのリクエストのタイムアウト（秒）
+UPLOAD_TIMEOUT = 60                       # 添付ファイルつきリクエストのタイムアウト（秒）
+READ_CHUNK_SIZE = 64 * 1024
+
+# 添付ファイル: パス、または (ファイル名, バイト列)
+Attachment = Union[str, Tuple[str, bytes]]
+
+
+class _Bucket:
+    """1つのレート制限バケットの状態"""
+
+    def __init__(self, limit: int = DEFAULT_BUCKET_LIMIT):
+        self.limit = limit
+        self.remaining = limit
+        self.reset_at = 0.0
+
+
+class RateLimiter:
+    """
+    Discord のレート制限バケットをルートごとに追跡する
+
+    - acquire(route): 残り回数があれば1つ使う（なければリセットまで待つ）
+    - update(route, headers): レスポンスの X-RateLimit-* ヘッダで状態を更新する
+    - on_rate_limited(route, retry_after, is_global): 429 を受けたときに待機時間を設定する
+
+    X-RateLimit-Bucket が同じルートは同じバケットを共有する。
+    """
+
+    def __init__(self):
+        self._routes: Dict[str, str] = {}
+        self._buckets: Dict[str, _Bucket] = {}
+        self._global_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _bucket(self, route: str) -> _Bucket:
+        key = self._routes.get(route, route)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket()
+        return bucket
+
+    async def acquire(self, route: str) -> None:
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                bucket = self._bucket(route)
+                wait = self._global_until - now
+                if wait <= 0:
+                    if bucket.reset_at and now >= bucket.reset_at:
+                        bucket.remaining = bucket.limit
+                        bucket.reset_at = 0.0
+                    if bucket.remaining > 0:
+                        bucket.remaining -= 1
+                        return
+                    # リセット時刻が分からない（応答待ち）場合は少し待って確認し直す
+                    wait = bucket.reset_at - now if bucket.reset_at else 0.05
+            metrics.count('rate_limit_wait_seconds', wait, service='discord')
+            await asyncio.sleep(wait)
+
+    async def update(self, route: str, headers) -> None:
+        """レスポンスのヘッダでバケットを更新する（応答がなかった場合は headers=None）"""
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset_at = time.monotonic() + float(headers['X-RateLimit-Reset-After'])
+        except (KeyError, TypeError, ValueError):
+            async with self._lock:
+                bucket = self._bucket(route)
+                if not bucket.reset_at:
+                    # 制限が分からない間は同時実行数の上限として扱い、使った分を返す
+                    bucket.remaining = min(bucket.limit, bucket.remaining + 1)
+            return
+        async with self._lock:
+            bucket_id = headers.get('X-RateLimit-Bucket')
+            if bucket_id and self._routes.get(route) != bucket_id:
+                # 同じバケットを使う別ルートがあれば共有する
+                self._routes[route] = bucket_id
+                self._buckets.setdefault(bucket_id, self._buckets.pop(route, _Bucket()))
+            bucket = self._bucket(route)
+            try:
+                bucket.limit = int(headers.get('X-RateLimit-Limit', bucket.limit))
+            except (TypeError, ValueError):
+                pass
+            if reset_at > bucket.reset_at + 0.5:
+                # 新しいウィンドウ: サーバーの残り回数をそのまま使う
+                bucket.remaining = remaining
+                bucket.reset_at = reset_at
+            else:
+                # 同じウィンドウ内の応答は順不同で届くので、少ない方を信じる
+                bucket.remaining = min(bucket.remaining, remaining)
+
+    async def on_rate_limited(self, route: str, retry_after: float, is_global: bool) -> None:
+        async with self._lock:
+            until = time.monotonic() + retry_after
+            if is_global:
+                self._global_until = max(self._global_until, until)
+            else:
+                bucket = self._bucket(route)
+                bucket.remaining = 0
+                bucket.reset_at = max(bucket.reset_at, until)
+
+
+class MultipartBody:
+    """
+    multipart/form-data のボディをファイルから少しずつ読み出すストリーム
+
+    requests に data として渡すと、__len__ で Content-Length を付け、read() で
+    READ_CHUNK_SIZE ずつ送信する（ファイル全体をメモリに読み込まない）。
+    """
+
+    def __init__(self, payload: dict, attachments: Sequence[Attachment]):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f'multipart/form-data; boundary={self.boundary}'
+        self._segments: List[Union[bytes, str]] = [
+            self._part_header('payload_json', None, 'application/json'),
+            json.dumps(payload).encode('utf-8'),
+        ]
+        for i, attachment in enumerate(attachments):
+            filename, source = _attachment_source(attachment)
+            self._segments.append(self._part_header(f'files[{i}]', filename, 'application/octet-stream'))
+            self._segments.append(source)
+        self._segments.append(f'\r\n--{self.boundary}--\r\n'.encode('ascii'))
+        self._length = sum(os.path.getsize(s) if isinstance(s, str) else len(s) for s in self._segments)
+        self._index = 0
+        self._current: Optional[io.BufferedIOBase] = None
+
+    def _part_header(self, name: str, filename: Optional[str], content_type: str) -> bytes:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        lead = '' if name == 'payload_json' else '\r\n'
+        return (f'{lead}--{self.boundary}\r\nContent-Disposition: {disposition}\r\n'
+                f'Content-Type: {content_type}\r\n\r\n').encode('utf-8')
+
+    def __len__(self) -> int:
+        return self._length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self._length
+        out = bytearray()
+        while len(out) < size and self._index < len(self._segments):
+            if self._current is None:
+                segment = self._segments[self._index]
+                self._current = open(segment, 'rb') if isinstance(segment, str) else io.BytesIO(segment)
+            data = self._current.read(size - len(out))
+            if data:
+                out += data
+            else:
+                self._current.close()
+                self._current = None
+                self._index += 1
+        return bytes(out)
+
+    def __iter__(self) -> Iterator[bytes]:
+        while True:
+            data = self.read(READ_CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+    def close(self) -> None:
+        if self._current is not None:
+            self._current.close()
+            self._current = None
+
+
+def _attachment_source(attachment: Attachment) -> Tuple[str, Union[str, bytes]]:
+    """添付ファイルの (ファイル名, パスまたはバイト列)"""
+    if isinstance(attachment, str):
+        return os.path.basename(attachment), attachment
+    return attachment
+
+
+def _attachment_size(attachment: Attachment) -> int:
+    return os.path.getsize(attachment) if isinstance(attachment, str) else len(attachment[1])
+
+
+def pack_attachments(attachments: Sequence[Attachment], max_bytes: int = MAX_MESSAGE_BYTES,
+                     max_count: int = MAX_ATTACHMENTS) -> List[List[int]]:
+    """
+    添付ファイルを順番を変えずにメッセージ単位にまとめる
+
+    戻り値: メッセージごとの添付ファイルのインデックスのリスト
+    """
+    groups: List[List[int]] = []
+    size = 0
+    for i, attachment in enumerate(attachments):
+        n = _attachment_size(attachment)
+        if not groups or len(groups[-1]) >= max_count or size + n > max_bytes:
+            groups.append([])
+            size = 0
+        groups[-1].append(i)
+        size += n
+    return groups
+
+
+def _part_label(indexes: List[int]) -> str:
+    """パート番号（1 始まり）の並びを「2」「2-3」のようなラベルにする"""
+    first, last = indexes[0], indexes[-1]
+    return f"{first}" if first == last else f"{first}-{last}"
+
+
+def _part_caption(caption: str, indexes: List[int], total: int) -> str:
+    """「Part 1/6」「Part 2-3/6」のようなキャプションを作る"""
+    if total <= 1:
+        return caption
+    return f"{caption} - Part {_part_label(indexes)}/{total}"
+
+
+class DiscordUploader:
+    """
+    Discord の非同期クライアント（1チャンネル分）
+
+    レート制限の状態は1つのインスタンスの中で共有されるので、
+    同じイベントループ内ではインスタンスを使い回すこと。
+    """
+
+    def __init__(self, token: str, channel_id: str):
+        self.token = token
+        self.channel_id = channel_id
+        self.limiter = RateLimiter()
+
+    async def request(self, method: str, path: str, payload: dict,
+                      attachments: Sequence[Attachment] = ()) -> Optional[dict]:
+        """
+        API を呼び出す（429・ネットワークエラーはリトライ）
+
+        戻り値: 成功時はレスポンスの JSON（メッセージなど）。失敗時は None
+        """
+        url = f"{API_BASE}{path}"
+        route = f"{method} {path}"
+        for attempt in range(MAX_RETRIES + 1):
+            headers = {'Authorization': f'Bot {self.token}'}
+            if attachments:
+                body = MultipartBody(payload, attachments)
+                headers['Content-Type'] = body.content_type
+                timeout = UPLOAD_TIMEOUT
+            else:
+                body = json.dumps(payload)
+                headers['Content-Type'] = 'application/json'
+                timeout = REQUEST_TIMEOUT
+
+            await self.limiter.acquire(route)
+            try:
+                resp = await asyncio.to_thread(transport.request, method, url,
+                                               headers=headers, data=body, timeout=timeout)
+            except Exception as e:
+                await self.limiter.update(route, None)
+                if attempt < MAX_RETRIES:
+                    metrics.count('discord_retries', reason='error')
+                    print(f"⚠️  Discord への送信エラー: {e}。リトライします ({attempt + 1}/{MAX_RETRIES})")
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                print(f"エラー: DiscordUploader.request(): {e}")
+                return None
+            finally:
+                if isinstance(body, MultipartBody):
+                    body.close()
+
+            await self.limiter.update(route, resp.headers)
+            if resp.status_code in (200, 201, 204):
+                return resp.json() if resp.content else {}
+            if resp.status_code == 429 and attempt < MAX_RETRIES:
+                retry_after, is_global = _retry_after(resp)
+                metrics.count('discord_retries', reason='429')
+                metrics.count('rate_limited', service='discord')
+                print(f"⚠️  Discord のレート制限。{retry_after:.1f}秒後にリトライ... ({attempt + 1}/{MAX_RETRIES})")
+                await self.limiter.on_rate_limited(route, retry_after, is_global)
+                continue
+
+            print(f"Discord送信失敗: status={resp.status_code}, body={resp.text}")
+            return None
+        return None
+
+    async def send(self, content: Optional[str] = None,
+                   attachments: Sequence[Attachment] = ()) -> Optional[dict]:
+        """メッセージ（添付ファイルつき可）を送信する。戻り値: 作成されたメッセージ"""
+        payload: dict = {}
+        if content:
+            payload['content'] = content
+        if attachments:
+            payload['attachments'] = [{'id': i, 'filename': _attachment_source(a)[0]}
+                                      for i, a in enumerate(attachments)]
+        return await self.request('POST', f"/channels/{self.channel_id}/messages", payload, attachments)
+
+    async def edit(self, message_id: str, content: str) -> Optional[dict]:
+        """送信済みメッセージの本文を書き換える"""
+        return await self.request('PATCH', f"/channels/{self.channel_id}/messages/{message_id}",
+                                  {'content': content})
+
+
+def _retry_after(resp) -> Tuple[float, bool]:
+    """429 のレスポンスから (待機秒数, グローバル制限か) を取り出す"""
+    try:
+        info = resp.json()
+    except ValueError:
+        info = {}
+    try:
+        retry_after = float(info.get('retry_after') or resp.headers.get('Retry-After') or 1.0)
+    except (TypeError, ValueError):
+        retry_after = 1.0
+    is_global = bool(info.get('global')) or resp.headers.get('X-RateLimit-Global') == 'true'
+    return retry_after, is_global
+
+
+class PartStreamUploader:
+    """
+    パートファイルを出来た順にバックグラウンドでアップロードする（音声変換と並行）
+
+    - submit(path, index): mp3_converter の on_part にそのまま渡せる。すぐに戻る
+    - add_sent(index, message_id): 前回の実行で送信済みのパートを登録する（送り直さない）
+    - finish() -> (成功数, パート数): 残りのアップロードを待ち、キャプションを「Part i/N」に直す
+      （全て直せたら captions_fixed が True になる）
+
+    on_sent を渡すと、パートの送信に成功するたびに (パート番号, メッセージID) で呼ばれる
+    （アップローダのスレッドから呼ばれる）。on_sent が例外を投げてもパートは送信済みとして数える。
+
+    パート数 N は変換が終わるまで分からないので、送信時のキャプションは「Part i」とし、
+    finish() で N が決まってから編集する。チャンネル内の順番を保つため、
+    メッセージは前のメッセージの送信が終わってから送る。その間に渡されたパートは、
+    次のメッセージに入るだけ（pack_attachments）まとめて送る。
+    """
+
+    def __init__(self, token: str, channel_id: str, caption: str,
+                 on_sent: Optional[Callable[[int, str], None]] = None):
+        self.client = DiscordUploader(token, channel_id)
+        self.caption = caption
+        self.on_sent = on_sent
+        self.captions_fixed = False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._uploads: List[Future] = []
+        # 送信待ちのパート（イベントループのスレッドからだけ触る）
+        self._pending: List[Tuple[Attachment, int, Future]] = []
+        self._sender: Optional[asyncio.Task] = None
+
+    def submit(self, path: Attachment, index: int) -> None:
+        print(f"DiscordにMP3ファイルを送信中 (Part {index}): {_attachment_source(path)[0]}")
+        future: Future = Future()
+        self._uploads.append(future)
+        self._loop.call_soon_threadsafe(self._enqueue, path, index, future)
+
+    def add_sent(self, index: int, message_id: str) -> None:
+        print(f"✓ Part {index} は送信済みです（スキップ）")
+        future: Future = Future()
+        future.set_result({'id': message_id})
+        self._uploads.append(future)
+
+    def _enqueue(self, path: Attachment, index: int, future: Future) -> None:
+        self._pending.append((path, index, future))
+        if self._sender is None or self._sender.done():
+            self._sender = self._loop.create_task(self._send_pending())
+
+    async def _send_pending(self) -> None:
+        # 続けて渡されるパート（再開時など）がそろうのを少し待ってからまとめる
+        await asyncio.sleep(PACK_WAIT)
+        while self._pending:
+            try:
+                count = len(pack_attachments([path for path, _, _ in self._pending])[0])
+            except OSError:
+                count = 1  # サイズが分からないファイルは単独で送り、送信の失敗として扱う
+            group, self._pending = self._pending[:count], self._pending[count:]
+            try:
+                await self._upload(group)
+            except Exception as e:
+                for _, _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def _upload(self, group: List[Tuple[Attachment, int, Future]]) -> None:
+        indexes = [index for _, index, _ in group]
+        label = _part_label(indexes)
+        message = await self.client.send(f"{self.caption} - Part {label}", [path for path, _, _ in group])
+        print(f"{'✓' if message else '✗'} Part {label} の送信{'成功' if message else '失敗'}")
+        for _, index, future in group:
+            if message and message.get('id') and self.on_sent:
+                try:
+                    self.on_sent(index, message['id'])
+                except Exception as e:
+                    # Discord には届いているので送信済みとして数える（ここで失敗扱いにすると次の実行で二重に送る）
+                    print(f"エラー: PartStreamUploader: Part {index} の送信記録に失敗しました: {e}")
+            future.set_result(message)
+
+    async def _fix_captions(self, messages: List[Optional[dict]]) -> bool:
+        total = len(messages)
+        # まとめて送ったパートは1つのメッセージなので、メッセージごとに1回だけ編集する
+        groups: Dict[str, List[int]] = {}
+        for i, message in enumerate(messages, 1):
+            if message and message.get('id'):
+                groups.setdefault(message['id'], []).append(i)
+        results = await asyncio.gather(*(
+            self.client.edit(message_id, _part_caption(self.caption, indexes, total))
+            for message_id, indexes in groups.items()
+        ))
+        return all(result is not None for result in results)
+
+    def finish(self) -> Tuple[int, int]:
+        messages: List[Optional[dict]] = []
+        try:
+            for index, future in enumerate(self._uploads, 1):
+                try:
+                    messages.append(future.result())
+                except Exception as e:
+                    # 送信できなかったパートは未送信として数え、次の実行で送り直す
+                    print(f"エラー: PartStreamUploader.finish(): Part {index}: {e}")
+                    messages.append(None)
+            try:
+                self.captions_fixed = asyncio.run_coroutine_threadsafe(
+                    self._fix_captions(messages), self._loop).result()
+            except Exception as e:
+                print(f"エラー: PartStreamUploader.finish(): キャプションを修正できません: {e}")
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+        return sum(message is not None for message in messages), len(messages)
+
@@ -4,110 +4,238 @@
 実行フロー:
  - 環境変数から `DISCORD_BOT_TOKEN`, `DISCORD_CHANNEL_ID` を取得
  - `get_latest_valorant_thread()` で対象スレッドを取得
- - `extract_post_bodies()` でレスを取得
- - 全レスを結合して MP3 に音声変換
- - Discord にファイル添付で送信
+ - `extract_posts()` でレス（番号・日時・ID・本文）を取得
+ - レスを MP3 に音声変換し、出来たパートから順に Discord にファイル添付で送信
+   （次のパートの変換中に前のパートをアップロードする）
 
 エラー時にはコンソールと Discord（可能なら）に通知します。
+進み具合は state/runs/<スレッドID>.json に記録し、途中で落ちた実行は再実行すると続きから再開します。
+送信を終えたスレッドは thread_fingerprint に記録し、次の実行ではレス数が変わっていなければ何もせず、
+増えていれば新着レスだけの MP3 を送ります。
+各段の所要時間・通信量・リトライ回数などは metrics で計測し、最後に state/metrics/ に書き出します。
 """
+import itertools
 import os
 import re
-from datetime import datetime
+import time
 from pathlib import Path
-from shitaraba_extractor import get_latest_valorant_thread, extract_post_bodies
-from discord_sender import send_discord_message, send_discord_file
-from mp3_converter import text_to_mp3
-
-
-def main():
-    print("=" * 60)
-    print("したらば→Discord 自動送信システム")
-    print("=" * 60)
-
-    discord_token = os.getenv('DISCORD_BOT_TOKEN')
-    discord_channel = os.getenv('DISCORD_CHANNEL_ID')
-    if not discord_token or not discord_channel:
-        print("✗ エラー: DISCORD_BOT_TOKEN または DISCORD_CHANNEL_ID が設定されていません")
-        return
-
-    print("\nスレッド一覧を取得中...")
-    thread = get_latest_valorant_thread()
-    if not thread:
-        print("⚠️ 条件に合うVALORANTスレッドが見つかりませんでした")
-        # 可能なら Discord に送信
-        send_discord_message("⚠️ 条件に合うVALORANTスレッドが見つかりませんでした", discord_token, discord_channel)
+import metrics
+import thread_fingerprint
+import transport
+from shitaraba_extractor import get_latest_valorant_thread, extract_posts, clean_texts
+from post_buffer import PostBuffer
+from post_filter import POST_FILTER_ENABLED, PostFilter
+from run_manifest import RunManifest, text_sha256
+# 音声変換（mp3_converter → gTTS）と Discord 送信（discord_uploader → asyncio）は読み込みに
+# 時間がかかるので、使う直前に読み込む（変化のないスレッドを省略する実行では読まずに終わる）
+
+
+def _notify(message: str, discord_token: str, discord_channel: str) -> bool:
+    """Discord にエラー・警告のメッセージを送る"""
+    from discord_sender import send_discord_message
+    return send_discord_message(message, discord_token, discord_channel)
+
+
+def _save_fingerprint(thread_id: str, thread: dict, all_posts: PostBuffer, last_sent: int) -> None:
+    """>>last_sent までのレスを送信済みとしてスレッドの指紋に記録する"""
+    if thread_id == 'unknown':
         return
+    sent = all_posts.between(0, last_sent)
+    # 再開した実行が途中までのレス範囲だった場合はレス数を記録せず、残りを次の実行で送る
+    post_count = thread.get('posts') if last_sent >= all_posts[-1].number else None
+    thread_fingerprint.save(thread_id, post_count, sent)
 
-    print(f"✓ 対象スレッド: {thread['name']}")
 
-    print("\nレスを取得中...")
-    posts = extract_post_bodies(thread['url'], expected_posts=thread.get('posts'))
-    if not posts:
-        print("⚠️ レスの取得に失敗しました")
-        send_discord_message("⚠️ レスの取得に失敗しました", discord_token, discord_channel)
-        return
+def process_thread(thread: dict, discord_token: str, discord_channel: str, notify: bool = True) -> bool:
+    """
+    1つのスレッドのレスを取得し、MP3 に変換して Discord に送信する
 
-    print(f"✓ {len(posts)}件のレスを取得")
-
-    # 全レスを結合してMP3に変換
-    outdir = Path('outputs')
-    outdir.mkdir(exist_ok=True)
+    引数:
+    - thread: get_latest_valorant_thread() / find_threads() が返すスレッド情報
+      （'slug' があればファイル名の先頭に使う）
+    - discord_token, discord_channel: 送信先
+    - notify: 失敗を Discord に通知する（False なら表示だけ。watcher.py は失敗が続いた場合にまとめて通知する）
 
+    戻り値: 全パートを送信できた（または送信済みだった）場合 True
+    """
     # スレッドIDをURLから抽出
     thread_id = 'unknown'
     try:
-        m = re.search(r'/bbs/read\.cgi/[^/]+/(\d+)/', thread['url'])
+        m = re.search(r'/bbs/read\.cgi/[^/]+/\d+/(\d+)', thread['url'])
         if m:
             thread_id = m.group(1)
     except Exception:
         pass
 
-    timestamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
-    mp3_basename = outdir / f"valorant_part{thread.get('part')}_{thread_id}_{timestamp}.mp3"
+    # スレッド一覧のレス数が前回の送信時と同じなら、レスも取得せずに終える
+    fingerprint = thread_fingerprint.load(thread_id) if thread_id != 'unknown' else None
+    if thread_fingerprint.SKIP_UNCHANGED and fingerprint and fingerprint.is_unchanged(thread.get('posts')):
+        print(f"✓ 前回の送信から変化なし ({fingerprint.post_count}件)。処理を省略します")
+        metrics.count('threads_skipped', reason='unchanged')
+        return True
+
+    print("\nレスを取得中...")
+    with metrics.span('stage', stage='extract_posts'):
+        posts = extract_posts(thread['url'], expected_posts=thread.get('posts'))
+    metrics.count('posts_fetched', len(posts))
+    if not posts:
+        print("⚠️ レスの取得に失敗しました")
+        if notify:
+            _notify("⚠️ レスの取得に失敗しました", discord_token, discord_channel)
+        return False
+
+    print(f"✓ {len(posts)}件のレスを取得 (>>{posts[0].number}〜>>{posts[-1].number})")
+    all_posts = posts
+
+    # 前回送信したレスが変わっていなければ、新着レスだけを変換・送信する
+    delta = fingerprint.new_posts(posts) if fingerprint and thread_fingerprint.DELTA_MP3 else None
+    if delta is not None:
+        if not delta:
+            print(f"✓ 新着レスなし (>>{fingerprint.last_number} まで送信済み)")
+            metrics.count('threads_skipped', reason='no_new_posts')
+            _save_fingerprint(thread_id, thread, all_posts, all_posts[-1].number)
+            return True
+        print(f"✓ 新着 {len(delta)}件だけを送信します (>>{delta[0].number}〜>>{delta[-1].number})")
+        posts = delta
+
+    # MP3 の出力先
+    outdir = Path('outputs')
+    outdir.mkdir(exist_ok=True)
+
+    # 前回の実行が途中で終わっていれば、同じレス範囲で再開する
+    manifest = RunManifest.load(thread_id)
+    if manifest.post_range and not manifest.is_complete():
+        first, last = manifest.post_range
+        previous = posts.between(first, last)
+        if previous and manifest.matches(text_sha256(p.body for p in previous)):
+            posts = previous
+
+    post_range = [posts[0].number, posts[-1].number]
+    text_hash = text_sha256(p.body for p in posts)
+    if manifest.matches(text_hash) and manifest.post_range == post_range:
+        if manifest.is_complete():
+            print(f"✓ このレス範囲 (>>{post_range[0]}〜>>{post_range[1]}) は送信済みです")
+            _save_fingerprint(thread_id, thread, all_posts, post_range[1])
+            return True
+        print(f"前回の実行を再開します (>>{post_range[0]}〜>>{post_range[1]})")
+    else:
+        manifest.start(thread['url'], post_range, len(posts), text_hash)
+
+    # ファイル名はスレッドとレス範囲で決める（再実行時に同じファイルを再利用できる）
+    label = thread.get('slug') or 'valorant'
+    if thread.get('part') is not None:
+        label += f"_part{thread['part']}"
+    mp3_basename = outdir / f"{label}_{thread_id}_{post_range[0]}-{post_range[1]}.mp3"
+
+    # 変換とアップロードを並行して行う: パートが出来るたびにアップローダに渡し、
+    # 次のパートを変換している間に送信する
+    if delta:
+        message_caption = f"🎙️ {thread['name']} (新着{len(posts)}件 >>{post_range[0]}〜)"
+    else:
+        message_caption = f"🎙️ {thread['name']} (全{len(posts)}件)"
+    from discord_uploader import PartStreamUploader
+    from mp3_converter import posts_to_mp3
 
-    # 全レスをテキストに結合（段落区切り）
-    full_text = '\n\n'.join(posts)
-    print(f"\nMP3に変換中（{len(posts)}件のレス、{len(full_text)}文字）...")
-    success_convert, size = text_to_mp3(full_text, str(mp3_basename))
+    uploader = PartStreamUploader(discord_token, discord_channel, message_caption,
+                                  on_sent=manifest.record_sent)
 
-    if not success_convert:
-        print("⚠️ MP3変換に失敗しました")
-        send_discord_message("⚠️ MP3変換に失敗しました", discord_token, discord_channel)
-        return
+    def hand_over(part: dict) -> None:
+        if part['message_id']:
+            uploader.add_sent(part['index'], part['message_id'])
+        else:
+            uploader.submit(part['path'], part['index'])
 
-    # 生成されたMP3ファイルを検索して Discord に送信
-    base_name = str(mp3_basename).rsplit('.', 1)[0]
-    mp3_files = sorted(outdir.glob(f"{Path(base_name).name}*.mp3"))
+    started = time.perf_counter()
+    nothing_to_read = False
+    try:
+        parts = manifest.synthesized_parts()
+        if parts is not None:
+            print(f"\n✓ 変換済みの {len(parts)} パートを再利用します")
+            for part in parts:
+                hand_over(part)
+            success_convert = True
+        else:
+            total_chars = sum(len(p.body) for p in posts)
+            print(f"\nMP3に変換・送信中（{len(posts)}件のレス、{total_chars}文字）...")
+            # 保存するレス本文はそのまま、読み上げる時だけ笑い・スラング・絵文字などを正規化する
+            texts = clean_texts((p.body for p in posts), tts=True)
+            # 重複・短すぎるレスは読み上げない
+            post_filter = PostFilter() if POST_FILTER_ENABLED else None
+            if post_filter:
+                texts = post_filter.filter(texts)
+            # 読み上げるレスが1件も残らない場合（新着が「w」だけなど）は失敗ではなく、送るものがないだけ
+            texts = (text for text in texts if text.strip())
+            first = next(texts, None)
+            nothing_to_read = first is None
+            if nothing_to_read:
+                success_convert = True
+            else:
+                with metrics.span('stage', stage='synthesize'):
+                    success_convert, size = posts_to_mp3(
+                        itertools.chain([first], texts), str(mp3_basename),
+                        on_part=lambda path, index: hand_over(manifest.record_part(index, path)))
+            if post_filter:
+                print(f"  レスの間引き: {post_filter.report.summary()}")
+    finally:
+        # 変換中に例外が出ても、送り始めたパートを送り切ってアップローダのイベントループのスレッドを止める
+        # （watcher.py のように同じプロセスで次のスレッドを処理する場合にスレッドが残らないように）
+        with metrics.span('stage', stage='upload_finish'):
+            success_count, part_count = uploader.finish()
+    metrics.count('parts_uploaded', success_count)
+    print(f"  変換・送信時間: {time.perf_counter() - started:.1f}秒")
 
-    if not mp3_files:
-        print("⚠️ MP3ファイルが見つかりません")
-        send_discord_message("⚠️ MP3ファイルが見つかりません", discord_token, discord_channel)
-        return
+    if not success_convert:
+        print("⚠️ MP3変換に失敗しました（再実行すると続きから再開します）")
+        if notify:
+            _notify("⚠️ MP3変換に失敗しました", discord_token, discord_channel)
+        return False
+
+    manifest.truncate_parts(part_count)
+    manifest.complete('synthesize')
+    manifest.complete('upload', success_count == part_count)
+    manifest.complete('captions', uploader.captions_fixed)
+
+    if nothing_to_read:
+        print("\n✓ 読み上げるレスがありません（全て間引き・空）。送信せずに完了します")
+        metrics.count('threads_skipped', reason='nothing_to_read')
+        _save_fingerprint(thread_id, thread, all_posts, post_range[1])
+        return True
+    if success_count == part_count:
+        print(f"\n✓ Discord送信成功 ({success_count}/{part_count})")
+        _save_fingerprint(thread_id, thread, all_posts, post_range[1])
+    else:
+        print(f"\n✗ 一部の送信に失敗 ({success_count}/{part_count})（再実行すると未送信のパートだけ送ります）")
+    return success_count == part_count
 
-    print(f"\n✓ {len(mp3_files)} 個の MP3 ファイルを検出しました")
 
-    # 各MP3ファイルを Discord に送信
-    message_caption = f"🎙️ {thread['name']} (全{len(posts)}件)"
-    success_count = 0
+def main():
+    print("=" * 60)
+    print("したらば→Discord 自動送信システム")
+    print("=" * 60)
+
+    discord_token = os.getenv('DISCORD_BOT_TOKEN')
+    discord_channel = os.getenv('DISCORD_CHANNEL_ID')
+    if not discord_token or not discord_channel:
+        print("✗ エラー: DISCORD_BOT_TOKEN または DISCORD_CHANNEL_ID が設定されていません")
+        return
 
-    for idx, mp3_file in enumerate(mp3_files, 1):
-        file_caption = message_caption
-        if len(mp3_files) > 1:
-            file_caption += f" - Part {idx}/{len(mp3_files)}"
+    print("\nスレッド一覧を取得中...")
+    with metrics.span('stage', stage='find_thread'):
+        thread = get_latest_valorant_thread()
+    if not thread:
+        print("⚠️ 条件に合うVALORANTスレッドが見つかりませんでした")
+        # 可能なら Discord に送信
+        _notify("⚠️ 条件に合うVALORANTスレッドが見つかりませんでした", discord_token, discord_channel)
+        return
 
-        print(f"\nDiscordにMP3ファイルを送信中 ({idx}/{len(mp3_files)}): {mp3_file.name}")
-        success = send_discord_file(str(mp3_file), discord_token, discord_channel, message=file_caption)
+    print(f"✓ 対象スレッド: {thread['name']}")
 
-        if success:
-            print(f"✓ 送信成功")
-            success_count += 1
-        else:
-            print(f"✗ 送信失敗")
+    process_thread(thread, discord_token, discord_channel)
 
-    if success_count == len(mp3_files):
-        print(f"\n✓ Discord送信成功 ({success_count}/{len(mp3_files)})")
-    else:
-        print(f"\n✗ 一部の送信に失敗 ({success_count}/{len(mp3_files)})")
+    transport.print_connection_stats()
+    metrics.print_summary()
+    for path in metrics.export():
+        print(f"📊 計測レポート: {path}")
 
     print("\n" + "=" * 60)
     print("処理完了")
@@ -0,0 +1,230 @@
+"""
+計測（スパン・カウンタ）と実行レポート
+
+ネットワーク呼び出しやパイプラインの各段を span() で囲んで所要時間を、
+リトライ回数・通信量・キャッシュヒット数などを count() で数えます。
+実行の最後に export() を呼ぶと、METRICS_EXPORTERS に並べた形式で state/metrics/ に書き出します。
+
+出力形式（METRICS_EXPORTERS にカンマ区切りで指定。デフォルトは json）:
+ - json: run_<開始時刻>.json（スパンとカウンタの一覧）
+ - prometheus: shitaraba.prom（node_exporter の textfile collector 用）
+ - openmetrics: shitaraba.om（OpenMetrics テキスト形式）
+register_exporter(name, func) で出力形式を追加できます。
+
+関数:
+ - span(name, **labels): with で囲んだ処理の回数・合計時間・最大時間を記録する
+ - count(name, value=1, **labels): カウンタを増やす
+ - snapshot() -> dict: ここまでの計測結果
+ - export() -> List[str]: 計測結果を書き出し、書き出したファイルのパスを返す
+ - print_summary(): 時間のかかったスパンを表示する
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join('state', 'metrics'))
+METRICS_EXPORTERS = os.getenv('METRICS_EXPORTERS', 'json')
+METRIC_PREFIX = 'shitaraba'
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+_lock = threading.Lock()
+_spans: Dict[_Key, List[float]] = {}     # [回数, 合計秒, 最大秒]
+_counters: Dict[_Key, float] = {}
+_started = datetime.now(timezone.utc)
+_exporters: Dict[str, Callable[[dict], str]] = {}
+
+
+def _key(name: str, labels: Dict[str, object]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+@contextmanager
+def span(name: str, **labels) -> Iterator[None]:
+    """with の中の処理時間を記録する（例外で抜けた場合は span_errors も数える）"""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        count('span_errors', span=name, **labels)
+        raise
+    finally:
+        record_span(name, time.perf_counter() - started, **labels)
+
+
+def record_span(name: str, seconds: float, **labels) -> None:
+    """計測済みの時間をスパンとして記録する"""
+    key = _key(name, labels)
+    with _lock:
+        entry = _spans.get(key)
+        if entry is None:
+            _spans[key] = [1, seconds, seconds]
+        else:
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+
+
+def count(name: str, value: float = 1, **labels) -> None:
+    """カウンタを value だけ増やす（待ち時間の秒数なども足していける）"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def reset() -> None:
+    """計測結果を消して開始時刻をやり直す"""
+    global _started
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+        _started = datetime.now(timezone.utc)
+
+
+def snapshot() -> dict:
+    """
+    ここまでの計測結果
+
+    戻り値: {'started_at': ..., 'finished_at': ..., 'duration_seconds': 12.3,
+             'spans': [{'name': 'http_request', 'labels': {'host': ...}, 'count': 3,
+                        'total_seconds': 1.2, 'max_seconds': 0.6}, ...],
+             'counters': [{'name': 'http_bytes_received', 'labels': {...}, 'value': 1234}, ...]}
+    """
+    now = datetime.now(timezone.utc)
+    with _lock:
+        spans = [{'name': name, 'labels': dict(labels), 'count': int(entry[0]),
+                  'total_seconds': round(entry[1], 6), 'max_seconds': round(entry[2], 6)}
+                 for (name, labels), entry in sorted(_spans.items())]
+        counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(_counters.items())]
+    return {
+        'started_at': _started.isoformat(timespec='seconds'),
+        'finished_at': now.isoformat(timespec='seconds'),
+        'duration_seconds': round((now - _started).total_seconds(), 3),
+        'spans': spans,
+        'counters': counters,
+    }
+
+
+def register_exporter(name: str, func: Callable[[dict], str]) -> None:
+    """出力形式を追加する（func は snapshot() の結果を受け取り、書き出したパスを返す）"""
+    _exporters[name] = func
+
+
+def export(exporters: Optional[str] = None) -> List[str]:
+    """
+    計測結果を exporters（省略時は METRICS_EXPORTERS）の形式で書き出す
+
+    同じプロセスで何度呼んでも同じファイルを上書きする（watcher.py は巡回のたびに呼ぶ）。
+    戻り値: 書き出したファイルのパス
+    """
+    report = snapshot()
+    paths = []
+    for name in (exporters or METRICS_EXPORTERS).split(','):
+        name = name.strip()
+        if not name:
+            continue
+        func = _exporters.get(name)
+        if func is None:
+            print(f"警告: 未知の計測レポート形式: {name}")
+            continue
+        try:
+            paths.append(func(report))
+        except OSError as e:
+            print(f"警告: 計測レポートを書き出せません ({name}): {e}")
+    return paths
+
+
+def print_summary(limit: int = 10) -> None:
+    """合計時間の長いスパンを表示する"""
+    spans = sorted(snapshot()['spans'], key=lambda s: s['total_seconds'], reverse=True)[:limit]
+    if not spans:
+        return
+    print("\n所要時間の内訳:")
+    for s in spans:
+        labels = ', '.join(f"{k}={v}" for k, v in s['labels'].items())
+        print(f"  {s['name']}{f' ({labels})' if labels else ''}: "
+              f"{s['total_seconds']:.2f}秒 / {s['count']}回 (最大 {s['max_seconds']:.2f}秒)")
+
+
+def _write_atomic(path: str, text: str) -> str:
+    """一時ファイル→置き換えで書く（textfile collector が書きかけを読まないように）"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as fp:
+        fp.write(text)
+    os.replace(tmp, path)
+    return path
+
+
+def _export_json(report: dict) -> str:
+    name = f"run_{_started.strftime('%Y%m%dT%H%M%SZ')}.json"
+    return _write_atomic(os.path.join(METRICS_DIR, name), json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _metric_name(name: str) -> str:
+    return f"{METRIC_PREFIX}_" + ''.join(c if c.isalnum() or c == '_' else '_' for c in name)
+
+
+def _render_text(report: dict, openmetrics: bool) -> str:
+    """Prometheus テキスト形式（openmetrics=True なら OpenMetrics）で書く"""
+    lines: List[str] = []
+    families: Dict[str, List[str]] = {}
+    for c in report['counters']:
+        families.setdefault(c['name'], []).append(
+            f"{_metric_name(c['name'])}_total{_format_labels(c['labels'])} {_format_value(c['value'])}")
+    for name, samples in families.items():
+        family = _metric_name(name) + ('' if openmetrics else '_total')
+        lines.append(f"# TYPE {family} counter")
+        lines.extend(samples)
+
+    if report['spans']:
+        summary = _metric_name('span_seconds')
+        lines.append(f"# TYPE {summary} summary")
+        for s in report['spans']:
+            labels = _format_labels({'span': s['name'], **s['labels']})
+            lines.append(f"{summary}_count{labels} {s['count']}")
+            lines.append(f"{summary}_sum{labels} {_format_value(s['total_seconds'])}")
+        gauge = _metric_name('span_max_seconds')
+        lines.append(f"# TYPE {gauge} gauge")
+        for s in report['spans']:
+            lines.append(f"{gauge}{_format_labels({'span': s['name'], **s['labels']})} {_format_value(s['max_seconds'])}")
+
+    gauge = _metric_name('run_duration_seconds')
+    lines.append(f"# TYPE {gauge} gauge")
+    lines.append(f"{gauge} {_format_value(report['duration_seconds'])}")
+    if openmetrics:
+        lines.append('# EOF')
+    return '\n'.join(lines) + '\n'
+
+
+def _export_prometheus(report: dict) -> str:
+    return _write_atomic(os.path.join(METRICS_DIR, f"{METRIC_PREFIX}.prom"), _render_text(report, False))
+
+
+def _export_openmetrics(report: dict) -> str:
+    return _write_atomic(os.path.join(METRICS_DIR, f"{METRIC_PREFIX}.om"), _render_text(report, True))
+
+
+register_exporter('json', _export_json)
+register_exporter('prometheus', _export_prometheus)
+register_exporter('openmetrics', _export_openmetrics)
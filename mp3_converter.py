@@ -2,193 +2,434 @@
 テキストをMP3音声ファイルに変換するモジュール
 
 gTTS (Google Text-to-Speech) を使用して日本語テキストを自然な音声で MP3 に変換します。
-大量テキストはチャンクに分割して複数のMP3を生成し、レート制限を回避します。
-Discordのファイルサイズ上限(25MB)も監視します。
+音声合成は tts_backends のバックエンド（gtts / local / stub）を TTS_BACKEND で切り替えられます。
+レス→セグメント（文）→音声→パートファイルの順に流れるストリーミングパイプラインで、
+各段の間はキューで上限を設けているため、スレッドの大きさに関係なくメモリ使用量は一定です。
+セグメントはワーカープールで並列に変換し、全ワーカー共通のトークンバケットで
+リクエスト頻度を制御します（429 を受けたら全体の速度を落として待機）。
+変換済みのセグメント（レス・文）はディスクにキャッシュし、再実行時は再利用します。
+完成したパートファイルは後続の変換を待たずにコールバックで受け取れます。
+gTTS のリクエストは transport モジュールの keep-alive セッションで送ります。
+パートファイルは MP3 フレーム境界で切り、Discord のアップロード上限ぎりぎりまで詰めます。
+その前にセグメント間の余分な無音を取り除き、必要なら ffmpeg で再エンコードします（mp3_postprocess）。
 """
 import os
-import time
-import warnings
-from typing import Optional
-from urllib3.exceptions import InsecureRequestWarning
-import urllib3
-
-# SSL警告を抑制（ローカルシステムのSSL証明書問題対策）
-warnings.filterwarnings("ignore", message="Unverified HTTPS request is being made")
-warnings.simplefilter('ignore', InsecureRequestWarning)
-urllib3.disable_warnings(InsecureRequestWarning)
-
-# グローバルにSSL検証をスキップ
-import ssl
-try:
-    _create_unverified_https_context = ssl._create_unverified_context
-except AttributeError:
-    pass
-else:
-    ssl._create_default_https_context = _create_unverified_https_context
-
-try:
-    from gtts import gTTS
-except ImportError:
-    gTTS = None
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Union
+import metrics
+import mp3_postprocess
+from mp3_frames import iter_frames
+from tts_backends import GTTSBackend, LocalBackend, StubBackend, TokenBucket, TTSBackend
+from tts_cache import AudioCache
 
 
 # Discordのファイルサイズ上限（目安）
 DISCORD_MAX_SIZE = 25 * 1024 * 1024  # 25MB
 LANGUAGE = "ja"  # 日本語
+TTS_BACKEND = os.getenv('TTS_BACKEND', 'gtts')  # 'gtts' / 'local'（Open JTalk, espeak-ng）/ 'stub'
 
-# テキスト分割用パラメータ（文字数単位）
-# gTTS は内部で 100文字ごとに自動分割するため、大きなチャンクでも問題なし
-CHUNK_SIZE = 10000  # 1チャンク = 10000文字（分割数を削減して高速化）
-RETRY_DELAY = 3     # リトライ間隔（秒）
+# パート分割用パラメータ
+# パートファイルは MP3 フレーム境界で切り、max_size_mb からこの余裕分を引いたサイズまで詰める
+PART_MARGIN = 256 * 1024  # multipart のヘッダ等の余裕（bytes）
+RETRY_DELAY = 3     # リトライ間隔の基準値（秒）。429 時は指数的に延ばす
+MAX_RETRY_DELAY = 60  # リトライ間隔の上限（秒）
 MAX_RETRIES = 5     # 最大リトライ回数を増加
 TLD = 'co.jp'       # 日本語ボイスを優先
 
-
-def text_to_mp3(text: str, output_file: str, max_size_mb: int = 25) -> tuple[bool, Optional[int]]:
+# 並列変換用パラメータ
+MAX_WORKERS = 4            # 同時に変換するセグメント数
+PIPELINE_DEPTH = 16        # 先読みするセグメント数（メモリに載る音声の上限）
+REQUESTS_PER_SECOND = 3.0  # gTTS の内部リクエスト（約100文字ごと）の上限レート
+MIN_REQUESTS_PER_SECOND = 0.5  # 429 を受けて落とす下限レート
+RATE_BURST = 5             # まとめて送ってよいリクエスト数
+
+# 音声キャッシュ（セグメント単位、内容アドレス）
+SEGMENT_SIZE = 500         # キャッシュ単位のセグメントの最大文字数
+TTS_CACHE_DIR = os.path.join('cache', 'tts')
+TTS_CACHE_MAX_MB = 500     # キャッシュ容量の上限（超えたら古い順に削除）
+_audio_cache: Optional[AudioCache] = None
+_gtts_limiter: Optional[TokenBucket] = None
+_init_lock = threading.Lock()
+
+# 文の区切り: 句読点の連続、または改行の連続までを1文とする
+_PUNCTUATION = '。！？!?'
+_TERMINATORS = _PUNCTUATION + '\n'
+
+
+def text_to_mp3(text: str, output_file: str, max_size_mb: int = 25,
+                workers: int = MAX_WORKERS,
+                on_part: Optional[Callable[[str, int], None]] = None,
+                backend: Union[str, TTSBackend, None] = None) -> tuple[bool, Optional[int]]:
     """
-    テキストをMP3ファイルに変換（大量テキストはチャンク分割対応）
+    テキストをMP3ファイルに変換（ストリーミング・並列変換対応）
+
+    テキストは '\n\n' 区切りのレスとして扱い、レス→セグメント→音声→パートファイルの
+    パイプラインで変換する。パートファイルは出来た順に on_part に渡されるので、
+    後続のパートを変換中でもアップロードを始められる。
 
     引数:
     - text: 変換するテキスト
-    - output_file: 出力先ファイルパス（複数生成時は _part1.mp3 等に自動分割）
-    - max_size_mb: 最大ファイルサイズ警告値（MB）
+    - output_file: 出力先ファイルパス（実際には _part1.mp3, _part2.mp3 ... を生成）
+    - max_size_mb: 1パートファイルの最大サイズ（MB）。これを超えないようフレーム境界で分割する
+    - workers: 同時に変換するセグメント数（1 で逐次変換）
+    - on_part: パートファイルが完成するたびに (ファイルパス, パート番号) で呼ばれる
+    - backend: TTS バックエンド名（'gtts' / 'local' / 'stub'）またはインスタンス。省略時は TTS_BACKEND
 
     戻り値: (成功フラグ, ファイルサイズ(bytes))
     失敗時は (False, None) を返す
     """
-    if gTTS is None:
-        print("エラー: gTTS がインストールされていません")
-        print("  pip install gTTS でインストールしてください")
-        return False, None
-
     if not text or not text.strip():
         print("エラー: 空のテキストです")
         return False, None
+    return posts_to_mp3(text.split('\n\n'), output_file, max_size_mb, workers, on_part, backend)
+
+
+def posts_to_mp3(posts: Iterable[str], output_file: str, max_size_mb: int = 25,
+                 workers: int = MAX_WORKERS,
+                 on_part: Optional[Callable[[str, int], None]] = None,
+                 backend: Union[str, TTSBackend, None] = None) -> tuple[bool, Optional[int]]:
+    """
+    レス本文のイテラブルをMP3パートファイルに変換する（text_to_mp3 の本体）
 
-    # テキストをチャンクに分割
-    chunks = _split_text_into_chunks(text, CHUNK_SIZE)
-    print(f"テキストを {len(chunks)} 個のチャンクに分割します")
-
-    if len(chunks) == 1:
-        # 単一ファイル生成
-        return _convert_chunk(chunks[0], output_file, max_size_mb)
-    else:
-        # 複数ファイル生成
-        base_name, ext = os.path.splitext(output_file)
-        total_size = 0
-        success = True
-
-        for idx, chunk in enumerate(chunks, 1):
-            chunk_file = f"{base_name}_part{idx}{ext}"
-            result, size = _convert_chunk(chunk, chunk_file, max_size_mb)
-            if result and size:
-                total_size += size
-            else:
-                success = False
-                print(f"警告: チャンク {idx} の生成に失敗しました")
+    各段はキューで上限を設けているので、スレッドがどれだけ大きくても
+    メモリに載る音声は PIPELINE_DEPTH 個のセグメント分だけになる。
 
+    戻り値: (成功フラグ, 合計ファイルサイズ(bytes))
+    """
+    try:
+        tts = get_tts_backend(backend)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        return False, None
+    if not tts.available():
+        return False, None
+
+    workers = max(1, workers)
+    print(f"{workers} 並列でストリーミング変換します（TTS: {tts.name}）")
+    writer = _PartWriter(output_file, max_size_mb * 1024 * 1024 - PART_MARGIN, on_part)
+    success = False
+    try:
+        success = _run_pipeline(_iter_segments(posts), writer, workers, tts)
+    finally:
+        # 失敗した場合、書きかけの最後のパートは on_part に渡さず捨てる
+        # （再開時に中身の違う同じ番号のパートが作られ、二重に送信されるのを防ぐ）
         if success:
-            print(f"\n✓ 全 {len(chunks)} チャンクの MP3 生成完了")
-            print(f"  合計ファイルサイズ: {total_size / (1024 * 1024):.2f} MB")
-            return True, total_size
+            writer.close()
         else:
-            return False, None
+            writer.abort()
 
+    cache = _get_cache()
+    print(f"  音声キャッシュ: ヒット {cache.hits} / ミス {cache.misses}")
+    if not success:
+        return False, None
+    if not writer.parts:
+        print("エラー: 空のテキストです")
+        return False, None
 
-def _split_text_into_chunks(text: str, chunk_size: int) -> list[str]:
-    """
-    テキストを指定サイズのチャンクに分割（句点で区切る）
+    total_size = sum(size for _, size in writer.parts)
+    print(f"\n✓ 全 {len(writer.parts)} パートの MP3 生成完了")
+    print(f"  合計ファイルサイズ: {total_size / (1024 * 1024):.2f} MB")
+    return True, total_size
 
-    引数:
-    - text: 分割するテキスト
-    - chunk_size: 目標チャンクサイズ（文字数）
 
-    戻り値: チャンクのリスト
+class _PartWriter:
     """
-    if len(text) <= chunk_size:
-        return [text]
+    パイプラインの最終段: 音声をフレーム単位でパートファイルに順に書き出す
 
-    chunks = []
-    current_chunk = ""
+    MP3 フレームヘッダを読んでフレーム境界で切り、各パートが part_max_bytes を
+    超えないように詰める（再エンコードなし）。書き出す前にセグメントごとの
+    Xing タグ・余分な無音のフレームを取り除く（mp3_postprocess.trim_frames）。
+    パートを閉じたら on_part に渡す（再エンコードする場合は PartPostProcessor 経由）。
+    """
 
-    # 句点で分割（。で区切る）
-    sentences = text.split("。")
+    def __init__(self, output_file: str, part_max_bytes: int,
+                 on_part: Optional[Callable[[str, int], None]] = None,
+                 trim: bool = mp3_postprocess.TRIM_SILENCE):
+        self.base_name, self.ext = os.path.splitext(output_file)
+        self.part_max_bytes = part_max_bytes
+        self.on_part = on_part
+        self.trim = trim
+        self.parts: list[tuple[str, int]] = []
+        self._post = mp3_postprocess.PartPostProcessor(on_part) if mp3_postprocess.reencode_enabled() else None
+        self._fp = None
+        self._path = ''
+        self._size = 0
+        self._seconds = 0.0
+        self._dropped_bytes = 0
+        self._dropped_seconds = 0.0
+
+    def write(self, audio: bytes) -> None:
+        if self.trim:
+            frames, dropped = mp3_postprocess.trim_frames(audio)
+            self._dropped_bytes += sum(f.length for f in dropped)
+            self._dropped_seconds += sum(f.samples / f.sample_rate for f in dropped)
+        else:
+            frames = iter_frames(audio)
+        run_start = run_end = 0
+        for frame in frames:
+            if frame.offset != run_end or (self._size + (run_end - run_start) + frame.length > self.part_max_bytes):
+                self._write_run(audio, run_start, run_end)
+                if self._size + frame.length > self.part_max_bytes:
+                    self.close_part()
+                run_start = frame.offset
+            run_end = frame.offset + frame.length
+            self._seconds += frame.samples / frame.sample_rate
+        self._write_run(audio, run_start, run_end)
+
+    def _write_run(self, audio: bytes, start: int, end: int) -> None:
+        """連続したフレームの範囲をまとめて現在のパートに書き込む"""
+        if end <= start:
+            return
+        if self._fp is None:
+            self._path = f"{self.base_name}_part{len(self.parts) + 1}{self.ext}"
+            self._fp = open(self._path, 'wb')
+        self._fp.write(memoryview(audio)[start:end])
+        self._size += end - start
+
+    def close_part(self) -> None:
+        if self._fp is None:
+            return
+        self._fp.close()
+        self._fp = None
+        size, self._size = self._size, 0
+        report = mp3_postprocess.PartReport(self._path, size + self._dropped_bytes,
+                                            self._seconds + self._dropped_seconds, size, self._seconds)
+        self._seconds = self._dropped_seconds = 0.0
+        self._dropped_bytes = 0
+
+        print(f"✓ MP3生成完了: {self._path}")
+        print(f"  ファイルサイズ: {size / (1024 * 1024):.2f} MB ({size} bytes)")
+
+        self.parts.append((self._path, size))
+        metrics.count('mp3_parts')
+        metrics.count('mp3_bytes_written', size)
+        if self._post:
+            self._post.submit(report, len(self.parts))
+            return
+        mp3_postprocess.print_report(report)
+        if self.on_part:
+            self.on_part(self._path, len(self.parts))
+
+    def close(self) -> None:
+        """最後のパートを閉じ、再エンコード中のパートを待つ（parts のサイズは再エンコード後の値になる）"""
+        self.close_part()
+        self._wait_post()
+
+    def abort(self) -> None:
+        """書きかけのパートを on_part に渡さずに削除し、それまでに閉じたパートの後処理を待つ"""
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+            print(f"  書きかけのパートを破棄しました: {self._path}")
+        self._wait_post()
+
+    def _wait_post(self) -> None:
+        if self._post:
+            reports = self._post.close()
+            self.parts = [(r.path, r.bytes_out) for r in reports]
+
+
+def _run_pipeline(segments: Iterable[str], writer: _PartWriter, workers: int, backend: TTSBackend) -> bool:
+    """
+    セグメント→音声の変換をワーカープールで行い、元の順番で writer に渡す
 
-    for sentence in sentences:
-        if not sentence.strip():
-            continue
+    セグメントは backend.batch_size 個ずつまとめて変換する（gTTS は1個ずつ）。
+    先読みするセグメント数を PIPELINE_DEPTH に制限し、先頭の変換が終わるまで
+    次のセグメントを取り出さない（背圧）ので、メモリ使用量は一定に保たれる。
+    """
+    cache = _get_cache()
+    depth = max(PIPELINE_DEPTH, workers, backend.batch_size)
+    pending: deque = deque()
+    pending_segments = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        try:
+            for batch in _iter_batches(segments, backend.batch_size):
+                pending.append(executor.submit(_load_batch, batch, backend, cache))
+                pending_segments += len(batch)
+                while pending_segments >= depth:
+                    drained = _drain_one(pending, writer)
+                    if drained is None:
+                        return False
+                    pending_segments -= drained
+            while pending:
+                if _drain_one(pending, writer) is None:
+                    return False
+            return True
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def _iter_batches(segments: Iterable[str], batch_size: int) -> Iterator[List[str]]:
+    batch: List[str] = []
+    for segment in segments:
+        batch.append(segment)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _drain_one(pending: deque, writer: _PartWriter) -> Optional[int]:
+    """先頭のバッチの音声を書き出す（戻り値: 書き出したセグメント数。失敗時は None）"""
+    audios = pending.popleft().result()
+    if any(audio is None for audio in audios):
+        print(f"エラー: ファイル生成に失敗しました")
+        return None
+    for audio in audios:
+        writer.write(audio)
+    return len(audios)
+
+
+def _load_batch(batch: List[str], backend: TTSBackend, cache: AudioCache) -> List[Optional[bytes]]:
+    """キャッシュ済みのセグメントはそれを使い、残りをまとめてバックエンドで変換してキャッシュに保存する"""
+    keys = [backend.cache_key(segment) for segment in batch]
+    audios = [cache.get(key) for key in keys]
+    missing = [i for i, audio in enumerate(audios) if audio is None]
+    if missing:
+        texts = [batch[i] for i in missing]
+        with metrics.span('tts_synthesize', backend=backend.name):
+            results = backend.synthesize_batch(texts)
+        metrics.count('tts_segments', len(texts), backend=backend.name)
+        metrics.count('tts_chars', sum(map(len, texts)), backend=backend.name)
+        for i, audio in zip(missing, results):
+            audios[i] = audio
+            if audio is not None:
+                cache.put(keys[i], audio)
+    return audios
+
+
+def _iter_text_chunks(text: str, chunk_size: int) -> Iterator[str]:
+    """
+    テキストを chunk_size 文字以下のチャンクに分けて順に返す（線形時間）
 
-        sentence_with_period = sentence + "。"
+    - 文の境界（レス区切り・句読点・改行）で区切り、入る限り1チャンクに詰める
+    - chunk_size を超える1文は、読点・空白の位置（なければ chunk_size ちょうど）で強制的に切る
+    - 空白だけのチャンクは返さない
 
-        # チャンクが満杯の場合は新規チャンクへ
-        if len(current_chunk) + len(sentence_with_period) > chunk_size and current_chunk:
-            chunks.append(current_chunk)
-            current_chunk = sentence_with_period
+    文を先頭から1つずつ数えず、チャンクに入る範囲の中で最後の文の終わりを後ろから探す
+    （部分文字列を作り直さず、text 上の位置だけを進める）。
+    """
+    start = 0
+    while start < len(text):
+        limit = start + chunk_size
+        if limit >= len(text):
+            end = len(text)
         else:
-            current_chunk += sentence_with_period
+            end = _last_sentence_end(text, start, limit)
+            if end < 0:
+                # 1文が chunk_size を超えるので強制的に切る
+                end = _hard_cut(text, start, limit)
+        chunk = text[start:end]
+        if not chunk.isspace():
+            yield chunk
+        start = end
 
-    # 残りのテキストを追加
-    if current_chunk:
-        chunks.append(current_chunk)
 
-    return chunks
+def _terminator_class(char: str) -> int:
+    """文の区切りの種類（0: 区切りでない、1: 句読点、2: 改行）"""
+    if char == '\n':
+        return 2
+    return 1 if char in _PUNCTUATION else 0
 
 
-def _convert_chunk(text: str, output_file: str, max_size_mb: int, retry_count: int = 0) -> tuple[bool, Optional[int]]:
+def _last_sentence_end(text: str, start: int, limit: int) -> int:
+    """
+    start < end <= limit の範囲で最後の文の終わり（なければ -1、limit < len(text) のこと）
+
+    文の終わりは句読点の連続・改行の連続の直後（連続が limit をまたぐ場合はその手前を探す）。
     """
-    単一テキストをMP3に変換（リトライ対応）
+    while True:
+        last = max(text.rfind(mark, start, limit) for mark in _TERMINATORS)
+        if last < 0:
+            return -1
+        kind = _terminator_class(text[last])
+        if _terminator_class(text[last + 1]) != kind:
+            return last + 1
+        # 連続が limit をまたいでいるので、連続の先頭より前を探す
+        limit = start + len(text[start:last].rstrip('\n' if kind == 2 else _PUNCTUATION))
+
+
+def _hard_cut(text: str, start: int, end: int) -> int:
+    """長すぎる1文の text[start:end] を切る位置（後半にある読点・空白の直後、なければ end）"""
+    for mark in ('、', '，', ',', ' ', '　'):
+        pos = text.rfind(mark, start + (end - start) // 2, end)
+        if pos >= 0:
+            return pos + 1
+    return end
+
+
+def _split_text_into_chunks(text: str, chunk_size: int) -> list[str]:
+    """
+    テキストを指定サイズのチャンクに分割（レス区切り・句読点・改行で区切る）
 
     引数:
-    - text: 変換するテキスト
-    - output_file: 出力先ファイルパス
-    - max_size_mb: 最大ファイルサイズ警告値（MB）
-    - retry_count: 現在のリトライ回数（内部用）
+    - text: 分割するテキスト
+    - chunk_size: 最大チャンクサイズ（文字数）
 
-    戻り値: (成功フラグ, ファイルサイズ(bytes))
+    戻り値: チャンクのリスト（連結すると、空白だけのチャンクを除いて元のテキストに戻る）
     """
-    try:
-        # gTTS でテキスト→音声変換
-        # slow=False で通常速度（最速）、tld='co.jp' で日本語ボイスを優先
-        tts = gTTS(text=text, lang=LANGUAGE, slow=False, tld=TLD, timeout=8)
-        tts.save(output_file)
-
-        # ファイルサイズを確認
-        if os.path.exists(output_file):
-            size = os.path.getsize(output_file)
-            size_mb = size / (1024 * 1024)
-            print(f"✓ MP3生成完了: {output_file}")
-            print(f"  ファイルサイズ: {size_mb:.2f} MB ({size} bytes)")
-
-            if size > max_size_mb * 1024 * 1024:
-                print(f"⚠️  警告: ファイルサイズが {max_size_mb}MB を超えています")
-                print(f"   Discordで送信できない可能性があります")
-                return True, size
-
-            return True, size
-        else:
-            print(f"エラー: ファイル生成に失敗しました")
-            return False, None
-
-    except (KeyboardInterrupt, TimeoutError) as e:
-        # SSL 証明書読み込みのハングやタイムアウトの場合はリトライ
-        if retry_count < MAX_RETRIES:
-            print(f"⚠️  SSL 証明書エラー検出。{RETRY_DELAY}秒後にリトライ... ({retry_count + 1}/{MAX_RETRIES})")
-            time.sleep(RETRY_DELAY)
-            return _convert_chunk(text, output_file, max_size_mb, retry_count + 1)
+    return list(_iter_text_chunks(text, chunk_size))
+
+
+def _iter_segments(posts: Iterable[str]) -> Iterator[str]:
+    """
+    レスをキャッシュ単位のセグメント（レス単位、長いレスは句点で分割）に分けて順に返す
+
+    同じレス・同じ文は同じセグメントになるので、キャッシュが効きやすい
+    """
+    for post in posts:
+        post = post.strip()
+        if not post:
+            continue
+        if len(post) <= SEGMENT_SIZE:
+            yield post
         else:
-            print(f"エラー: _convert_chunk(): {type(e).__name__}: SSL 証明書エラーが解決できません")
-            return False, None
-
-    except Exception as e:
-        error_msg = str(e)
-        # 429 エラー（レート制限）の場合はリトライ
-        if "429" in error_msg and retry_count < MAX_RETRIES:
-            print(f"⚠️  レート制限検出。{RETRY_DELAY}秒後に リトライ... ({retry_count + 1}/{MAX_RETRIES})")
-            time.sleep(RETRY_DELAY)
-            return _convert_chunk(text, output_file, max_size_mb, retry_count + 1)
-
-        print(f"エラー: _convert_chunk(): {e}")
-        return False, None
+            yield from _split_text_into_chunks(post, SEGMENT_SIZE)
+
+
+def get_tts_backend(backend: Union[str, TTSBackend, None] = None) -> TTSBackend:
+    """
+    TTS バックエンドを返す（名前を渡した場合はこのモジュールの設定で作る）
+
+    例外: 未知のバックエンド名なら ValueError
+    """
+    if isinstance(backend, TTSBackend):
+        return backend
+    name = backend or TTS_BACKEND
+    if name == 'gtts':
+        return GTTSBackend(lang=LANGUAGE, tld=TLD, limiter=_get_gtts_limiter(),
+                           max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY)
+    if name == 'local':
+        return LocalBackend(lang=LANGUAGE)
+    if name == 'stub':
+        return StubBackend()
+    raise ValueError(f"未知の TTS バックエンド: {name}")
+
+
+def _get_gtts_limiter() -> TokenBucket:
+    """プロセス全体で共有する gTTS のトークンバケット（複数スレッドを同時に変換しても合計レートを守る）"""
+    global _gtts_limiter
+    with _init_lock:
+        if _gtts_limiter is None:
+            _gtts_limiter = TokenBucket(REQUESTS_PER_SECOND, RATE_BURST, MIN_REQUESTS_PER_SECOND,
+                                        RETRY_DELAY, MAX_RETRY_DELAY)
+        return _gtts_limiter
+
+
+def _get_cache() -> AudioCache:
+    global _audio_cache
+    with _init_lock:
+        if _audio_cache is None:
+            _audio_cache = AudioCache(TTS_CACHE_DIR, TTS_CACHE_MAX_MB * 1024 * 1024)
+        return _audio_cache
 
 
 if __name__ == '__main__':
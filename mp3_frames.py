@@ -0,0 +1,190 @@
+"""
+MP3 フレームの解析ユーティリティ
+
+デコードや再エンコードをせずに、フレームヘッダだけを読んでフレーム境界を求めます。
+パートファイルの分割（フレーム境界で切る）や長さの計算に使います。
+
+関数:
+ - parse_header(data, offset) -> FrameHeader | None
+ - iter_frames(data) -> Iterator[FrameHeader]
+ - silent_frames(count) -> bytes
+ - global_gains(data, frame) -> tuple[int, ...]: フレームの音量の目安（無音の判定用）
+ - main_data_begin(data, frame) -> int: 前のフレームから借りているバイト数（ビットリザーバ）
+ - is_info_frame(data, frame) -> bool: LAME の Xing / Info タグのフレームか
+"""
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+
+# ビットレート表（kbps）: [バージョン(1=MPEG1, 2=MPEG2/2.5)][レイヤ] -> インデックス順
+_BITRATES = {
+    (1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+# サンプリングレート表: ヘッダのバージョンビット -> インデックス順
+_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG1
+    2: (22050, 24000, 16000),  # MPEG2
+    0: (11025, 12000, 8000),   # MPEG2.5
+}
+
+
+class FrameHeader(NamedTuple):
+    """1フレーム分の情報（offset はデータ先頭からの位置）"""
+    offset: int
+    length: int
+    mpeg1: bool
+    layer: int
+    sample_rate: int
+    samples: int
+    channels: int
+    crc: bool = False
+
+
+def parse_header(data: bytes, offset: int) -> Optional[FrameHeader]:
+    """offset の位置にある4バイトを MP3 フレームヘッダとして解析する（不正なら None）"""
+    if offset + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[offset], data[offset + 1], data[offset + 2], data[offset + 3]
+    if b0 != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+
+    version_bits = (b1 >> 3) & 0x03
+    layer_bits = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    bitrate = _BITRATES[(1 if mpeg1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version_bits][rate_index]
+    padding = (b2 >> 1) & 0x01
+
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+        samples = 384
+    elif layer == 2 or mpeg1:
+        length = 144 * bitrate // sample_rate + padding
+        samples = 1152
+    else:
+        # MPEG2/2.5 レイヤ3 は1フレームのサンプル数が半分
+        length = 72 * bitrate // sample_rate + padding
+        samples = 576
+
+    channels = 1 if (b3 >> 6) == 3 else 2
+    crc = not (b1 & 0x01)
+    return FrameHeader(offset, length, mpeg1, layer, sample_rate, samples, channels, crc)
+
+
+def _skip_id3v2(data: bytes, offset: int) -> int:
+    """offset に ID3v2 タグがあれば読み飛ばした位置を返す"""
+    if data[offset:offset + 3] != b'ID3' or offset + 10 > len(data):
+        return offset
+    size = 0
+    for b in data[offset + 6:offset + 10]:
+        size = (size << 7) | (b & 0x7F)
+    footer = 10 if data[offset + 5] & 0x10 else 0
+    return offset + 10 + size + footer
+
+
+def iter_frames(data: bytes) -> Iterator[FrameHeader]:
+    """
+    データ中の MP3 フレームを先頭から順に返す
+
+    ID3v2 タグや途中のゴミは読み飛ばし、次の同期ワードから再開する。
+    末尾で切れているフレームは返さない。
+    """
+    offset = 0
+    size = len(data)
+    while offset + 4 <= size:
+        skipped = _skip_id3v2(data, offset)
+        if skipped != offset:
+            offset = skipped
+            continue
+        header = parse_header(data, offset)
+        if header is None or offset + header.length > size:
+            if header is not None:
+                break
+            # 同期ワードを探し直す
+            offset = data.find(b'\xFF', offset + 1)
+            if offset < 0:
+                break
+            continue
+        yield header
+        offset += header.length
+
+
+def duration_seconds(data: bytes) -> float:
+    """フレームのサンプル数から再生時間（秒）を計算する"""
+    return sum(f.samples / f.sample_rate for f in iter_frames(data))
+
+
+# gTTS と同じ形式（MPEG2 レイヤ3 / 24kHz / 32kbps / モノラル）の無音フレーム（96バイト、24ms）
+SILENT_FRAME = b'\xff\xf3\x44\xc0' + bytes(92)
+
+
+def silent_frames(count: int) -> bytes:
+    """無音フレームを count 個並べた MP3 データ"""
+    return SILENT_FRAME * count
+
+
+def _side_info(data: bytes, frame: FrameHeader) -> Tuple[int, int]:
+    """レイヤ3のサイド情報の (開始位置, バイト数)"""
+    start = frame.offset + 4 + (2 if frame.crc else 0)
+    if frame.mpeg1:
+        return start, 17 if frame.channels == 1 else 32
+    return start, 9 if frame.channels == 1 else 17
+
+
+def main_data_begin(data: bytes, frame: FrameHeader) -> int:
+    """
+    レイヤ3のフレームが前のフレームに置いた音声データ（ビットリザーバ）を何バイト使うか
+
+    0 でないフレームは直前のフレームのバイトを参照するので、その前のフレームを取り除くと壊れる。
+    """
+    if frame.layer != 3:
+        return 0
+    start, _ = _side_info(data, frame)
+    if frame.mpeg1:
+        return (data[start] << 1) | (data[start + 1] >> 7)
+    return data[start]
+
+
+def global_gains(data: bytes, frame: FrameHeader) -> Tuple[int, ...]:
+    """
+    レイヤ3のフレームの各グラニュール・チャンネルの global_gain（量子化の刻み幅）
+
+    デコードせずに読める音量の目安で、静かなフレームほど小さい
+    （gTTS の音声では発話中 150〜170、無音部分 125 前後）。レイヤ3以外は空のタプル。
+    """
+    if frame.layer != 3:
+        return ()
+    start, size = _side_info(data, frame)
+    bits = int.from_bytes(data[start:start + size], 'big')
+    total = size * 8
+    if frame.mpeg1:
+        # main_data_begin(9) + private_bits(5/3) + scfsi(4 x ch)、グラニュール2つ x チャンネル 59 ビット
+        position, entry, granules = (18 if frame.channels == 1 else 20), 59, 2
+    else:
+        # main_data_begin(8) + private_bits(1/2)、グラニュール1つ x チャンネル 63 ビット
+        position, entry, granules = (9 if frame.channels == 1 else 10), 63, 1
+    gains = []
+    for i in range(granules * frame.channels):
+        # part2_3_length(12) + big_values(9) の次が global_gain(8)
+        offset = position + i * entry + 21
+        gains.append((bits >> (total - offset - 8)) & 0xFF)
+    return tuple(gains)
+
+
+def is_info_frame(data: bytes, frame: FrameHeader) -> bool:
+    """LAME などが先頭に置く Xing / Info タグのフレーム（音声を含まない）か"""
+    if frame.layer != 3:
+        return False
+    start, size = _side_info(data, frame)
+    return data[start + size:start + size + 4] in (b'Xing', b'Info')
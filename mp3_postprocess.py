@@ -0,0 +1,193 @@
+"""
+MP3 パートファイルの後処理
+
+1. フレーム単位の整理（再エンコードなし。_PartWriter がセグメントの音声を書き出すときに行う）
+   - セグメントごとに入っている Xing / Info タグのフレームを取り除く
+     （パートの途中にあると、プレイヤーが再生時間を1セグメント分と誤表示する）
+   - セグメント末尾の無音を SILENCE_KEEP_SECONDS まで詰める
+   - セグメント先頭の無音も、ビットリザーバを壊さない範囲で取り除く
+   レイヤ3のフレームは前のフレームのバイトを参照する（ビットリザーバ）ので、セグメントの途中の
+   無音は再エンコードしないと削れない。末尾のフレームは後ろから参照されないので安全に削れる。
+2. 再エンコード（任意。MP3_SPEED / MP3_BITRATE を指定し、ffmpeg がある場合だけ）
+   パートファイルが出来るたびに ffmpeg で速度変更・ビットレート変更をする。
+   CPU コア数の ffmpeg プロセスを同時に走らせ、パートの順番どおりに on_part に渡す。
+
+パートごとに後処理の前後の再生時間・サイズを PartReport に集計して表示します。
+
+環境変数:
+ - MP3_TRIM_SILENCE=0: フレーム単位の整理をしない
+ - MP3_SPEED=1.25: 再生速度（ffmpeg の atempo）
+ - MP3_BITRATE=24k: 再エンコードのビットレート
+"""
+import math
+import os
+import shutil
+import subprocess
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import metrics
+from mp3_frames import FrameHeader, duration_seconds, global_gains, is_info_frame, iter_frames, main_data_begin
+
+
+TRIM_SILENCE = os.getenv('MP3_TRIM_SILENCE', '1') != '0'
+SILENCE_MAX_GAIN = 130       # global_gain がこれ以下のフレームを無音とみなす
+SILENCE_KEEP_SECONDS = 0.3   # セグメント末尾に残す無音（レス・文の間の間）
+MP3_SPEED = float(os.getenv('MP3_SPEED', '1.0'))
+MP3_BITRATE = os.getenv('MP3_BITRATE', '')
+REENCODE_WORKERS = os.cpu_count() or 1
+REENCODE_TIMEOUT = 600       # 1パートの再エンコードの上限（秒）
+
+
+@dataclass
+class PartReport:
+    """1パートの後処理の前後の再生時間・サイズ"""
+    path: str
+    bytes_in: int
+    seconds_in: float
+    bytes_out: int
+    seconds_out: float
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.bytes_in - self.bytes_out
+
+    @property
+    def saved_seconds(self) -> float:
+        return self.seconds_in - self.seconds_out
+
+    def summary(self) -> str:
+        ratio = self.saved_bytes / self.bytes_in if self.bytes_in else 0.0
+        return (f"{self.bytes_in / (1024 * 1024):.2f} MB → {self.bytes_out / (1024 * 1024):.2f} MB (-{ratio:.1%}), "
+                f"{_format_duration(self.seconds_in)} → {_format_duration(self.seconds_out)}")
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}:{seconds:02d}"
+
+
+def _is_silent(audio: bytes, frame: FrameHeader) -> bool:
+    gains = global_gains(audio, frame)
+    return bool(gains) and max(gains) <= SILENCE_MAX_GAIN
+
+
+def trim_frames(audio: bytes) -> Tuple[List[FrameHeader], List[FrameHeader]]:
+    """
+    1セグメント分の音声のフレームを (残すフレーム, 取り除くフレーム) に分ける
+
+    取り除くのは Xing / Info タグ、先頭の無音（次のフレームが前を参照しない範囲）、
+    SILENCE_KEEP_SECONDS を超える末尾の無音。
+    """
+    frames = list(iter_frames(audio))
+    dropped: List[FrameHeader] = []
+    # タグはエンコーダの出力の先頭にだけ置かれる
+    if frames and is_info_frame(audio, frames[0]):
+        dropped.append(frames.pop(0))
+    if not frames:
+        return frames, dropped
+
+    end = len(frames)
+    while end > 0 and _is_silent(audio, frames[end - 1]):
+        end -= 1
+    keep = math.ceil(SILENCE_KEEP_SECONDS * frames[-1].sample_rate / frames[-1].samples)
+    end = min(len(frames), end + keep)
+
+    start = 0
+    while start < end - 1 and _is_silent(audio, frames[start]) and main_data_begin(audio, frames[start + 1]) == 0:
+        start += 1
+
+    dropped.extend(frames[:start])
+    dropped.extend(frames[end:])
+    return frames[start:end], dropped
+
+
+def reencode_enabled() -> bool:
+    return MP3_SPEED != 1.0 or bool(MP3_BITRATE)
+
+
+def reencode(path: str, speed: float = MP3_SPEED, bitrate: str = MP3_BITRATE) -> bool:
+    """
+    ffmpeg でパートファイルを再エンコードして置き換える（小さくならなければ元のまま）
+
+    戻り値: 置き換えた場合 True
+    """
+    tmp = path + '.reencode.mp3'
+    cmd = ['ffmpeg', '-loglevel', 'error', '-y', '-i', path, '-map_metadata', '-1']
+    if speed != 1.0:
+        cmd += ['-filter:a', f'atempo={speed}']
+    cmd += ['-codec:a', 'libmp3lame']
+    if bitrate:
+        cmd += ['-b:a', bitrate]
+    cmd.append(tmp)
+    try:
+        with metrics.span('mp3_reencode'):
+            subprocess.run(cmd, check=True, capture_output=True, timeout=REENCODE_TIMEOUT)
+        # 大きくなる場合はパートの上限を超えうるので使わない
+        if os.path.getsize(tmp) >= os.path.getsize(path):
+            os.remove(tmp)
+            return False
+        os.replace(tmp, path)
+        return True
+    except (OSError, subprocess.SubprocessError) as e:
+        stderr = getattr(e, 'stderr', b'') or b''
+        print(f"警告: 再エンコードに失敗しました（元のファイルを使います）: {path}: {e} {stderr.decode(errors='replace').strip()}")
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+
+
+class PartPostProcessor:
+    """
+    パートファイルを ffmpeg で再エンコードしてから on_part に渡す
+
+    再エンコードは REENCODE_WORKERS 個の ffmpeg プロセスで並列に行うが、on_part は
+    パート番号の順に（前のパートの on_part が終わってから）呼ぶ。
+    ffmpeg がない場合は再エンコードせずにそのまま渡す。
+    """
+
+    def __init__(self, on_part: Optional[Callable[[str, int], None]] = None, workers: int = REENCODE_WORKERS):
+        self.on_part = on_part
+        self.enabled = bool(shutil.which('ffmpeg'))
+        if not self.enabled:
+            print("警告: ffmpeg が見つからないため、MP3 の再エンコード（MP3_SPEED / MP3_BITRATE）はしません")
+        self.reports: List[PartReport] = []
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self._futures: List[Future] = []
+
+    def submit(self, report: PartReport, index: int) -> None:
+        previous = self._futures[-1] if self._futures else None
+        self.reports.append(report)
+        self._futures.append(self._executor.submit(self._process, report, index, previous))
+
+    def _process(self, report: PartReport, index: int, previous: Optional[Future]) -> None:
+        if self.enabled and reencode(report.path):
+            report.bytes_out = os.path.getsize(report.path)
+            with open(report.path, 'rb') as fp:
+                report.seconds_out = duration_seconds(fp.read())
+        # 先に送り出すパートの後処理が終わるまで待つ（チャンネル内の順番を保つ）
+        if previous is not None:
+            wait([previous])
+        print_report(report)
+        if self.on_part:
+            self.on_part(report.path, index)
+
+    def close(self) -> List[PartReport]:
+        """全パートの後処理を待ち、パートごとの結果を返す"""
+        for future in self._futures:
+            try:
+                future.result()
+            except Exception as e:
+                print(f"エラー: PartPostProcessor: {e}")
+        self._executor.shutdown()
+        return self.reports
+
+
+def print_report(report: PartReport) -> None:
+    """パートの後処理の結果を表示し、削減量を metrics に数える"""
+    if report.saved_bytes <= 0 and report.saved_seconds <= 0:
+        return
+    print(f"  後処理: {os.path.basename(report.path)}: {report.summary()}")
+    metrics.count('mp3_bytes_saved', report.saved_bytes)
+    metrics.count('mp3_seconds_saved', round(report.saved_seconds, 3))
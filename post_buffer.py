@@ -0,0 +1,167 @@
+"""
+ディスクに書き出すレスのバッファ
+
+PostBuffer はレスを追記専用の一時ファイル（JSON Lines）に書き、メモリにはレス番号と
+ファイル上の位置だけを持ちます。最初の POST_BUFFER_MEMORY_KB まではメモリ上に置き、
+超えたら一時ファイルに移します（tempfile.SpooledTemporaryFile）。
+スレッドの大きさや処理するスレッド数によらず、レスの本文でメモリが埋まりません。
+
+リストと同じように使えます（読み出し専用）:
+ - len(buffer), for post in buffer, buffer[0], buffer[-1]
+ - buffer[i:j]: コピーせずに同じファイルを参照する部分列
+ - buffer.between(first, last): レス番号が first〜last の部分列（レス番号の昇順に追加した場合）
+"""
+import bisect
+import json
+import os
+import tempfile
+import threading
+from array import array
+from typing import Iterable, Iterator, List, Optional, Union
+
+from shitaraba_parser import Post
+
+
+POST_BUFFER_MEMORY_KB = int(os.getenv('POST_BUFFER_MEMORY_KB', '256'))  # これを超えたら一時ファイルに書く
+_BATCH = 256  # 書き込み・順次読み出しでまとめて扱うレスの件数
+
+# json.dumps / json.loads は呼ぶたびに引数を調べるので、エンコーダ・デコーダを使い回す
+_encoder = json.JSONEncoder(ensure_ascii=False, check_circular=False)
+_decoder = json.JSONDecoder()
+
+
+def _encode(post: Post) -> bytes:
+    # キー名を繰り返さないよう、Post のフィールド順の配列で持つ（asdict より数倍速い）
+    return _encoder.encode((post.number, post.body, post.name, post.timestamp, post.poster_id)).encode('utf-8')
+
+
+def _decode(line: bytes) -> Post:
+    return Post(*_decoder.decode(line.decode('utf-8')))
+
+
+class _Storage:
+    """PostBuffer とその部分列が共有する一時ファイルと索引"""
+
+    def __init__(self, memory_bytes: int):
+        self.file = tempfile.SpooledTemporaryFile(max_size=memory_bytes, mode='w+b', prefix='posts_')
+        self.offsets = array('q')
+        self.numbers = array('q')
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def write(self, posts: List[Post]) -> None:
+        lines = [_encode(post) + b'\n' for post in posts]
+        with self.lock:
+            self.file.seek(self.size)
+            self.file.write(b''.join(lines))
+            for post, line in zip(posts, lines):
+                self.offsets.append(self.size)
+                self.numbers.append(post.number)
+                self.size += len(line)
+
+    def read(self, index: int) -> Post:
+        with self.lock:
+            self.file.seek(self.offsets[index])
+            line = self.file.readline()
+        return _decode(line)
+
+    def read_range(self, start: int, stop: int) -> Iterator[Post]:
+        """start〜stop-1 番目のレスを、_BATCH 件ずつまとめて読んで返す"""
+        for first in range(start, stop, _BATCH):
+            last = min(stop, first + _BATCH)
+            end = self.offsets[last] if last < len(self.offsets) else self.size
+            with self.lock:
+                self.file.seek(self.offsets[first])
+                chunk = self.file.read(end - self.offsets[first])
+            for line in chunk.split(b'\n')[:-1]:
+                yield _decode(line)
+
+
+class PostBuffer:
+    """
+    レスを一時ファイルに追記していく、リスト互換（読み出し専用）のバッファ
+
+    append / extend は部分列ではなく元のバッファにだけ使える。
+    """
+
+    def __init__(self, posts: Iterable[Post] = (), memory_kb: int = POST_BUFFER_MEMORY_KB):
+        self._storage = _Storage(memory_kb * 1024)
+        self._start = 0
+        self._stop: Optional[int] = None  # None は元のバッファ（末尾まで）
+        self.extend(posts)
+
+    @classmethod
+    def _view(cls, storage: _Storage, start: int, stop: int) -> 'PostBuffer':
+        view = cls.__new__(cls)
+        view._storage = storage
+        view._start = start
+        view._stop = stop
+        return view
+
+    def append(self, post: Post) -> None:
+        self.extend((post,))
+
+    def extend(self, posts: Iterable[Post]) -> None:
+        if self._stop is not None:
+            raise TypeError("PostBuffer の部分列には追加できません")
+        batch: List[Post] = []
+        for post in posts:
+            batch.append(post)
+            if len(batch) >= _BATCH:
+                self._storage.write(batch)
+                batch = []
+        if batch:
+            self._storage.write(batch)
+
+    @property
+    def spilled(self) -> bool:
+        """メモリに収まらず一時ファイルに書き出したか"""
+        return bool(getattr(self._storage.file, '_rolled', False))
+
+    @property
+    def nbytes(self) -> int:
+        """バッファの中身（JSON Lines）のバイト数"""
+        return self._storage.size
+
+    def _bounds(self) -> range:
+        stop = len(self._storage.offsets) if self._stop is None else self._stop
+        return range(self._start, stop)
+
+    def __len__(self) -> int:
+        return len(self._bounds())
+
+    def __iter__(self) -> Iterator[Post]:
+        bounds = self._bounds()
+        return self._storage.read_range(bounds.start, bounds.stop)
+
+    def __getitem__(self, key: Union[int, slice]) -> Union[Post, 'PostBuffer']:
+        bounds = self._bounds()
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError("PostBuffer のスライスは step を指定できません")
+            sub = bounds[key]
+            return PostBuffer._view(self._storage, sub.start, sub.stop)
+        return self._storage.read(bounds[key])
+
+    def numbers(self) -> Iterator[int]:
+        """レス番号の並び（本文は読まない）"""
+        numbers = self._storage.numbers
+        return (numbers[i] for i in self._bounds())
+
+    def between(self, first: int, last: int) -> 'PostBuffer':
+        """レス番号が first〜last の部分列（レス番号の昇順に追加されている前提）"""
+        bounds = self._bounds()
+        numbers = self._storage.numbers
+        lo = bisect.bisect_left(numbers, first, bounds.start, bounds.stop)
+        hi = bisect.bisect_right(numbers, last, lo, bounds.stop)
+        return PostBuffer._view(self._storage, lo, hi)
+
+    def close(self) -> None:
+        """一時ファイルを削除する（部分列も読めなくなる）"""
+        self._storage.file.close()
+
+    def __enter__(self) -> 'PostBuffer':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,245 @@
+"""
+音声変換の前にレスを間引くフィルタ
+
+スレッドには同じコピペ・テンプレ・「w」だけのレス・1文字のレスが大量に含まれ、
+そのまま読み上げると変換時間も MP3 パートも膨らみます。PostFilter はレスを順に見て、
+次のレスを取り除きます（残ったレスの順番は変わりません）。
+
+ - too_short: 読み上げる文字（空白・記号・笑いを除く）が min_chars 未満
+ - duplicate: 正規化したテキストが以前のレスと完全に一致
+ - near_duplicate: 以前のレスとの文字 n-gram の Jaccard 類似度が near_duplicate 以上
+   （MinHash + LSH で候補を絞ってから、実際の類似度を確かめる）
+   重複判定に覚えておくレスは直近に使った max_history 件まで（長いスレッドでも索引が膨らまない）
+ - low_score: スコア（長さ・文字の多様さ・記号や笑いの割合の重み付き和）が min_score 未満
+
+どれだけ減らせたか（文字数・推定 TTS リクエスト数）は report に集計されます。
+
+使い方:
+    post_filter = PostFilter()
+    posts_to_mp3(post_filter.filter(texts), ...)
+    print(post_filter.report.summary())
+"""
+import math
+import os
+import re
+import unicodedata
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import metrics
+
+
+POST_FILTER_ENABLED = os.getenv('POST_FILTER', '1') != '0'  # POST_FILTER=0 で全レスを読み上げる
+GTTS_CHARS_PER_REQUEST = 100  # gTTS は約100文字ごとに1リクエスト送る
+_EMPTY_BIN_OFFSET = 1 << 32   # 借りてきた値が元のビンの値と一致しないようにずらす
+_HASH_SEED = 20260213         # 実行ごとに結果が変わらないよう固定（再開時に同じパートになる）
+
+# 読み上げる文字に数えないもの: 空白・記号・笑い（tts 正規化後の「わら」と w）
+_NOISE_RE = re.compile(r'[\s\W_]+|わら|[wWｗＷ]{2,}')
+
+
+@dataclass
+class FilterConfig:
+    """フィルタの設定（重みを変えるとスコアの付け方を調整できる）"""
+    min_chars: int = 4               # 読み上げる文字がこれ未満のレスは除く
+    near_duplicate: float = 0.8      # Jaccard 類似度がこれ以上なら近似重複
+    near_duplicate_min_chars: int = 12  # これより短いレスは完全一致だけを見る（短文の類似度は当てにならない）
+    shingle_size: int = 3            # 文字 n-gram の n
+    num_perm: int = 32               # MinHash のハッシュ関数の数
+    bands: int = 8                   # LSH のバンド数（num_perm を割り切れる数）
+    max_history: int = 5000          # 重複判定に覚えておくレスの数（古いものから忘れる。0 で無制限）
+    min_score: float = 0.2
+    length_norm: int = 30            # この文字数で長さのスコアが 1 になる
+    weights: Dict[str, float] = field(default_factory=lambda: {'length': 1.0, 'variety': 0.5, 'noise': -1.0})
+
+
+@dataclass
+class FilterReport:
+    """フィルタで減らせた量"""
+    posts: int = 0
+    kept: int = 0
+    chars: int = 0
+    kept_chars: int = 0
+    requests: int = 0
+    kept_requests: int = 0
+    dropped: Counter = field(default_factory=Counter)
+
+    @property
+    def saved_chars(self) -> int:
+        return self.chars - self.kept_chars
+
+    @property
+    def saved_requests(self) -> int:
+        return self.requests - self.kept_requests
+
+    def summary(self) -> str:
+        reasons = ', '.join(f"{reason} {n}" for reason, n in self.dropped.most_common())
+        ratio = self.saved_chars / self.chars if self.chars else 0.0
+        return (f"{self.posts}件中 {self.posts - self.kept}件を除外 ({reasons or 'なし'}) / "
+                f"{self.saved_chars}文字 ({ratio:.1%})・推定 TTS リクエスト {self.saved_requests}回を削減")
+
+
+def normalize(text: str) -> str:
+    """重複判定用の正規化（NFKC・小文字・空白除去）"""
+    return ''.join(unicodedata.normalize('NFKC', text).lower().split())
+
+
+def estimate_requests(text: str) -> int:
+    """text を gTTS で読み上げる場合のリクエスト数の目安"""
+    return max(1, math.ceil(len(text) / GTTS_CHARS_PER_REQUEST))
+
+
+def score(text: str, config: FilterConfig) -> float:
+    """
+    レスの読み上げる価値のスコア
+
+    - length: 読み上げる文字数（length_norm で 1）
+    - variety: 読み上げる文字のうち異なる文字の割合（「ああああ」は低い）
+    - noise: 全体のうち空白・記号・笑いの割合
+    """
+    content = _NOISE_RE.sub('', text)
+    if not text or not content:
+        return 0.0
+    features = {
+        'length': min(1.0, len(content) / config.length_norm),
+        'variety': len(set(content)) / len(content),
+        'noise': 1 - len(content) / len(text),
+    }
+    return sum(config.weights.get(name, 0.0) * value for name, value in features.items())
+
+
+class _MinHashIndex:
+    """
+    MinHash シグネチャを LSH のバンドごとのバケットに入れて、似たレスの候補を引く
+
+    シグネチャは one permutation hashing（n-gram を1回だけハッシュし、num_perm 個のビンに
+    振り分けて各ビンの最小値を取る。空のビンは次のビンの値で埋める）で作るので、
+    ハッシュ関数を num_perm 回計算するより1桁速い。
+    """
+
+    def __init__(self, num_perm: int, bands: int):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) は bands ({bands}) で割り切れる必要があります")
+        self._num_perm = num_perm
+        self._rows = num_perm // bands
+        self._buckets: List[Dict[tuple, List[int]]] = [{} for _ in range(bands)]
+
+    def signature(self, shingles: Set[str]) -> List[int]:
+        num_perm = self._num_perm
+        bins: List[Optional[int]] = [None] * num_perm
+        for shingle in shingles:
+            value, bin_index = divmod(zlib.crc32(shingle.encode('utf-8'), _HASH_SEED), num_perm)
+            current = bins[bin_index]
+            if current is None or value < current:
+                bins[bin_index] = value
+        # 空のビンは右隣（巡回）の空でないビンの値とずらした量で埋める
+        signature = []
+        for i in range(num_perm):
+            for offset in range(num_perm):
+                value = bins[(i + offset) % num_perm]
+                if value is not None:
+                    signature.append(value + offset * _EMPTY_BIN_OFFSET)
+                    break
+        return signature
+
+    def candidates(self, signature: List[int]) -> Set[int]:
+        found: Set[int] = set()
+        for band, buckets in enumerate(self._buckets):
+            found.update(buckets.get(tuple(signature[band * self._rows:(band + 1) * self._rows]), ()))
+        return found
+
+    def add(self, item: int, signature: List[int]) -> None:
+        for band, buckets in enumerate(self._buckets):
+            buckets.setdefault(tuple(signature[band * self._rows:(band + 1) * self._rows]), []).append(item)
+
+    def remove(self, item: int, signature: List[int]) -> None:
+        for band, buckets in enumerate(self._buckets):
+            key = tuple(signature[band * self._rows:(band + 1) * self._rows])
+            bucket = buckets[key]
+            bucket.remove(item)
+            if not bucket:
+                del buckets[key]
+
+
+class PostFilter:
+    """
+    レスのイテラブルを順に見て、読み上げる必要のないものを取り除く
+
+    filter() はジェネレータなので、posts_to_mp3 のパイプラインにそのまま渡せる
+    （全件を読み込まずに流れる）。report は読み進めるにつれて更新される。
+    """
+
+    def __init__(self, config: Optional[FilterConfig] = None):
+        self.config = config or FilterConfig()
+        self.report = FilterReport()
+        # 正規化したテキスト → 索引の番号（短いレスは None）。使った順に並べ、古いものから忘れる
+        self._seen: Dict[str, Optional[int]] = {}
+        # 索引の番号 → (正規化したテキスト, シグネチャ)。n-gram の集合は候補を確かめるときに作り直す
+        self._entries: Dict[int, Tuple[str, List[int]]] = {}
+        self._next_item = 0
+        self._index = _MinHashIndex(self.config.num_perm, self.config.bands)
+
+    def filter(self, texts: Iterable[str]) -> Iterator[str]:
+        for text in texts:
+            reason = self.check(text)
+            requests = estimate_requests(text)
+            self.report.posts += 1
+            self.report.chars += len(text)
+            self.report.requests += requests
+            if reason:
+                self.report.dropped[reason] += 1
+                metrics.count('posts_filtered', reason=reason)
+                metrics.count('tts_chars_saved', len(text))
+                continue
+            self.report.kept += 1
+            self.report.kept_chars += len(text)
+            self.report.kept_requests += requests
+            yield text
+
+    def check(self, text: str) -> Optional[str]:
+        """取り除く理由（残す場合は None）。残すレスは以降の重複判定に登録される"""
+        config = self.config
+        if len(_NOISE_RE.sub('', text)) < config.min_chars:
+            return 'too_short'
+        key = normalize(text)
+        if key in self._seen:
+            self._touch(key)
+            return 'duplicate'
+        if len(key) >= config.near_duplicate_min_chars:
+            shingles = self._shingle(key)
+            signature = self._index.signature(shingles)
+            for item in self._index.candidates(signature):
+                other_key = self._entries[item][0]
+                other = self._shingle(other_key)
+                if len(shingles & other) / len(shingles | other) >= config.near_duplicate:
+                    self._touch(other_key)
+                    return 'near_duplicate'
+        else:
+            signature = None
+        if score(text, config) < config.min_score:
+            return 'low_score'
+        self._remember(key, signature)
+        return None
+
+    def _shingle(self, key: str) -> Set[str]:
+        size = self.config.shingle_size
+        return {key[i:i + size] for i in range(len(key) - size + 1)}
+
+    def _touch(self, key: str) -> None:
+        """重複に使ったレスを最近使ったものとして並べ直す"""
+        self._seen[key] = self._seen.pop(key)
+
+    def _remember(self, key: str, signature: Optional[List[int]]) -> None:
+        item = None
+        if signature is not None:
+            item = self._next_item
+            self._next_item += 1
+            self._entries[item] = (key, signature)
+            self._index.add(item, signature)
+        self._seen[key] = item
+        if self.config.max_history and len(self._seen) > self.config.max_history:
+            oldest = self._seen.pop(next(iter(self._seen)))
+            if oldest is not None:
+                self._index.remove(oldest, self._entries.pop(oldest)[1])
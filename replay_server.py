@@ -0,0 +1,247 @@
+"""
+オフラインのリプレイ環境（ベンチマーク・回帰チェック用）
+
+したらば・gTTS・Discord に接続せずにパイプライン全体を動かすための部品です。
+
+ - build_fixtures(): 保存済みのスレッド（outputs/*.txt）と録音済みの gTTS 音声（test_output.mp3）から
+   subject.txt・rawmode.cgi の応答と、読み上げ用の音声を作る
+ - ReplayServer: subject.txt / rawmode.cgi / Discord API を返すローカルの HTTP サーバー
+   （送受信したバイト数を数える）
+ - ReplayBackend: 録音済みの音声フレームを文字数に比例して返す TTS バックエンド
+ - replay_environment(server): 各モジュールの接続先をローカルサーバーに向ける
+
+使い方は benchmark.py replay を参照してください。
+"""
+import glob
+import gzip
+import hashlib
+import html
+import itertools
+import json
+import re
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Union
+
+import discord_uploader
+import shitaraba_extractor
+from mp3_frames import iter_frames, silent_frames
+from tts_backends import TTSBackend
+from tts_cache import cache_key
+
+
+REPLAY_BOARD = 'netgame/16797'
+REPLAY_THREAD_ID = '1770000000'
+REPLAY_THREAD_SOURCES = 'outputs/*.txt'
+REPLAY_AUDIO_SOURCE = 'test_output.mp3'
+FRAMES_PER_CHAR = 8  # test_output.mp3 は38文字で約320フレーム（24ms/フレーム）
+
+
+@dataclass
+class Fixtures:
+    """リプレイする応答"""
+    board: str
+    thread_id: str
+    title: str
+    bodies: List[str]
+    subject_txt: bytes = b''
+    rawmode_lines: List[bytes] = field(default_factory=list)
+    audio_frames: List[bytes] = field(default_factory=list)
+
+    @property
+    def thread_url(self) -> str:
+        return f"{shitaraba_extractor.BASE_URL}/bbs/read.cgi/{self.board}/{self.thread_id}/"
+
+
+def build_fixtures(posts: Optional[int] = None, sources: str = REPLAY_THREAD_SOURCES,
+                   audio: str = REPLAY_AUDIO_SOURCE, bodies: Optional[List[str]] = None) -> Fixtures:
+    """
+    保存済みのスレッド本文と音声からリプレイ用の応答を作る
+
+    posts を指定した場合はその件数になるようにレスを繰り返す（または切り詰める）。
+    bodies を渡した場合は保存済みのスレッドの代わりにそのレス本文を使う。
+    """
+    title = 'VALORANT part1933'
+    sources_paths = [] if bodies else sorted(glob.glob(sources))
+    bodies = list(bodies or [])
+    for path in sources_paths:
+        with open(path, encoding='utf-8') as fp:
+            paragraphs = [p.strip() for p in fp.read().split('\n\n') if p.strip()]
+        # 先頭の段落はスレタイ「タイトル(レス数)」
+        if paragraphs and (m := re.fullmatch(r'(.*)\(\d+\)', paragraphs[0])):
+            title = m.group(1)
+            paragraphs = paragraphs[1:]
+        bodies.extend(paragraphs)
+    if not bodies:
+        bodies = ['テスト本文です']
+    if posts:
+        bodies = list(itertools.islice(itertools.cycle(bodies), posts))
+
+    fixtures = Fixtures(REPLAY_BOARD, REPLAY_THREAD_ID, title, bodies)
+    # 対象スレッドの前後に、条件に合わないスレッドと過去スレを並べる
+    subject = [f"{int(REPLAY_THREAD_ID) + 100 + i}.cgi,雑談スレ{i}({i * 7 + 1})" for i in range(20)]
+    subject.append(f"{REPLAY_THREAD_ID}.cgi,{title}({len(bodies)})")
+    subject += [f"{int(REPLAY_THREAD_ID) - 100 - i}.cgi,VALORANT part{1900 - i}(5000)" for i in range(30)]
+    subject.append(subject[0])  # 本物の subject.txt と同じく末尾に先頭の行が重複する
+    fixtures.subject_txt = ('\n'.join(subject) + '\n').encode('euc_jp', errors='replace')
+    fixtures.rawmode_lines = [
+        (f"{i}<>名無しさん<>sage<>2026/02/13(金) 04:23:40<>"
+         f"{html.escape(body).replace(chr(10), '<br>')}<>{title if i == 1 else ''}<>ID{i % 97:03d}\n")
+        .encode('euc_jp', errors='replace')
+        for i, body in enumerate(bodies, 1)
+    ]
+    try:
+        with open(audio, 'rb') as fp:
+            data = fp.read()
+        fixtures.audio_frames = [data[f.offset:f.offset + f.length] for f in iter_frames(data)]
+    except OSError:
+        pass
+    return fixtures
+
+
+class ReplayBackend(TTSBackend):
+    """録音済みの音声フレームを順に繰り返して、1文字あたり frames_per_char フレーム返す"""
+    name = 'replay'
+
+    def __init__(self, frames: List[bytes], frames_per_char: int = FRAMES_PER_CHAR):
+        self.frames = frames
+        self.frames_per_char = frames_per_char
+
+    def cache_key(self, text: str) -> str:
+        return cache_key(text, 'replay', '', False, backend=f"replay:{self.frames_per_char}")
+
+    def synthesize(self, text: str) -> Optional[bytes]:
+        count = max(1, len(text.strip()) * self.frames_per_char)
+        if not self.frames:
+            return silent_frames(count)
+        return b''.join(itertools.islice(itertools.cycle(self.frames), count))
+
+
+class ReplayServer:
+    """
+    したらば（subject.txt / rawmode.cgi）と Discord API を返すローカルの HTTP サーバー
+
+    with ReplayServer(fixtures) as server: の中で server.base_url に接続する。
+    受信したリクエストボディと返したレスポンスボディのバイト数を数える（reset_counters() で0に戻す）。
+    """
+
+    def __init__(self, fixtures: Fixtures):
+        self.fixtures = fixtures
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> 'ReplayServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='replay-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.bytes_received = self.bytes_sent = self.requests = 0
+
+    def _count(self, received: int, sent: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _read_body(self) -> int:
+                remaining = int(self.headers.get('Content-Length') or 0)
+                total = remaining
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 256 * 1024))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                return total
+
+            def _reply(self, status: int, body: Union[bytes, List[bytes]], received: int = 0,
+                       content_type: str = 'text/plain', headers: Optional[Dict[str, str]] = None) -> None:
+                chunks = [body] if isinstance(body, bytes) else body
+                length = sum(len(chunk) for chunk in chunks)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(length))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if self.command != 'HEAD':
+                    for i in range(0, len(chunks), 1024):
+                        self.wfile.write(b''.join(chunks[i:i + 1024]))
+                server._count(received, length)
+
+            def do_GET(self):
+                fixtures = server.fixtures
+                path = self.path.split('?', 1)[0]
+                if path == f"/{fixtures.board}/subject.txt":
+                    etag = '"' + hashlib.sha256(fixtures.subject_txt).hexdigest()[:16] + '"'
+                    if self.headers.get('If-None-Match') == etag:
+                        return self._reply(304, b'', headers={'ETag': etag})
+                    body, headers = fixtures.subject_txt, {'ETag': etag}
+                    if 'gzip' in (self.headers.get('Accept-Encoding') or ''):
+                        body = gzip.compress(body, mtime=0)
+                        headers['Content-Encoding'] = 'gzip'
+                    return self._reply(200, body, content_type='text/plain; charset=EUC-JP', headers=headers)
+                m = re.fullmatch(rf"/bbs/rawmode\.cgi/{fixtures.board}/{fixtures.thread_id}/(\d+)-", path)
+                if m:
+                    # 連結せずに1行ずつ書く（メモリ計測でサーバー側の応答が増加分に入らないように）
+                    lines = fixtures.rawmode_lines[max(0, int(m.group(1)) - 1):]
+                    return self._reply(200, lines, content_type='text/plain; charset=EUC-JP')
+                self._reply(404, b'not found')
+
+            def do_POST(self):
+                received = self._read_body()
+                m = re.fullmatch(r'/api/v10/channels/(\d+)/messages', self.path)
+                if not m:
+                    return self._reply(404, b'{}', received, 'application/json')
+                message = {'id': str(next(server._message_ids)), 'channel_id': m.group(1)}
+                self._reply(200, json.dumps(message).encode(), received, 'application/json')
+
+            def do_PATCH(self):
+                received = self._read_body()
+                m = re.fullmatch(r'/api/v10/channels/(\d+)/messages/(\d+)', self.path)
+                if not m:
+                    return self._reply(404, b'{}', received, 'application/json')
+                message = {'id': m.group(2), 'channel_id': m.group(1)}
+                self._reply(200, json.dumps(message).encode(), received, 'application/json')
+
+        return Handler
+
+
+@contextmanager
+def replay_environment(server: ReplayServer) -> Iterator[None]:
+    """したらば・Discord の接続先を server に向ける（抜けるときに元に戻す）"""
+    saved = (shitaraba_extractor.BASE_URL, shitaraba_extractor.RAWMODE_URL, discord_uploader.API_BASE)
+    shitaraba_extractor.BASE_URL = server.base_url
+    shitaraba_extractor.RAWMODE_URL = server.base_url + '/bbs/rawmode.cgi'
+    discord_uploader.API_BASE = server.base_url + '/api/v10'
+    try:
+        yield
+    finally:
+        shitaraba_extractor.BASE_URL, shitaraba_extractor.RAWMODE_URL, discord_uploader.API_BASE = saved
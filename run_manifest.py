@@ -0,0 +1,161 @@
+"""
+実行マニフェスト（途中で落ちた実行の再開用）
+
+1回の実行（スレッド・レス範囲）ごとに state/runs/<thread_id>.json を作り、
+終わった手順を記録します。途中で落ちた・止まった実行を再実行すると、
+完了済みの手順（変換済みのパート、送信済みのパート）を飛ばして残りだけをやり直します。
+
+記録する内容:
+ - thread_id, thread_url, post_range, post_count, text_sha256: 対象のレス
+ - parts: パートファイルごとのパス・サイズ・SHA-256・送信先メッセージID
+ - steps: synthesize（全パート変換済み）/ upload（全パート送信済み）/ captions（キャプション修正済み）
+
+書き込みは一時ファイル→置き換えで行うので、途中で落ちても壊れたマニフェストは残りません。
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+
+
+RUNS_DIR = os.path.join('state', 'runs')
+STEPS = ('synthesize', 'upload', 'captions')
+
+
+def text_sha256(bodies: Iterable[str]) -> str:
+    """レス本文の並びのハッシュ（レス区切りも含める）"""
+    h = hashlib.sha256()
+    for body in bodies:
+        h.update(body.encode('utf-8'))
+        h.update(b'\x00')
+    return h.hexdigest()
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class RunManifest:
+    """
+    1回の実行の進み具合（スレッドセーフ。更新するたびにディスクへ保存する）
+
+    - start(...): 新しい実行として初期化する
+    - record_part(index, path): 変換済みのパートを記録する
+    - record_sent(index, message_id): 送信済みのパートを記録する
+    - synthesized_parts(): 変換済みのパートがそのまま使えればそのリストを返す
+    - complete(step): 手順を完了にする
+    """
+
+    def __init__(self, thread_id: str, data: Optional[dict] = None):
+        self.thread_id = thread_id
+        self.path = os.path.join(RUNS_DIR, f"{thread_id}.json")
+        self.data = data or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, thread_id: str) -> 'RunManifest':
+        """保存済みのマニフェストを読み込む（なければ空）"""
+        manifest = cls(thread_id)
+        try:
+            with open(manifest.path, encoding='utf-8') as fp:
+                manifest.data = json.load(fp)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"警告: 実行マニフェストを読み込めません（最初からやり直します）: {e}")
+        return manifest
+
+    @property
+    def post_range(self) -> Optional[List[int]]:
+        return self.data.get('post_range')
+
+    @property
+    def parts(self) -> List[dict]:
+        return self.data.get('parts', [])
+
+    def is_complete(self, step: Optional[str] = None) -> bool:
+        """step の手順（省略時は全ての手順）が完了しているか"""
+        steps = self.data.get('steps', {})
+        return all(steps.get(s) for s in ([step] if step else STEPS))
+
+    def matches(self, text_hash: str) -> bool:
+        return self.data.get('text_sha256') == text_hash
+
+    def start(self, thread_url: str, post_range: List[int], post_count: int, text_hash: str) -> None:
+        with self._lock:
+            self.data = {
+                'thread_id': self.thread_id,
+                'thread_url': thread_url,
+                'post_range': post_range,
+                'post_count': post_count,
+                'text_sha256': text_hash,
+                'steps': {step: False for step in STEPS},
+                'parts': [],
+            }
+            self._save()
+
+    def synthesized_parts(self) -> Optional[List[dict]]:
+        """
+        変換が完了していて、全パートファイルが記録どおり残っていればそのリストを返す
+
+        1つでも欠けている・サイズが違う場合は None（変換からやり直す）
+        """
+        if not self.is_complete('synthesize') or not self.parts:
+            return None
+        for part in self.parts:
+            try:
+                if os.path.getsize(part['path']) != part['size']:
+                    return None
+            except OSError:
+                return None
+        return self.parts
+
+    def record_part(self, index: int, path: str) -> dict:
+        """変換済みのパートを記録する（同じ番号の記録があれば内容を比べて置き換える）"""
+        part = {'index': index, 'path': path, 'size': os.path.getsize(path),
+                'sha256': file_sha256(path), 'message_id': None}
+        with self._lock:
+            parts = self.data.setdefault('parts', [])
+            old = next((p for p in parts if p['index'] == index), None)
+            if old is not None:
+                if old['sha256'] == part['sha256']:
+                    # 同じ内容なら送信済みの記録を引き継ぐ
+                    part['message_id'] = old['message_id']
+                parts.remove(old)
+            parts.append(part)
+            parts.sort(key=lambda p: p['index'])
+            self._save()
+        return part
+
+    def record_sent(self, index: int, message_id: str) -> None:
+        with self._lock:
+            for part in self.data.get('parts', []):
+                if part['index'] == index:
+                    part['message_id'] = message_id
+            self._save()
+
+    def truncate_parts(self, count: int) -> None:
+        """今回の変換で作られなかった（前回の実行の余分な）パートの記録を消す"""
+        with self._lock:
+            self.data['parts'] = [p for p in self.parts if p['index'] <= count]
+            self._save()
+
+    def complete(self, step: str, done: bool = True) -> None:
+        with self._lock:
+            self.data.setdefault('steps', {})[step] = done
+            self._save()
+
+    def _save(self) -> None:
+        """ロック取得済みで呼ぶ"""
+        self.data['updated_at'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        os.makedirs(RUNS_DIR, exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fp:
+            json.dump(self.data, fp, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
@@ -3,19 +3,234 @@
 
 必須関数:
  - get_latest_valorant_thread() -> dict | None
+ - fetch_thread_list(board) / find_threads(board, pattern, min_posts) -> list[dict] | None
+ - filter_threads(threads, pattern, min_posts) -> list[dict]
+ - extract_posts(thread_url: str) -> PostBuffer（list[Post] と同じように読める）
  - extract_post_bodies(thread_url: str) -> list[str]
- - clean_text(text: str) -> str
+ - clean_text(text: str) -> str / clean_texts(texts) -> Iterator[str]
 
 このファイルは設計書に従ってEUC-JPでデコードして処理します。
+
+差分取得:
+ rawmode.cgi の範囲指定 (`.../N-`) で前回以降の新着レスだけを取得し、
+ ローカルのレスアーカイブ（archive.py、SQLite）にマージします。
+ どの取得戦略で取得したレスもアーカイブに保存します。
 """
-from typing import Optional, List, Dict
+from typing import Iterable, Iterator, Optional, List, Dict, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import html
+import itertools
+import json
+import os
 import re
-import requests
-from bs4 import BeautifulSoup
+import time
+import archive
+import transport
+from post_buffer import PostBuffer
+from shitaraba_parser import Post, iter_links, iter_posts
 
 
-SUBJECT_URL = "https://jbbs.shitaraba.net/bbs/subject.cgi/netgame/16797/"
 BASE_URL = "https://jbbs.shitaraba.net"
+BOARD = "netgame/16797"
+SUBJECT_URL = f"{BASE_URL}/bbs/subject.cgi/{BOARD}/"
+VALORANT_TITLE_PATTERN = r'VALORANT part(\d+)'
+RAWMODE_URL = BASE_URL + "/bbs/rawmode.cgi"
+
+# 差分取得用のローカル保存先（レスは archive.ARCHIVE_PATH。last_seen.json と posts/ は旧形式）
+STATE_DIR = "state"
+LAST_SEEN_FILE = os.path.join(STATE_DIR, "last_seen.json")
+POST_STORE_DIR = os.path.join(STATE_DIR, "posts")
+SUBJECT_CACHE_DIR = os.path.join(STATE_DIR, "subject")
+
+# ストリーミング解析で一度に読み込むバイト数
+READ_CHUNK_SIZE = 64 * 1024
+
+# rawmode.cgi の本文のタグ
+_BR_RE = re.compile(r'<br\s*/?>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+
+# スレッド一覧のリンクテキスト「タイトル(レス数)」
+_SUBJECT_TITLE_RE = re.compile(r'(.*)\((\d+)\)$')
+# スレッド一覧の条件付きリクエスト用: URL -> {'etag', 'last_modified', 'body', 'threads'}
+_subject_cache: Dict[str, Dict] = {}
+
+
+def subject_url(board: str) -> str:
+    """板（例: 'netgame/16797'）のスレッド一覧のURL"""
+    return f"{BASE_URL}/bbs/subject.cgi/{board}/"
+
+
+def subject_txt_url(board: str) -> str:
+    """板のスレッド一覧（テキスト形式）のURL"""
+    return f"{BASE_URL}/{board}/subject.txt"
+
+
+def fetch_thread_list(board: str = BOARD) -> Optional[List[Dict]]:
+    """
+    板のスレッド一覧を取得する（条件付き・圧縮リクエスト）
+
+    軽量な subject.txt を gzip で取得し、ETag / Last-Modified と本文を STATE_DIR に保存する。
+    次回からは検証子を送り、304 なら保存済みの本文を使う（再起動後も有効）。
+    subject.txt が取得できない場合は subject.cgi（HTML）を解析する。
+
+    戻り値: [{'name': 'VALORANT part1925(2763)', 'title': 'VALORANT part1925',
+              'url': 'https://.../read.cgi/netgame/16797/.../', 'posts': 2763}, ...]
+    取得失敗時は None
+    """
+    url = subject_txt_url(board)
+    cached = _subject_cache.get(url) or _load_subject_cache(board)
+    if cached and not cached.get('body'):
+        # 本文のない検証子を送ると、304 が返っても使える一覧がない
+        cached = None
+    headers = {'Accept-Encoding': 'gzip'}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+    try:
+        resp = transport.get(url, headers=headers, timeout=10)
+        if resp.status_code == 304:
+            if not cached:
+                raise ValueError("保存済みの一覧がないのに 304 Not Modified が返りました")
+            body = cached['body']
+        else:
+            resp.raise_for_status()
+            body = resp.content
+            cached = {'etag': resp.headers.get('ETag'), 'last_modified': resp.headers.get('Last-Modified'),
+                      'body': body}
+            # 本文のある 200 だけを保存する（空の本文を保存すると以降の 304 で一覧が空になる）
+            if resp.status_code == 200 and body:
+                _save_subject_cache(board, cached)
+    except Exception as e:
+        print(f"警告: fetch_thread_list(): subject.txt を取得できません ({board}): {e}")
+        return _fetch_thread_list_html(board)
+
+    if cached.get('threads') is None:
+        cached['threads'] = parse_subject_txt(body.decode('euc_jp', errors='replace'), board)
+    _subject_cache[url] = cached
+    return cached['threads']
+
+
+def parse_subject_txt(text: str, board: str) -> List[Dict]:
+    """
+    subject.txt（1行1スレッド: 「スレッドID.cgi,タイトル(レス数)」）を1行ずつ読んで一覧にする
+
+    したらばの subject.txt は末尾に先頭と同じスレッドが重複して載るので、同じIDは1回だけ返す。
+    """
+    threads = []
+    seen = set()
+    for line in text.splitlines():
+        key, sep, name = line.partition(',')
+        if not sep or not key.endswith('.cgi'):
+            continue
+        thread_id = key[:-4]
+        title, paren, count = name.rstrip().rpartition('(')
+        if not paren or not count.endswith(')') or not count[:-1].isdigit() or thread_id in seen:
+            continue
+        seen.add(thread_id)
+        threads.append({'name': name.strip(), 'title': title.strip(),
+                        'url': f"{BASE_URL}/bbs/read.cgi/{board}/{thread_id}/", 'posts': int(count[:-1])})
+    return threads
+
+
+def _subject_cache_path(board: str) -> str:
+    return os.path.join(SUBJECT_CACHE_DIR, board.replace('/', '_'))
+
+
+def _load_subject_cache(board: str) -> Optional[Dict]:
+    """保存済みの subject.txt と検証子を読み込む（なければ None）"""
+    path = _subject_cache_path(board)
+    try:
+        with open(path + '.json', encoding='utf-8') as fp:
+            meta = json.load(fp)
+        with open(path + '.txt', 'rb') as fp:
+            meta['body'] = fp.read()
+        return meta
+    except (OSError, ValueError):
+        return None
+
+
+def _save_subject_cache(board: str, cached: Dict) -> None:
+    """subject.txt の本文と検証子を保存する（本文→検証子の順に置き換えるので食い違わない）"""
+    path = _subject_cache_path(board)
+    try:
+        os.makedirs(SUBJECT_CACHE_DIR, exist_ok=True)
+        with open(path + '.txt.tmp', 'wb') as fp:
+            fp.write(cached['body'])
+        os.replace(path + '.txt.tmp', path + '.txt')
+        with open(path + '.json.tmp', 'w', encoding='utf-8') as fp:
+            json.dump({'etag': cached['etag'], 'last_modified': cached['last_modified']}, fp)
+        os.replace(path + '.json.tmp', path + '.json')
+    except OSError as e:
+        print(f"警告: スレッド一覧のキャッシュを保存できません: {e}")
+
+
+def _fetch_thread_list_html(board: str) -> Optional[List[Dict]]:
+    """subject.cgi（HTML）からスレッド一覧を取得する（subject.txt が使えない場合の予備）"""
+    url = subject_url(board)
+    cached = _subject_cache.get(url)
+    headers = {}
+    if cached:
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+    try:
+        with transport.get(url, headers=headers, timeout=10, stream=True) as resp:
+            if resp.status_code == 304:
+                if not cached:
+                    raise ValueError("保存済みの一覧がないのに 304 Not Modified が返りました")
+                return cached['threads']
+            resp.raise_for_status()
+            links = list(iter_links(resp.iter_content(chunk_size=READ_CHUNK_SIZE)))
+            etag = resp.headers.get('ETag')
+            last_modified = resp.headers.get('Last-Modified')
+    except Exception as e:
+        print(f"エラー: _fetch_thread_list_html(): {board}: {e}")
+        return None
+
+    threads = []
+    for href, text in links:
+        text = (text or '').strip()
+        m = _SUBJECT_TITLE_RE.match(text)
+        if not m:
+            continue
+        # make absolute URL if necessary
+        thread_url = BASE_URL + href if href.startswith('/') else href
+        threads.append({'name': text, 'title': m.group(1).strip(), 'url': thread_url,
+                        'posts': int(m.group(2))})
+    _subject_cache[url] = {'etag': etag, 'last_modified': last_modified, 'threads': threads}
+    return threads
+
+
+def find_threads(board: str, pattern: str, min_posts: int = 0) -> Optional[List[Dict]]:
+    """
+    スレッド一覧からタイトルが pattern に一致し、レス数が min_posts 以上のスレッドを返す
+
+    取得失敗時は None
+    """
+    threads = fetch_thread_list(board)
+    if threads is None:
+        return None
+    return filter_threads(threads, pattern, min_posts)
+
+
+def filter_threads(threads: List[Dict], pattern: str, min_posts: int = 0) -> List[Dict]:
+    """
+    タイトルが pattern に一致し、レス数が min_posts 以上のスレッドを選ぶ
+
+    pattern の最初のグループが数字なら 'part'（スレッドの通し番号）として付ける。
+    """
+    title_re = re.compile(pattern)
+    found = []
+    for thread in threads:
+        m = title_re.match(thread['title'])
+        if not m or thread['posts'] < min_posts:
+            continue
+        part = m.group(1) if m.groups() else None
+        found.append(dict(thread, part=int(part) if part and part.isdigit() else None))
+    return found
 
 
 def get_latest_valorant_thread() -> Optional[Dict]:
@@ -32,28 +247,7 @@ def get_latest_valorant_thread() -> Optional[Dict]:
     または None
     """
     try:
-        resp = requests.get(SUBJECT_URL, timeout=10)
-        resp.encoding = 'EUC-JP'
-        soup = BeautifulSoup(resp.text, 'html.parser')
-
-        candidates = []
-        for a in soup.find_all('a', href=True):
-            text = (a.get_text() or '').strip()
-            m = re.match(r'VALORANT part(\d+)\((\d+)\)', text)
-            if not m:
-                continue
-            part = int(m.group(1))
-            posts = int(m.group(2))
-            if posts < 300:
-                continue
-            href = a['href']
-            # make absolute URL if necessary
-            if href.startswith('/'): 
-                url = BASE_URL + href
-            else:
-                url = href
-            candidates.append({'name': text, 'url': url, 'part': part, 'posts': posts})
-
+        candidates = find_threads(BOARD, VALORANT_TITLE_PATTERN, min_posts=300)
         if not candidates:
             return None
 
@@ -90,14 +284,226 @@ def _normalize_thread_url(thread_url: str) -> str:
     return url
 
 
-def extract_post_bodies(thread_url: str, expected_posts: Optional[int] = None) -> List[str]:
+def _parse_thread_url(thread_url: str) -> Optional[Tuple[str, str, str]]:
+    """スレッドURLから (カテゴリ, 板番号, スレッドID) を取り出す
+
+    例: https://.../read.cgi/netgame/16797/1748243747/ -> ('netgame', '16797', '1748243747')
     """
-    スレッドURLから<dd>タグの本文を抽出してクリーンして返す
+    m = re.search(r'/bbs/(?:read|rawmode)\.cgi/([^/]+)/(\d+)/(\d+)', thread_url or '')
+    if not m:
+        return None
+    return m.group(1), m.group(2), m.group(3)
 
-    戻り値: ['レス1本文', 'レス2本文', ...]
-    失敗時は空リストを返す
+
+def _load_last_seen() -> Dict[str, int]:
+    """旧形式（last_seen.json）の取得済み最終レス番号を読み込む（アーカイブへの移行用）"""
+    try:
+        with open(LAST_SEEN_FILE, encoding='utf-8') as fp:
+            return {k: int(v) for k, v in json.load(fp).items()}
+    except (OSError, ValueError):
+        return {}
+
+
+def _post_store_path(thread_key: str) -> str:
+    return os.path.join(POST_STORE_DIR, thread_key.replace('/', '_') + '.jsonl')
+
+
+def _load_post_store(thread_key: str) -> List[Post]:
+    """旧形式（state/posts/*.jsonl）の保存済みレスを読み込む（アーカイブへの移行用）"""
+    records: List[Post] = []
+    try:
+        with open(_post_store_path(thread_key), encoding='utf-8') as fp:
+            for line in fp:
+                line = line.strip()
+                if line:
+                    records.append(Post(**json.loads(line)))
+    except OSError:
+        pass
+    return records
+
+
+def _migrate_legacy_store(posts_archive: archive.PostArchive, thread_key: str) -> None:
+    """旧形式のレスストアが残っていれば、アーカイブにまだないスレッドの分を取り込む"""
+    board, thread_id = thread_key.rsplit('/', 1)
+    if posts_archive.last_number(board, thread_id):
+        return
+    stored = _load_post_store(thread_key)
+    if not stored:
+        return
+    last_number = _load_last_seen().get(thread_key, max(p.number for p in stored))
+    posts_archive.upsert_posts(board, thread_id, stored, last_number=last_number)
+    print(f"旧形式のレスストアをアーカイブに移行: {thread_key} ({len(stored)} 件)")
+
+
+def _archive_posts(thread_url: str, posts: PostBuffer, last_number: Optional[int] = None) -> None:
+    """取得したレスをアーカイブに保存する（失敗しても取得結果はそのまま使う）"""
+    parsed = _parse_thread_url(thread_url)
+    if not parsed or not posts:
+        return
+    try:
+        archive.get_archive().upsert_posts(f"{parsed[0]}/{parsed[1]}", parsed[2], posts, last_number=last_number)
+    except Exception as e:
+        print(f"警告: レスをアーカイブに保存できません: {e}")
+
+
+def _parse_rawmode_line(line: str) -> Optional[Post]:
+    """rawmode.cgi の1行をレスに変換する（本文の clean_text は呼び出し側でまとめて行う）
+
+    形式: レス番号<>名前<>メール<>日付<>本文<>スレタイ<>ID
+    """
+    fields = line.split('<>')
+    if len(fields) < 5 or not fields[0].isdigit():
+        return None
+    body = _TAG_RE.sub('', _BR_RE.sub(' ', fields[4]))
+    name = html.unescape(_TAG_RE.sub('', fields[1])).strip()
+    return Post(
+        number=int(fields[0]),
+        body=html.unescape(body),
+        name=name,
+        timestamp=fields[3].strip(),
+        poster_id=fields[6].strip() if len(fields) > 6 else '',
+    )
+
+
+def _iter_rawmode_posts(lines: Iterable[bytes], since: int) -> Iterator[Post]:
+    """rawmode.cgi の応答を1行ずつ解析し、since より後のレスを返す"""
+    for line in lines:
+        rec = _parse_rawmode_line(line.decode('euc_jp', errors='replace'))
+        if rec and rec.number > since:
+            yield rec
+
+
+def _clean_posts(posts: Iterable[Post]) -> Iterator[Post]:
+    """レスの本文を clean_texts でクリーンしながら流す（全件をためない）"""
+    posts, bodies = itertools.tee(posts)
+    for post, body in zip(posts, clean_texts(p.body for p in bodies)):
+        post.body = body
+        yield post
+
+
+def fetch_new_posts(thread_url: str, since: int = 0) -> Optional[PostBuffer]:
     """
+    rawmode.cgi の範囲指定で since より後のレスだけを取得する
+
+    応答は1行ずつ解析して PostBuffer に流し込む（応答全体も本文もメモリにためない）。
+    戻り値: PostBuffer([Post(number=1235, body='本文', ...), ...])（新着なしは空）
+    取得失敗時は None を返す
+    """
+    parsed = _parse_thread_url(thread_url)
+    if not parsed:
+        return None
+    category, board, thread_id = parsed
+    url = f"{RAWMODE_URL}/{category}/{board}/{thread_id}/{since + 1}-"
     try:
+        with transport.get(url, timeout=10, stream=True) as resp:
+            resp.raise_for_status()
+            lines = resp.iter_lines(chunk_size=READ_CHUNK_SIZE)
+            records = PostBuffer(_clean_posts(_iter_rawmode_posts(lines, since)))
+        print(f"差分取得: {url} (新着 {len(records)} 件)")
+        return records
+    except Exception as e:
+        print(f"警告: fetch_new_posts() 差分取得失敗 {url}: {e}")
+        return None
+
+
+def _extract_incremental(thread_url: str) -> Optional[PostBuffer]:
+    """アーカイブにある続きから新着レスを取得してアーカイブに保存し、全レスを返す"""
+    parsed = _parse_thread_url(thread_url)
+    if not parsed:
+        return None
+    board, thread_id = f"{parsed[0]}/{parsed[1]}", parsed[2]
+
+    posts_archive = archive.get_archive()
+    _migrate_legacy_store(posts_archive, '/'.join(parsed))
+    since = posts_archive.last_number(board, thread_id)
+
+    new_records = fetch_new_posts(thread_url, since)
+    if new_records is None:
+        return None
+
+    if new_records:
+        posts_archive.upsert_posts(board, thread_id, (p for p in new_records if p.body),
+                                   last_number=max(new_records.numbers()))
+    new_records.close()
+    # アーカイブのレス（新着で書き換わったものも含む）を順にバッファへ流す
+    return PostBuffer(posts_archive.iter_posts(board, thread_id))
+
+
+def _fetch_dd_posts(url: str) -> PostBuffer:
+    """HTMLページを1つ取得して<dt>/<dd>からレスを組み立てて返す（ストリーミング解析して PostBuffer に流す）"""
+    with transport.get(url, timeout=10, stream=True) as resp:
+        posts = iter_posts(resp.iter_content(chunk_size=READ_CHUNK_SIZE))
+        return PostBuffer(p for p in _clean_posts(posts) if p.body)
+
+
+def _race_candidates(url_candidates: List[str], expected_posts: Optional[int] = None) -> Tuple[PostBuffer, Optional[str]]:
+    """
+    候補URLを並列に取得し、十分な件数の<dd>を返した最初のページを採用する
+
+    expected_posts がある場合は min(50, expected_posts) 件以上見つかった時点で
+    残りの候補をキャンセルする。ない場合は全候補を待って最も多いものを採用する。
+
+    戻り値: (レスの PostBuffer, 採用したURL)
+    """
+    posts = PostBuffer()
+    winner: Optional[str] = None
+    executor = ThreadPoolExecutor(max_workers=len(url_candidates))
+    try:
+        futures = {executor.submit(_fetch_dd_posts, url): url for url in url_candidates}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                found = future.result()
+            except Exception as inner_e:
+                print(f"警告: extract_posts() 内の候補URL取得失敗 {url}: {inner_e}")
+                continue
+
+            # 見つかった件数が期待値に近い、または十分に多ければ採用
+            if expected_posts and len(found) >= min(50, expected_posts):
+                return found, url
+            # 期待値が与えられていない場合は最も多く見つかったものを採用
+            if not expected_posts and len(found) > len(posts):
+                posts, found, winner = found, posts, url
+            found.close()  # 採用しなかった候補の一時ファイルは消す
+        return posts, winner
+    finally:
+        # 勝者が決まったら残りの候補は待たずに打ち切る
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_posts(thread_url: str, expected_posts: Optional[int] = None,
+                  incremental: bool = True) -> PostBuffer:
+    """
+    スレッドURLからレスを取得し、本文をクリーンした Post の並びを返す
+
+    取得戦略（上から順に試す）:
+    1. incremental=True の場合は rawmode.cgi で新着レスのみを取得し、
+       アーカイブ（archive.py）に保存済みのレスとマージした結果を返す
+    2. rawmode.cgi でスレッド全体を1回だけ取得する
+    3. HTMLの候補URLを並列に取得し、最初に十分な件数を返したものを採用する
+
+    戻り値: Post のリストと同じように使える PostBuffer（本文は一時ファイルに置き、メモリに溜めない）
+    失敗時は空の PostBuffer を返す
+    """
+    started = time.monotonic()
+    try:
+        if incremental:
+            posts = _extract_incremental(thread_url)
+            if posts:
+                print(f"✓ 取得戦略: rawmode差分 ({time.monotonic() - started:.2f}秒)")
+                return posts
+
+        # 差分取得に失敗した場合も、HTML に進む前に rawmode でスレッド全体を取り直す
+        records = fetch_new_posts(thread_url)
+        if records:
+            posts = PostBuffer(p for p in records if p.body)
+            last_number = max(records.numbers())
+            records.close()
+            if posts:
+                _archive_posts(thread_url, posts, last_number)
+                print(f"✓ 取得戦略: rawmode全件 ({time.monotonic() - started:.2f}秒)")
+                return posts
+
         url_candidates = []
         # normalized base url
         base = _normalize_thread_url(thread_url)
@@ -109,40 +515,32 @@ def extract_post_bodies(thread_url: str, expected_posts: Optional[int] = None) -
         url_candidates.append(base + 'l1000')
         url_candidates.append(base + 'l5000')
 
-        posts: List[str] = []
-        for url in url_candidates:
-            try:
-                resp = requests.get(url, timeout=10)
-                resp.encoding = 'EUC-JP'
-                soup = BeautifulSoup(resp.text, 'html.parser')
-                found = []
-                for dd in soup.find_all('dd'):
-                    text = dd.get_text(separator=' ')
-                    cleaned = clean_text(text)
-                    if cleaned:
-                        found.append(cleaned)
-
-                # 見つかった件数が期待値に近い、または十分に多ければ採用
-                if expected_posts and len(found) >= min(50, expected_posts):
-                    posts = found
-                    break
-                # 期待値が与えられていない場合は最も多く見つかったものを採用
-                if not expected_posts and len(found) > len(posts):
-                    posts = found
-            except Exception as inner_e:
-                print(f"警告: extract_post_bodies() 内の候補URL取得失敗 {url}: {inner_e}")
-                continue
-
+        posts, winner = _race_candidates(url_candidates, expected_posts)
         if not posts:
             print(f"警告: どのURLからもレスが取得できませんでした")
+        else:
+            # HTML は全件そろっているとは限らないので、取得済み最終レス番号は進めない
+            _archive_posts(thread_url, posts)
+            print(f"✓ 取得戦略: HTML並列取得 {winner} ({time.monotonic() - started:.2f}秒)")
         return posts
 
     except Exception as e:
-        print(f"エラー: extract_post_bodies(): {e}")
-        return []
+        print(f"エラー: extract_posts(): {e}")
+        return PostBuffer()
+
+
+def extract_post_bodies(thread_url: str, expected_posts: Optional[int] = None,
+                        incremental: bool = True) -> List[str]:
+    """
+    スレッドURLから<dd>タグの本文を抽出してクリーンして返す
+
+    戻り値: ['レス1本文', 'レス2本文', ...]
+    失敗時は空リストを返す
+    """
+    return [p.body for p in extract_posts(thread_url, expected_posts, incremental)]
 
 
-def clean_text(text: str) -> str:
+def clean_text(text: str, tts: bool = False) -> str:
     """
     レステキストから不要要素を除去する
 
@@ -151,16 +549,85 @@ def clean_text(text: str) -> str:
     2. URL除去
     3. 連続空白を1つに
     4. 前後の空白を削除
+
+    tts=True の場合は読み上げ用の正規化も行う（clean_texts を参照）
     """
     if text is None:
         return ''
-    # アンカー除去
-    text = re.sub(r'>>\d+(-\d+)?', '', text)
-    # URL除去
-    text = re.sub(r'https?://[^\s]+', '', text)
-    # 全角/半角改行やタブをスペースに
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+    return next(clean_texts([text], tts))
+
+
+def clean_texts(texts: Iterable[Optional[str]], tts: bool = False) -> Iterator[str]:
+    """
+    複数のレステキストをまとめて clean_text する（入力の順番に返す）
+
+    規則ごとの正規表現はコンパイル済みのものを使い回す。
+
+    tts=True の場合は読み上げ用に次の正規化も行う（空白の整理の前に1回の走査で）:
+    - ネットスラング（kwsk, orz など）を読みに展開
+    - 「wwww」「ｗ」（笑い）を「わら」に（英数字・漢字に続く1文字の w は除く）
+    - 絵文字を削除
+    - 同じ文字の4回以上の繰り返し（ーーーー、！！！！！）を3回に（数字は除く）
+    """
+    drop_anchor = _ANCHOR_RE.sub
+    drop_url = _URL_RE.sub
+    squash_space = _SPACE_RE.sub
+    normalize = _TTS_RE.sub if tts else None
+    for text in texts:
+        if not text:
+            yield ''
+            continue
+        text = drop_url('', drop_anchor('', text))
+        if normalize:
+            text = normalize(_replace_tts, text)
+        yield squash_space(' ', text).strip()
+
+
+# 従来の clean_text と同じ順番（アンカー → URL → 空白）で1規則ずつ適用する
+_ANCHOR_RE = re.compile(r'>>\d+(?:-\d+)?')
+_URL_RE = re.compile(r'https?://\S+')
+_SPACE_RE = re.compile(r'\s+')
+# 読み上げ用の規則（先に書いたものが優先）
+TTS_SLANG = {
+    'kwsk': 'くわしく',
+    'wktk': 'わくてか',
+    'ktkr': 'きたこれ',
+    'gdgd': 'ぐだぐだ',
+    'ggrks': 'ぐぐれかす',
+    'orz': 'がっくり',
+    'lol': 'わら',
+}
+TTS_LAUGH = 'わら'
+TTS_REPEAT_KEEP = 3
+# 笑いの w と区別するための文字（「W杯」「10w」「ww2」「ＫＷＳＫ」の w は読み替えない）
+_ALNUM = r'A-Za-z0-9０-９Ａ-Ｚａ-ｚ'
+_KANJI = r'\u3005\u3006\u3400-\u4DBF\u4E00-\u9FFF\uF900-\uFAFF'
+# 絵文字: 補助面の絵文字と、BMP のうち標準で絵文字表示される文字（☀★☆♪ などの記号は残す）。
+# 記号に異体字セレクタ U+FE0F が付いたもの（❤️ など）も絵文字として消す
+_EMOJI = (r'[\U0001F000-\U0001FAFF\u231A\u231B\u23E9-\u23EC\u23F0\u23F3\u25FD\u25FE'
+          r'\u2614\u2615\u2648-\u2653\u267F\u2693\u26A1\u26AA\u26AB\u26BD\u26BE\u26C4\u26C5\u26CE'
+          r'\u26D4\u26EA\u26F2\u26F3\u26F5\u26FA\u26FD\u2705\u270A\u270B\u2728\u274C\u274E'
+          r'\u2753-\u2755\u2757\u2795-\u2797\u27B0\u27BF\u2B1B\u2B1C\u2B50\u2B55\u200D\uFE0F]'
+          r'|[\u00A9\u00AE\u203C\u2049\u2122-\u2BFF\u3030\u303D\u3297\u3299](?=\uFE0F)')
+_TTS_RE = re.compile(
+    r'(?P<slang>(?<![' + _ALNUM + r'])(?i:' + '|'.join(sorted(TTS_SLANG, key=len, reverse=True)) + r')'
+    r'(?![' + _ALNUM + r']))'
+    r'|(?P<laugh>(?<![' + _ALNUM + r'])[wWｗＷ]{2,}(?![' + _ALNUM + r'.])'
+    r'|(?<=[^\x00-\x7F])(?<![' + _ALNUM + _KANJI + r'])[wWｗＷ](?![' + _ALNUM + _KANJI + r']))'
+    r'|(?P<emoji>(?:' + _EMOJI + r')+)'
+    r'|(?P<repeat>(?P<ch>[^\d\s])(?P=ch){' + str(TTS_REPEAT_KEEP) + r',})'
+)
+
+
+def _replace_tts(m: 're.Match') -> str:
+    kind = m.lastgroup
+    if kind == 'slang':
+        return TTS_SLANG[m.group().lower()]
+    if kind == 'laugh':
+        return TTS_LAUGH
+    if kind == 'emoji':
+        return ''
+    return m.group('ch') * TTS_REPEAT_KEEP
 
 
 if __name__ == '__main__':
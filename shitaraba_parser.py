@@ -0,0 +1,262 @@
+"""
+したらば掲示板のHTMLをストリーミングで解析するモジュール
+
+EUC-JP のバイト列をチャンク単位で受け取り、DOM 全体を構築せずに
+<dt>/<dd> の組（レス）やスレッド一覧の <a> をジェネレータで返します。
+レスは番号・名前・日時・ID・本文を持つ Post レコードとして返します。
+
+バックエンド（PARSER_BACKEND で切り替え）:
+ - 'stream': 手書きトークナイザ（依存なし、デフォルト）
+ - 'lxml': lxml の HTMLPullParser（lxml がインストールされている場合のみ）
+ - 'bs4': 従来の BeautifulSoup(html.parser)（比較用、全体を読み込む）
+
+関数:
+ - iter_posts(chunks, backend=None) -> Iterator[Post]
+ - iter_links(chunks, backend=None) -> Iterator[tuple[str, str]]
+ - parse_post_header(dt_text) -> tuple[int, str, str, str]
+ - lxml_available() -> bool
+"""
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional, Tuple
+import codecs
+import html
+import re
+
+
+PARSER_BACKEND = 'stream'
+ENCODING = 'EUC-JP'
+
+# lxml は 'lxml' バックエンドを使うときだけ読み込む（デフォルトの 'stream' では起動時間に含めない）
+_etree = None
+
+
+def _load_etree():
+    """lxml.etree（インストールされていなければ None）"""
+    global _etree
+    if _etree is None:
+        try:
+            from lxml import etree
+        except ImportError:
+            return None
+        _etree = etree
+    return _etree
+
+
+def lxml_available() -> bool:
+    return _load_etree() is not None
+
+
+_DT_RE = re.compile(r'<dt\b', re.IGNORECASE)
+_DD_RE = re.compile(r'<dd\b[^>]*>', re.IGNORECASE)
+_DD_END_RE = re.compile(r'</dd\s*>|<dt\b|</dl\s*>', re.IGNORECASE)
+_A_RE = re.compile(r'<a\s[^>]*?href=["\']?([^"\'\s>]+)[^>]*>(.*?)</a\s*>', re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r'<[^>]*>')
+_NUMBER_RE = re.compile(r'\d+')
+_TIMESTAMP_RE = re.compile(r'\d{4}/\d{2}/\d{2}\([^)]*\)\s*\d{2}:\d{2}(?::\d{2})?')
+_POSTER_ID_RE = re.compile(r'ID:\s*(\S+)')
+
+
+@dataclass(slots=True)
+class Post:
+    """
+    1件のレス
+
+    - number: レス番号
+    - body: 本文（extract_posts() 経由ではクリーン済み）
+    - name: 投稿者名
+    - timestamp: 投稿日時（掲示板の表記のまま 例: '2026/02/13(金) 04:23:40'）
+    - poster_id: ID（'ID:' 以降）
+    """
+    number: int
+    body: str
+    name: str = ''
+    timestamp: str = ''
+    poster_id: str = ''
+
+
+def parse_post_header(dt_text: str) -> Tuple[int, str, str, str]:
+    """
+    <dt> のテキストから (レス番号, 名前, 日時, ID) を取り出す
+
+    例: '1 ：名無しさん：2026/02/13(金) 04:23:40 ID:abcd' -> (1, '名無しさん', '2026/02/13(金) 04:23:40', 'abcd')
+    """
+    text = ' '.join(dt_text.split())
+    m = _NUMBER_RE.search(text)
+    number = int(m.group()) if m else 0
+
+    ts = _TIMESTAMP_RE.search(text)
+    timestamp = ts.group() if ts else ''
+    pid = _POSTER_ID_RE.search(text)
+    poster_id = pid.group(1) if pid else ''
+
+    # 名前はレス番号の後の '：' から日時の手前の '：' まで
+    head = text[:ts.start()] if ts else text
+    fields = head.split('：')
+    name = '：'.join(fields[1:-1] if ts else fields[1:]).strip()
+    return number, name, timestamp, poster_id
+
+
+def _decode_chunks(chunks: Iterable[bytes], encoding: str) -> Iterator[str]:
+    """バイト列のチャンクを逐次デコードする（マルチバイト文字の途中で切れても安全）"""
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    tail = decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+def _strip_tags(fragment: str) -> str:
+    """タグをスペースに置き換えて文字参照を戻す（get_text(separator=' ') 相当）"""
+    return html.unescape(_TAG_RE.sub(' ', fragment))
+
+
+def _make_post(dt_text: str, dd_text: str) -> Post:
+    number, name, timestamp, poster_id = parse_post_header(dt_text)
+    return Post(number=number, body=dd_text, name=name, timestamp=timestamp, poster_id=poster_id)
+
+
+def _iter_posts_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[Post]:
+    buf = ''
+    texts = _decode_chunks(chunks, encoding)
+    final = False
+    while not final:
+        text = next(texts, None)
+        if text is None:
+            final = True
+        else:
+            buf += text
+
+        pos = 0
+        while True:
+            dt = _DT_RE.search(buf, pos)
+            if not dt:
+                # タグの途中で切れている可能性があるので末尾だけ残す
+                pos = max(pos, len(buf) - 3)
+                break
+            dd = _DD_RE.search(buf, dt.end())
+            if not dd:
+                pos = dt.start()
+                break
+            next_dt = _DT_RE.search(buf, dt.end(), dd.start())
+            if next_dt:
+                # <dd> を持たない <dt> は読み飛ばす
+                pos = next_dt.start()
+                continue
+            end = _DD_END_RE.search(buf, dd.end())
+            if not end and not final:
+                pos = dt.start()
+                break
+            end_pos = end.start() if end else len(buf)
+            yield _make_post(_strip_tags(buf[dt.start():dd.start()]),
+                             _strip_tags(buf[dd.end():end_pos]))
+            pos = end_pos
+        buf = buf[pos:]
+
+
+def _iter_posts_lxml(chunks: Iterable[bytes], encoding: str) -> Iterator[Post]:
+    parser = _load_etree().HTMLPullParser(events=('end',), tag=('dt', 'dd'), encoding=encoding)
+    dt_text = ''
+
+    def drain():
+        nonlocal dt_text
+        for _, el in parser.read_events():
+            text = ' '.join(el.itertext())
+            if el.tag == 'dt':
+                dt_text = text
+            else:
+                yield _make_post(dt_text, text)
+                dt_text = ''
+            # 処理済みの要素は捨ててメモリを一定に保つ
+            el.clear()
+            parent = el.getparent()
+            if parent is not None:
+                while el.getprevious() is not None:
+                    del parent[0]
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+
+def _iter_posts_bs4(chunks: Iterable[bytes], encoding: str) -> Iterator[Post]:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(b''.join(chunks).decode(encoding, errors='replace'), 'html.parser')
+    for dd in soup.find_all('dd'):
+        dt = dd.find_previous_sibling('dt')
+        yield _make_post(dt.get_text(separator=' ') if dt else '', dd.get_text(separator=' '))
+
+
+def _iter_links_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[Tuple[str, str]]:
+    buf = ''
+    for text in _decode_chunks(chunks, encoding):
+        buf += text
+        pos = 0
+        for m in _A_RE.finditer(buf):
+            yield html.unescape(m.group(1)), _strip_tags(m.group(2))
+            pos = m.end()
+        # 閉じていない <a> は次のチャンクまで持ち越す
+        open_a = buf.lower().rfind('<a', pos)
+        buf = buf[open_a:] if open_a >= 0 else buf[max(pos, len(buf) - 2):]
+
+
+def _iter_links_lxml(chunks: Iterable[bytes], encoding: str) -> Iterator[Tuple[str, str]]:
+    parser = _load_etree().HTMLPullParser(events=('end',), tag='a', encoding=encoding)
+
+    def drain():
+        for _, el in parser.read_events():
+            href = el.get('href')
+            if href:
+                yield href, ''.join(el.itertext())
+            el.clear()
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+
+def _iter_links_bs4(chunks: Iterable[bytes], encoding: str) -> Iterator[Tuple[str, str]]:
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(b''.join(chunks).decode(encoding, errors='replace'), 'html.parser')
+    for a in soup.find_all('a', href=True):
+        yield a['href'], a.get_text() or ''
+
+
+_POST_BACKENDS = {'stream': _iter_posts_stream, 'lxml': _iter_posts_lxml, 'bs4': _iter_posts_bs4}
+_LINK_BACKENDS = {'stream': _iter_links_stream, 'lxml': _iter_links_lxml, 'bs4': _iter_links_bs4}
+
+
+def _resolve_backend(backend: Optional[str]) -> str:
+    name = backend or PARSER_BACKEND
+    if name == 'lxml' and not lxml_available():
+        print("警告: lxml がインストールされていないため 'stream' パーサを使用します")
+        return 'stream'
+    if name not in _POST_BACKENDS:
+        raise ValueError(f"未知のパーサバックエンド: {name}")
+    return name
+
+
+def iter_posts(chunks: Iterable[bytes], backend: Optional[str] = None,
+               encoding: str = ENCODING) -> Iterator[Post]:
+    """
+    スレッドHTMLのバイト列チャンクから <dt>/<dd> の組を順に返す
+
+    戻り値（ジェネレータ）: Post（body は未クリーンの本文テキスト）
+    """
+    return _POST_BACKENDS[_resolve_backend(backend)](chunks, encoding)
+
+
+def iter_links(chunks: Iterable[bytes], backend: Optional[str] = None,
+               encoding: str = ENCODING) -> Iterator[Tuple[str, str]]:
+    """
+    HTMLのバイト列チャンクから <a href> を順に返す
+
+    戻り値（ジェネレータ）: (href, リンクテキスト)
+    """
+    return _LINK_BACKENDS[_resolve_backend(backend)](chunks, encoding)
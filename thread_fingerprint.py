@@ -0,0 +1,101 @@
+"""
+スレッドの指紋（前回送信した時点のスレッドの状態）
+
+スレッドIDごとに、送信を終えた時点の
+ - post_count: スレッド一覧（subject.txt）のレス数
+ - last_number: 送信した最後のレス番号
+ - text_sha256: >>1〜>>last_number のクリーン済み本文のハッシュ
+を state/fingerprints.json に保存します。
+
+main.process_thread はこれを使って
+ - スレッド一覧のレス数が前回と同じなら、レスを取得せずに終える（SKIP_UNCHANGED=0 で無効）
+ - 前回までのレスが変わっていなければ、新着レスだけの「差分」MP3 を作って送る（DELTA_MP3=0 で全レス）
+ようにします。レスの削除・書き換えで前回までの本文が変わった場合は全レスを送り直します。
+"""
+import json
+import os
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional, Sequence
+
+from post_buffer import PostBuffer
+from run_manifest import text_sha256
+from shitaraba_parser import Post
+
+
+FINGERPRINT_FILE = os.path.join('state', 'fingerprints.json')
+SKIP_UNCHANGED = os.getenv('SKIP_UNCHANGED', '1') != '0'
+DELTA_MP3 = os.getenv('DELTA_MP3', '1') != '0'
+
+# 複数のワーカー（watcher.py）から読み書きするためのロック
+_lock = threading.Lock()
+
+
+@dataclass
+class Fingerprint:
+    """前回送信した時点のスレッドの状態"""
+    thread_id: str
+    post_count: Optional[int]
+    last_number: int
+    text_sha256: str
+    updated_at: str = ''
+
+    def is_unchanged(self, post_count: Optional[int]) -> bool:
+        """スレッド一覧のレス数が前回と同じか（レス数が分からない場合は False）"""
+        return post_count is not None and post_count == self.post_count
+
+    def new_posts(self, posts: PostBuffer) -> Optional[PostBuffer]:
+        """
+        前回送信したレスが変わっていなければ、それより後のレス（新着なしは空）を返す
+
+        前回までのレスが削除・書き換えされていれば None（全レスを送り直す）
+        """
+        sent = posts.between(0, self.last_number)
+        if not sent or text_sha256(p.body for p in sent) != self.text_sha256:
+            return None
+        return posts[len(sent):]
+
+
+def _load_all() -> Dict[str, dict]:
+    try:
+        with open(FINGERPRINT_FILE, encoding='utf-8') as fp:
+            return json.load(fp)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"警告: スレッドの指紋を読み込めません（全レスを処理します）: {e}")
+        return {}
+
+
+def load(thread_id: str) -> Optional[Fingerprint]:
+    """保存済みの指紋（なければ None）"""
+    with _lock:
+        data = _load_all().get(thread_id)
+    if not data:
+        return None
+    try:
+        return Fingerprint(**data)
+    except TypeError:
+        return None
+
+
+def save(thread_id: str, post_count: Optional[int], posts: Sequence[Post]) -> Fingerprint:
+    """posts（スレッドの全レス）を送信し終えた状態を保存する"""
+    fingerprint = Fingerprint(
+        thread_id=thread_id,
+        post_count=post_count,
+        last_number=posts[-1].number if posts else 0,
+        text_sha256=text_sha256(p.body for p in posts),
+        updated_at=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    )
+    with _lock:
+        # 他のスレッドの指紋を消さないよう読み直してから保存する
+        fingerprints = _load_all()
+        fingerprints[thread_id] = asdict(fingerprint)
+        os.makedirs(os.path.dirname(FINGERPRINT_FILE), exist_ok=True)
+        tmp = FINGERPRINT_FILE + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fp:
+            json.dump(fingerprints, fp, ensure_ascii=False, indent=2)
+        os.replace(tmp, FINGERPRINT_FILE)
+    return fingerprint
@@ -0,0 +1,173 @@
+"""
+共有HTTPトランスポート
+
+スクレイピング・gTTS・Discord の全リクエストで、ホストごとの keep-alive セッション
+（コネクションプール）と、プロセスで1つだけ作る SSLContext を使い回します。
+接続のたびに TCP/TLS ハンドシェイクや証明書の読み込み
+（requests と同じ certifi の CA バンドル）をやり直さないための仕組みです。
+
+関数:
+ - get(url, **kwargs) / post(url, **kwargs): requests.get / requests.post と同じ引数
+ - send(prepared, **kwargs): 準備済みリクエスト（gTTS が作るもの）を送信
+ - connection_stats() -> dict: ホストごとのリクエスト数・新規接続数・再利用数
+
+全リクエストを metrics の http_request スパン（ホスト・メソッド別）で計測し、
+ステータス別のリクエスト数と送受信バイト数を数えます。
+"""
+import os
+import ssl
+import threading
+from typing import Dict, Union
+from urllib.parse import urlsplit
+
+import requests
+import requests.certs
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+
+POOL_CONNECTIONS = 4   # セッションごとに保持するホスト別プール数
+POOL_MAXSIZE = 8       # 1ホストあたりの同時接続数（TTS の並列数以上にする）
+USER_AGENT = 'shitaraba-line-bot'
+
+_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_ssl_contexts: Dict[Union[bool, str], ssl.SSLContext] = {}
+
+
+def get_ssl_context(verify: Union[bool, str] = True) -> ssl.SSLContext:
+    """
+    プロセス全体で共有する SSLContext（証明書の読み込みは最初の1回だけ）
+
+    verify は requests と同じ: True なら requests と同じ certifi の CA バンドル、
+    CA バンドルのファイル・ディレクトリのパスならそれを使い、False なら検証しない。
+    """
+    with _lock:
+        context = _ssl_contexts.get(verify)
+        if context is None:
+            if verify is False:
+                context = ssl.create_default_context()
+                context.check_hostname = False
+                context.verify_mode = ssl.CERT_NONE
+            elif isinstance(verify, str) and os.path.isdir(verify):
+                context = ssl.create_default_context(capath=verify)
+            else:
+                cafile = verify if isinstance(verify, str) else requests.certs.where()
+                context = ssl.create_default_context(cafile=cafile)
+            _ssl_contexts[verify] = context
+        return context
+
+
+class _SharedContextAdapter(HTTPAdapter):
+    """共有 SSLContext を使い、接続ごとに CA 証明書を読み直さないアダプタ"""
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify, cert)
+        pool_kwargs['ssl_context'] = get_ssl_context(verify if isinstance(verify, str) else verify is not False)
+        pool_kwargs.pop('ca_certs', None)
+        pool_kwargs.pop('ca_cert_dir', None)
+        return host_params, pool_kwargs
+
+    def cert_verify(self, conn, url, verify, cert):
+        # 証明書は共有 SSLContext に読み込み済み
+        conn.cert_reqs = 'CERT_REQUIRED' if verify is not False else 'CERT_NONE'
+        conn.ca_certs = None
+        conn.ca_cert_dir = None
+
+
+def get_session(url: str) -> requests.Session:
+    """URL のホストに対応する keep-alive セッションを返す（なければ作る）"""
+    host = urlsplit(url).netloc
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            session.headers['User-Agent'] = USER_AGENT
+            adapter = _SharedContextAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _sessions[host] = session
+        return session
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    host = urlsplit(url).netloc
+    with metrics.span('http_request', host=host, method=method):
+        resp = get_session(url).request(method, url, **kwargs)
+    _record_response(host, resp, kwargs.get('stream', False))
+    return resp
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request('POST', url, **kwargs)
+
+
+def send(prepared: requests.PreparedRequest, **kwargs) -> requests.Response:
+    """準備済みリクエストを送信する（gTTS の内部リクエスト用）"""
+    host = urlsplit(prepared.url).netloc
+    with metrics.span('http_request', host=host, method=prepared.method):
+        resp = get_session(prepared.url).send(prepared, **kwargs)
+    _record_response(host, resp, kwargs.get('stream', False))
+    return resp
+
+
+def _record_response(host: str, resp: requests.Response, stream: bool) -> None:
+    """ステータス別のリクエスト数と送受信バイト数を数える"""
+    metrics.count('http_requests', host=host, status=resp.status_code)
+    body = resp.request.body
+    if body is not None and hasattr(body, '__len__'):
+        metrics.count('http_bytes_sent', len(body), host=host)
+    # 受信量は圧縮後の Content-Length。なければ（ストリームでない場合だけ）読み込んだ本文の長さ
+    length = resp.headers.get('Content-Length')
+    if length and length.isdigit():
+        metrics.count('http_bytes_received', int(length), host=host)
+    elif not stream:
+        metrics.count('http_bytes_received', len(resp.content), host=host)
+
+
+def connection_stats() -> Dict[str, Dict[str, int]]:
+    """
+    ホストごとの接続再利用状況
+
+    戻り値: {'jbbs.shitaraba.net': {'requests': 12, 'connections': 1, 'reused': 11}, ...}
+    """
+    stats: Dict[str, Dict[str, int]] = {}
+    with _lock:
+        sessions = list(_sessions.values())
+    for session in sessions:
+        for adapter in {id(a): a for a in session.adapters.values()}.values():
+            poolmanager = getattr(adapter, 'poolmanager', None)
+            if poolmanager is None:
+                continue
+            for key in list(poolmanager.pools.keys()):
+                pool = poolmanager.pools.get(key)
+                if pool is None:
+                    continue
+                entry = stats.setdefault(pool.host, {'requests': 0, 'connections': 0, 'reused': 0})
+                entry['requests'] += pool.num_requests
+                entry['connections'] += pool.num_connections
+                entry['reused'] += max(0, pool.num_requests - pool.num_connections)
+    return stats
+
+
+def print_connection_stats() -> None:
+    stats = connection_stats()
+    if not stats:
+        return
+    print("\n接続の再利用状況:")
+    for host, entry in sorted(stats.items()):
+        print(f"  {host}: リクエスト {entry['requests']} / 新規接続 {entry['connections']} / 再利用 {entry['reused']}")
+
+
+def close_all() -> None:
+    """全セッションを閉じる"""
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
@@ -0,0 +1,368 @@
+"""
+音声合成（TTS）バックエンド
+
+mp3_converter のパイプラインは TTSBackend のインターフェースだけを使うので、
+設定（mp3_converter.TTS_BACKEND）でバックエンドを切り替えられます。
+
+バックエンド:
+ - 'gtts': Google Text-to-Speech（ネットワーク必須、トークンバケットでレート制御）
+ - 'local': Open JTalk / espeak-ng をサブプロセスで実行するオフラインエンジン
+            （全 CPU コアでバッチ合成、MP3 へのエンコードに ffmpeg か lame を使用）
+ - 'stub': テキスト長に比例した無音の MP3 を返す（テスト・ベンチマーク用、決定的）
+
+どのバックエンドも gTTS と同じ形式（MPEG2 レイヤ3 / 24kHz / モノラル / 32kbps）の
+MP3 フレームを返すので、パートファイル内で混在しても連結できます。
+"""
+import base64
+import os
+import random
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+
+import metrics
+import requests
+import transport
+from mp3_frames import silent_frames
+from tts_cache import cache_key
+
+# gTTS（言語一覧・トークナイザなど）は読み込みに時間がかかるので、GTTSBackend を初めて使うときに読み込む
+gTTS = gTTSError = None
+_gtts_lock = threading.Lock()
+
+
+def _load_gtts() -> bool:
+    """
+    gTTS を読み込む（2回目以降は何もしない）。インストールされていなければ False
+
+    gTTS は証明書を検証せずにリクエストを送るので、そのときの警告もここで止める。
+    """
+    global gTTS, gTTSError
+    with _gtts_lock:
+        if gTTS is not None:
+            return True
+        try:
+            from gtts import gTTS as gtts_class, gTTSError as gtts_error
+        except ImportError:
+            return False
+        _disable_ssl_verification()
+        gTTS, gTTSError = gtts_class, gtts_error
+        return True
+
+
+def _disable_ssl_verification() -> None:
+    """SSL 警告を抑制し、urllib の証明書検証をスキップする（ローカルシステムの SSL 証明書問題対策）"""
+    import ssl
+    import warnings
+    import urllib3
+    from urllib3.exceptions import InsecureRequestWarning
+
+    warnings.filterwarnings("ignore", message="Unverified HTTPS request is being made")
+    warnings.simplefilter('ignore', InsecureRequestWarning)
+    urllib3.disable_warnings(InsecureRequestWarning)
+    if hasattr(ssl, '_create_unverified_context'):
+        ssl._create_default_https_context = ssl._create_unverified_context
+
+
+# gTTS のレスポンスから音声（base64）を取り出す
+_GTTS_AUDIO_RE = re.compile(r'jQ1olc","\[\\"(.*)\\"]')
+
+
+class TokenBucket:
+    """
+    全ワーカーで共有するトークンバケット（スレッドセーフ）
+
+    - acquire(): 1リクエスト分のトークンを取得（足りなければ待つ）
+    - release(): 使わなかったトークンを返す
+    - on_rate_limited(): 429 を受けたらレートを半分にし、全ワーカーを一定時間止める
+    - on_success(): 成功が続けばレートを少しずつ元に戻す
+    """
+
+    def __init__(self, rate: float = 3.0, burst: int = 5, min_rate: float = 0.5,
+                 retry_delay: float = 3, max_retry_delay: float = 60):
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.rate = rate
+        self.burst = burst
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # 先に予約してから待つので、複数ワーカーが同時に待っても順番に流れる
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate, self._blocked_until - now, 0.0)
+        if wait > 0:
+            metrics.count('rate_limit_wait_seconds', wait, service='gtts')
+            time.sleep(wait)
+
+    def release(self) -> None:
+        """取得したが使わなかったトークンを返す"""
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+    def on_rate_limited(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """レートを下げて待機時間を決める（戻り値: 待機秒数）"""
+        delay = retry_after if retry_after else min(self.max_retry_delay, self.retry_delay * (2 ** attempt))
+        delay += random.uniform(0, delay / 4)
+        metrics.count('rate_limited', service='gtts')
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        return delay
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+
+
+class TTSBackend(ABC):
+    """
+    音声合成バックエンドの共通インターフェース
+
+    - synthesize(text): 1セグメントを MP3 のバイト列に変換（失敗時は None）
+    - synthesize_batch(texts): 複数セグメントをまとめて変換（順番はそのまま）
+    - batch_size: パイプラインが synthesize_batch にまとめて渡すセグメント数
+    - cache_key(text): 音声キャッシュのキー（声・言語などの設定を含める）
+
+    cache_key と synthesize を実装していないバックエンドはインスタンス化の時点で TypeError になる。
+    """
+    name = ''
+    batch_size = 1
+
+    def available(self) -> bool:
+        return True
+
+    @abstractmethod
+    def cache_key(self, text: str) -> str:
+        ...
+
+    @abstractmethod
+    def synthesize(self, text: str) -> Optional[bytes]:
+        ...
+
+    def synthesize_batch(self, texts: List[str]) -> List[Optional[bytes]]:
+        return [self.synthesize(text) for text in texts]
+
+
+class GTTSBackend(TTSBackend):
+    """gTTS（Google Text-to-Speech）バックエンド"""
+    name = 'gtts'
+
+    def __init__(self, lang: str = 'ja', tld: str = 'co.jp', slow: bool = False, timeout: float = 8,
+                 limiter: Optional[TokenBucket] = None, max_retries: int = 5, retry_delay: float = 3):
+        self.lang = lang
+        self.tld = tld
+        self.slow = slow
+        self.timeout = timeout
+        self.limiter = limiter or TokenBucket()
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def available(self) -> bool:
+        if not _load_gtts():
+            print("エラー: gTTS がインストールされていません")
+            print("  pip install gTTS でインストールしてください")
+            return False
+        return True
+
+    def cache_key(self, text: str) -> str:
+        return cache_key(text, self.lang, self.tld, self.slow)
+
+    def synthesize(self, text: str, retry_count: int = 0) -> Optional[bytes]:
+        """1セグメントを gTTS で音声に変換する（リトライ対応）"""
+        limiter = self.limiter
+        _load_gtts()
+        try:
+            # slow=False で通常速度（最速）、tld='co.jp' で日本語ボイスを優先
+            tts = gTTS(text=text, lang=self.lang, slow=self.slow, tld=self.tld, timeout=self.timeout)
+            # 約100文字ごとのリクエストを1つずつ送るので、送る直前にその都度トークンを取る
+            audio = bytearray()
+            for data in _gtts_stream(tts, limiter):
+                audio += data
+                limiter.on_success()
+            return bytes(audio)
+
+        except (KeyboardInterrupt, TimeoutError) as e:
+            # SSL 証明書読み込みのハングやタイムアウトの場合はリトライ
+            if retry_count < self.max_retries:
+                metrics.count('tts_retries', backend=self.name, reason='timeout')
+                print(f"⚠️  SSL 証明書エラー検出。{self.retry_delay}秒後にリトライ... "
+                      f"({retry_count + 1}/{self.max_retries})")
+                time.sleep(self.retry_delay)
+                return self.synthesize(text, retry_count + 1)
+            print(f"エラー: GTTSBackend.synthesize(): {type(e).__name__}: SSL 証明書エラーが解決できません")
+            return None
+
+        except Exception as e:
+            error_msg = str(e)
+            # 429 エラー（レート制限）の場合は全ワーカーの速度を落としてリトライ
+            if "429" in error_msg and retry_count < self.max_retries:
+                metrics.count('tts_retries', backend=self.name, reason='429')
+                delay = limiter.on_rate_limited(retry_count, _retry_after(e))
+                print(f"⚠️  レート制限検出。{delay:.1f}秒後に リトライ... ({retry_count + 1}/{self.max_retries}, "
+                      f"レート {limiter.rate:.1f} req/s)")
+                return self.synthesize(text, retry_count + 1)
+
+            print(f"エラー: GTTSBackend.synthesize(): {e}")
+            return None
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """gTTSError のレスポンスに Retry-After があれば秒数を返す"""
+    rsp = getattr(error, 'rsp', None)
+    try:
+        return float(rsp.headers.get('Retry-After')) if rsp is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _gtts_stream(tts, limiter: TokenBucket) -> Iterator[bytes]:
+    """
+    gTTS.stream() と同じ音声を返すが、リクエストは共有トランスポート（keep-alive）で送る
+
+    gTTS 本体はリクエストごとに新しいセッションを作るため、準備済みリクエストだけ借りる。
+    トークンはリクエストを送る直前に1つずつ取る。
+    """
+    prepare = getattr(tts, '_prepare_requests', None)
+    if prepare is None:
+        # リクエストを送るかどうかは next() を呼ぶまで分からないので、最後の空振りの分は返す
+        stream = tts.stream()
+        while True:
+            limiter.acquire()
+            try:
+                data = next(stream)
+            except StopIteration:
+                limiter.release()
+                return
+            yield data
+    for pr in prepare():
+        limiter.acquire()
+        try:
+            # gTTS 本体と同じく証明書検証はしない
+            r = transport.send(pr, verify=False, timeout=tts.timeout)
+            r.raise_for_status()
+        except requests.exceptions.HTTPError:
+            raise gTTSError(tts=tts, response=r)
+        except requests.exceptions.RequestException:
+            raise gTTSError(tts=tts)
+
+        for line in r.iter_lines(chunk_size=1024):
+            decoded_line = line.decode('utf-8')
+            if 'jQ1olc' in decoded_line:
+                audio_search = _GTTS_AUDIO_RE.search(decoded_line)
+                if not audio_search:
+                    raise gTTSError(tts=tts, response=r)
+                yield base64.b64decode(audio_search.group(1).encode('ascii'))
+
+
+class LocalBackend(TTSBackend):
+    """
+    オフライン TTS バックエンド（Open JTalk または espeak-ng）
+
+    1セグメントごとに「合成エンジン → WAV → ffmpeg/lame で MP3」のサブプロセスを起動し、
+    synthesize_batch() では CPU コア数のワーカーで並列に実行する。
+
+    Open JTalk を使う場合は辞書と音響モデルのパスを環境変数で指定する:
+      OPEN_JTALK_DIC=/var/lib/mecab/dic/open-jtalk/naist-jdic
+      OPEN_JTALK_VOICE=/usr/share/hts-voice/nitech-jp-atr503-m001/nitech_jp_atr503_m001.htsvoice
+    """
+    name = 'local'
+
+    def __init__(self, engine: str = 'auto', lang: str = 'ja', workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = self.workers * 2
+        self.lang = lang
+        self.dic = os.getenv('OPEN_JTALK_DIC', '')
+        self.voice = os.getenv('OPEN_JTALK_VOICE', '')
+        if engine == 'auto':
+            engine = 'open_jtalk' if shutil.which('open_jtalk') and self.dic and self.voice else 'espeak-ng'
+        self.engine = engine
+        self.encoder = 'ffmpeg' if shutil.which('ffmpeg') else 'lame'
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def available(self) -> bool:
+        missing = [cmd for cmd in (self.engine, self.encoder) if not shutil.which(cmd)]
+        if missing:
+            print(f"エラー: ローカル TTS に必要なコマンドが見つかりません: {', '.join(missing)}")
+            return False
+        return True
+
+    def cache_key(self, text: str) -> str:
+        voice = os.path.basename(self.voice) if self.engine == 'open_jtalk' else self.lang
+        return cache_key(text, self.lang, '', False, backend=f"{self.engine}:{voice}")
+
+    def _synthesize_wav(self, text: str, wav_path: str) -> None:
+        if self.engine == 'open_jtalk':
+            cmd = ['open_jtalk', '-x', self.dic, '-m', self.voice, '-ow', wav_path]
+        else:
+            cmd = ['espeak-ng', '-v', self.lang, '-w', wav_path, '--stdin']
+        subprocess.run(cmd, input=text.encode('utf-8'), check=True, capture_output=True, timeout=120)
+
+    def _encode_mp3(self, wav_path: str) -> bytes:
+        # gTTS と同じ形式にそろえる（MPEG2 レイヤ3 / 24kHz / モノラル / 32kbps）
+        if self.encoder == 'ffmpeg':
+            cmd = ['ffmpeg', '-loglevel', 'error', '-i', wav_path,
+                   '-ac', '1', '-ar', '24000', '-b:a', '32k', '-f', 'mp3', '-']
+        else:
+            cmd = ['lame', '--quiet', '-m', 'm', '--resample', '24', '-b', '32', wav_path, '-']
+        return subprocess.run(cmd, check=True, capture_output=True, timeout=120).stdout
+
+    def synthesize(self, text: str) -> Optional[bytes]:
+        fd, wav_path = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        try:
+            self._synthesize_wav(text, wav_path)
+            return self._encode_mp3(wav_path)
+        except (OSError, subprocess.SubprocessError) as e:
+            print(f"エラー: LocalBackend.synthesize(): {e}")
+            return None
+        finally:
+            try:
+                os.remove(wav_path)
+            except OSError:
+                pass
+
+    def synthesize_batch(self, texts: List[str]) -> List[Optional[bytes]]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers)
+        # サブプロセスは GIL の外で動くので、スレッドプールで全コアを使える
+        return list(self._executor.map(self.synthesize, texts))
+
+
+class StubBackend(TTSBackend):
+    """
+    テスト・ベンチマーク用のスタブ（ネットワーク・外部コマンド不要）
+
+    1文字あたり frames_per_char フレームの無音 MP3 を返す。同じテキストには常に同じ音声を返す。
+    """
+    name = 'stub'
+
+    def __init__(self, frames_per_char: int = 6, delay: float = 0.0):
+        self.frames_per_char = frames_per_char
+        self.delay = delay
+
+    def cache_key(self, text: str) -> str:
+        return cache_key(text, 'stub', '', False, backend=f"stub:{self.frames_per_char}")
+
+    def synthesize(self, text: str) -> Optional[bytes]:
+        if self.delay:
+            time.sleep(self.delay)
+        return silent_frames(max(1, len(text.strip()) * self.frames_per_char))
+
@@ -0,0 +1,125 @@
+"""
+合成済み音声のディスクキャッシュ
+
+(正規化したテキスト, lang, tld, slow) のハッシュをキーに MP3 セグメントを保存します。
+同じ文（テンプレ、コピペ、リトライ時の再変換）は2回目以降ネットワークに出ずに済みます。
+
+- キャッシュ容量が上限を超えたら、最後に使われた時刻（mtime）が古い順に削除（LRU）
+- 書き込みは一時ファイル→置き換えで行うので、途中で落ちても壊れたエントリは残らない
+"""
+import hashlib
+import os
+import threading
+import unicodedata
+from typing import Optional
+
+import metrics
+
+
+def normalize_text(text: str) -> str:
+    """キャッシュキー用にテキストを正規化する（NFKC + 空白の統一）"""
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+
+def cache_key(text: str, lang: str, tld: str, slow: bool, backend: str = 'gtts') -> str:
+    """
+    セグメントの内容アドレス（SHA-256）
+
+    gTTS 以外のバックエンドは backend（エンジン名や声）もキーに含めるので、
+    同じ文でもバックエンドごとに別のエントリになる。
+    """
+    fields = [normalize_text(text), lang, tld, '1' if slow else '0']
+    if backend != 'gtts':
+        # 既存の gTTS エントリのキーは変えない
+        fields.append(backend)
+    payload = '\x00'.join(fields)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    """
+    容量上限つきの LRU ディスクキャッシュ（スレッドセーフ）
+
+    - get(key): キャッシュ済みの音声を返す（なければ None）
+    - put(key, data): 音声を保存し、必要なら古いものから削除
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + '.mp3')
+
+    def _scan(self) -> list[tuple[float, int, str]]:
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.mp3'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _total_bytes(self) -> int:
+        if self._total is None:
+            self._total = sum(size for _, size, _ in self._scan())
+        return self._total
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as fp:
+                data = fp.read()
+            # 最終利用時刻を更新して LRU の順番を保つ
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            metrics.count('tts_cache_misses')
+            return None
+        with self._lock:
+            self.hits += 1
+        metrics.count('tts_cache_hits')
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if not data or len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"警告: 音声キャッシュの保存に失敗しました: {e}")
+            return
+        with self._lock:
+            self._total = self._total_bytes() + len(data)
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """上限の 90% まで古いものから削除する（ロック取得済みで呼ぶ）"""
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._total = total
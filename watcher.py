@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+複数の板・スレッドを監視する常駐スケジューラ
+
+設定した板のスレッド一覧を一定間隔で条件付きリクエスト（ETag / Last-Modified）で確認し、
+タイトルが条件に合い、前回の処理からレス数が増えたスレッドだけをワーカープールで処理します
+（レス取得 → MP3 変換 → Discord 送信。処理内容は main.process_thread と同じ）。
+同じスレッドを同時に2つのワーカーが処理することはありません。
+
+使い方:
+  python watcher.py                          # watcher.json（なければ既定の設定）で常駐
+  python watcher.py --config my.json         # 設定ファイルを指定
+  python watcher.py --once                   # 1回だけ巡回し、処理が終わったら終了
+
+設定ファイル（JSON）:
+{
+  "poll_interval": 60,          # スレッド一覧を確認する間隔（秒）
+  "workers": 4,                 # 同時に処理するスレッド数
+  "watches": [
+    {
+      "board": "netgame/16797",           # 板（カテゴリ/板番号）
+      "pattern": "VALORANT part(\\d+)",   # タイトルの正規表現（先頭から一致）
+      "min_posts": 300,                   # これ未満のレス数のスレッドは無視
+      "min_new_posts": 1,                 # 前回の処理からこれだけ増えたら処理する
+      "latest_only": true,                # 一致したスレッドのうち最新（part が最大）だけ
+      "slug": "valorant",                 # 出力ファイル名の先頭
+      "channel_id": "..."                 # 省略時は DISCORD_CHANNEL_ID
+    }
+  ]
+}
+
+処理済みのレス数は state/watcher.json に保存するので、再起動しても同じ処理は繰り返しません。
+
+処理に失敗したスレッドは、次の巡回ですぐには選ばず RETRY_BACKOFF 秒（失敗が続くたびに倍、
+最大 MAX_RETRY_BACKOFF 秒）待ってから再試行します。Discord への通知は NOTIFY_AFTER_FAILURES 回
+続けて失敗した時に1回だけ送ります（成功すれば数え直します）。--once では失敗の回数を次の実行に
+持ち越せないので、失敗するたびに通知します。
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import metrics
+import transport
+from main import process_thread
+from shitaraba_extractor import BOARD, VALORANT_TITLE_PATTERN, fetch_thread_list, filter_threads
+
+
+CONFIG_FILE = 'watcher.json'
+WATCH_STATE_FILE = os.path.join('state', 'watcher.json')
+DEFAULT_POLL_INTERVAL = 60
+DEFAULT_WORKERS = 4
+RETRY_BACKOFF = 300           # 失敗したスレッドを再試行するまでの秒数（失敗が続くたびに倍）
+MAX_RETRY_BACKOFF = 6 * 3600  # 再試行の間隔の上限（秒）
+NOTIFY_AFTER_FAILURES = 3     # この回数続けて失敗したら Discord に1回だけ通知する
+
+# 設定ファイルがない場合: 従来の main.py と同じく VALORANT スレッドの最新1つを監視
+DEFAULT_WATCHES = [
+    {'board': BOARD, 'pattern': VALORANT_TITLE_PATTERN, 'min_posts': 300, 'latest_only': True},
+]
+
+
+@dataclass
+class Watch:
+    """監視条件（設定ファイルの watches の1要素）"""
+    board: str
+    pattern: str
+    min_posts: int = 0
+    min_new_posts: int = 1
+    latest_only: bool = False
+    slug: str = ''
+    channel_id: str = ''
+
+
+@dataclass
+class Failure:
+    """続けて処理に失敗したスレッドの記録（成功すると消す）"""
+    count: int = 0
+    retry_at: float = 0.0  # time.monotonic() がこれを過ぎるまで選ばない
+
+
+def load_config(path: str) -> dict:
+    """設定ファイルを読み込む（なければ既定の設定）"""
+    config = {'poll_interval': DEFAULT_POLL_INTERVAL, 'workers': DEFAULT_WORKERS, 'watches': DEFAULT_WATCHES}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as fp:
+            config.update(json.load(fp))
+    config['watches'] = [Watch(**w) for w in config['watches']]
+    return config
+
+
+class Watcher:
+    """
+    板のスレッド一覧を巡回し、更新されたスレッドをワーカープールに渡す
+
+    - poll_once(): 全ての板を1回確認し、処理が必要なスレッドを投入する（投入数を返す）
+    - run(once=False): poll_interval ごとに poll_once() を繰り返す
+    """
+
+    def __init__(self, watches: List[Watch], token: str, channel_id: str,
+                 workers: int = DEFAULT_WORKERS, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 notify_after: int = NOTIFY_AFTER_FAILURES):
+        self.watches = watches
+        self.token = token
+        self.channel_id = channel_id
+        self.poll_interval = poll_interval
+        self.notify_after = notify_after
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='watch')
+        self._running: Dict[str, Future] = {}
+        self._processed = self._load_state()
+        self._failures: Dict[str, Failure] = {}
+        self._lock = threading.Lock()
+
+    def _load_state(self) -> Dict[str, int]:
+        try:
+            with open(WATCH_STATE_FILE, encoding='utf-8') as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self) -> None:
+        """ロック取得済みで呼ぶ"""
+        os.makedirs(os.path.dirname(WATCH_STATE_FILE), exist_ok=True)
+        tmp = WATCH_STATE_FILE + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as fp:
+            json.dump(self._processed, fp, ensure_ascii=False, indent=2)
+        os.replace(tmp, WATCH_STATE_FILE)
+
+    def _select(self, watch: Watch, threads: List[Dict]) -> List[Dict]:
+        """監視条件に合い、前回の処理からレス数が増えたスレッド（失敗して再試行を待っているものは除く）"""
+        found = filter_threads(threads, watch.pattern, watch.min_posts)
+        if watch.latest_only and found:
+            found = [max(found, key=lambda t: (t['part'] or 0, t['posts']))]
+        now = time.monotonic()
+        with self._lock:
+            return [t for t in found
+                    if t['posts'] - self._processed.get(t['url'], 0) >= watch.min_new_posts
+                    and self._failures.get(t['url'], Failure()).retry_at <= now]
+
+    def poll_once(self) -> int:
+        submitted = 0
+        boards: Dict[str, Optional[List[Dict]]] = {}
+        for watch in self.watches:
+            # 同じ板を監視する条件が複数あっても、一覧の取得は1回だけ
+            if watch.board not in boards:
+                boards[watch.board] = fetch_thread_list(watch.board)
+            threads = boards[watch.board]
+            if threads is None:
+                continue
+            for thread in self._select(watch, threads):
+                if self._submit(watch, thread):
+                    submitted += 1
+        return submitted
+
+    def _submit(self, watch: Watch, thread: Dict) -> bool:
+        with self._lock:
+            future = self._running.get(thread['url'])
+            if future is not None and not future.done():
+                return False
+            print(f"\n▶ 更新を検出: {thread['name']} ({watch.board})")
+            thread = dict(thread, slug=watch.slug, board=watch.board)
+            self._running[thread['url']] = self._executor.submit(
+                self._process, thread, watch.channel_id or self.channel_id)
+            return True
+
+    def _process(self, thread: Dict, channel_id: str) -> None:
+        try:
+            with metrics.span('thread', board=thread['board']):
+                # 失敗の通知は毎回ではなく、続けて失敗した時に _record_failure で送る
+                ok = process_thread(thread, self.token, channel_id, notify=False)
+        except Exception as e:
+            print(f"エラー: Watcher._process(): {thread['name']}: {e}")
+            ok = False
+        if ok:
+            with self._lock:
+                self._failures.pop(thread['url'], None)
+                self._processed[thread['url']] = thread['posts']
+                self._save_state()
+        else:
+            self._record_failure(thread, channel_id)
+
+    def _record_failure(self, thread: Dict, channel_id: str) -> None:
+        """失敗を数えて再試行を遅らせ、notify_after 回目の失敗だけ通知する"""
+        with self._lock:
+            failure = self._failures.setdefault(thread['url'], Failure())
+            failure.count += 1
+            backoff = min(MAX_RETRY_BACKOFF, RETRY_BACKOFF * 2 ** (failure.count - 1))
+            failure.retry_at = time.monotonic() + backoff
+            count = failure.count
+        metrics.count('threads_failed', board=thread['board'])
+        print(f"  {thread['name']}: {count}回続けて失敗しました（{backoff}秒後に再試行します）")
+        if count == self.notify_after:
+            from discord_sender import send_discord_message
+            send_discord_message(f"⚠️ {thread['name']} の処理に{count}回続けて失敗しました"
+                                 "（以降は通知せずに再試行を続けます）",
+                                 self.token, channel_id)
+
+    def wait(self) -> None:
+        """投入済みの処理が全て終わるまで待つ"""
+        with self._lock:
+            futures = list(self._running.values())
+        for future in futures:
+            future.result()
+
+    def run(self, once: bool = False) -> None:
+        try:
+            while True:
+                started = time.monotonic()
+                submitted = self.poll_once()
+                if once:
+                    self.wait()
+                    return
+                if submitted:
+                    print(f"  {submitted} スレッドを処理キューに追加しました")
+                # 計測結果は起動からの累計（textfile collector 用に巡回のたびに書き直す）
+                metrics.export()
+                time.sleep(max(0.0, self.poll_interval - (time.monotonic() - started)))
+        except KeyboardInterrupt:
+            print("\n停止します（処理中のスレッドが終わるまで待ちます）...")
+        finally:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            transport.print_connection_stats()
+            metrics.print_summary()
+            for path in metrics.export():
+                print(f"📊 計測レポート: {path}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--config', default=CONFIG_FILE, help='設定ファイル（JSON）')
+    parser.add_argument('--once', action='store_true', help='1回だけ巡回して終了する')
+    args = parser.parse_args()
+
+    token = os.getenv('DISCORD_BOT_TOKEN')
+    channel_id = os.getenv('DISCORD_CHANNEL_ID', '')
+    if not token:
+        print("✗ エラー: DISCORD_BOT_TOKEN が設定されていません")
+        return 1
+
+    config = load_config(args.config)
+    watches = config['watches']
+    if not channel_id and any(not w.channel_id for w in watches):
+        print("✗ エラー: DISCORD_CHANNEL_ID が設定されていません（channel_id のない監視条件があります）")
+        return 1
+
+    print(f"{len(watches)} 件の監視条件、{config['workers']} 並列、{config['poll_interval']}秒間隔で監視します")
+    # --once（cron など）は失敗の回数が実行ごとに数え直しになるので、失敗したらその場で通知する
+    notify_after = 1 if args.once else NOTIFY_AFTER_FAILURES
+    Watcher(watches, token, channel_id, config['workers'], config['poll_interval'],
+            notify_after).run(once=args.once)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())